@@ -0,0 +1,30 @@
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+DRIVE_IO_WORKERS = int(os.getenv('DRIVE_IO_WORKERS', '8'))
+MODEL_WORKERS = int(os.getenv('MODEL_WORKERS', '2'))
+INGEST_WORKERS = int(os.getenv('INGEST_WORKERS', '2'))
+
+# separate pools so a slow upstream only queues work of its own kind
+drive_executor = ThreadPoolExecutor(max_workers=DRIVE_IO_WORKERS, thread_name_prefix='drive-io')
+model_executor = ThreadPoolExecutor(max_workers=MODEL_WORKERS, thread_name_prefix='model')
+ingest_executor = ThreadPoolExecutor(max_workers=INGEST_WORKERS, thread_name_prefix='ingest')
+
+async def run_in(executor, fn, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, functools.partial(fn, *args, **kwargs))
+
+async def run_drive(fn, *args, **kwargs):
+    return await run_in(drive_executor, fn, *args, **kwargs)
+
+async def run_model(fn, *args, **kwargs):
+    return await run_in(model_executor, fn, *args, **kwargs)
+
+async def run_ingest(fn, *args, **kwargs):
+    return await run_in(ingest_executor, fn, *args, **kwargs)
+
+def shutdown_executors():
+    for executor in (drive_executor, model_executor, ingest_executor):
+        executor.shutdown(wait=False, cancel_futures=True)
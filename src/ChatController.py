@@ -5,7 +5,11 @@ from langchain_core.prompts import ChatPromptTemplate,MessagesPlaceholder
 from dotenv import load_dotenv
 load_dotenv()
 from PersistentMem import PersistentMem
-from langchain_core.messages import HumanMessage,BaseMessage
+from langchain_core.messages import HumanMessage,BaseMessage,AIMessage,RemoveMessage
+import os
+from langchain_core.runnables import RunnableLambda
+from LLMResponseCache import LLMResponseCache, CachedChatModel
+from StartupOrchestrator import LazyResource
 # drive = DriveAPI()
 
 # def make_drive_tool():
@@ -14,8 +18,32 @@ from langchain_core.messages import HumanMessage,BaseMessage
 #     return documents
 
 
+CHAT_HISTORY_MAX_TURNS = int(os.getenv('CHAT_HISTORY_MAX_TURNS', '10'))
+CHAT_HISTORY_MAX_TOKENS = int(os.getenv('CHAT_HISTORY_MAX_TOKENS', '3000'))
+CHAT_HISTORY_SUMMARIZE = os.getenv('CHAT_HISTORY_SUMMARIZE', 'true').lower() == 'true'
+# a trim goes down to this many turns, so one summary call covers several turns instead of one
+CHAT_HISTORY_KEEP_TURNS = int(os.getenv('CHAT_HISTORY_KEEP_TURNS', str(max(1, CHAT_HISTORY_MAX_TURNS // 2))))
+
+def approx_tokens(message):
+    return len(str(message.content)) // 4 + 4
+
+def window_start(history, max_turns, max_tokens):
+    # index of the first message that fits in the last max_turns turns and max_tokens tokens
+    keep_from = max(0, len(history) - max_turns * 2)
+    budget = max_tokens
+    for i in range(len(history) - 1, keep_from - 1, -1):
+        budget -= approx_tokens(history[i])
+        if budget < 0:
+            keep_from = i + 1
+            break
+    # never start the kept window on an assistant reply
+    while keep_from < len(history) and not isinstance(history[keep_from], HumanMessage):
+        keep_from += 1
+    return keep_from
+
 class ChatState(TypedDict):
     messages: Annotated[List[BaseMessage], add_messages]
+    summary: Optional[str]
     # pdf_query_bool : Optional[bool]
     # pdf_query: Annotated[List[BaseMessage], add_messages]
 # class PdfSession:
@@ -38,18 +66,23 @@ class ChatState(TypedDict):
 #         ])
 
 #         prompt = template.invoke({'messages':message.content,'documents':documents})
-#         result = self.chat_model.invoke(prompt)
+#         result = self.response_model.invoke(prompt)
         
 #         state['pdf_query'].append(AIMessage(content=result.content))
         
 
 class Chat_HuggingFaceController:
-    def __init__(self,model,DB_URI):
-        llm = HuggingFaceEndpoint(model=model)
-        self.chat_model = ChatHuggingFace(llm=llm)
+    def __init__(self,model,DB_URI,llm_cache=None,connect=True):
+        self.chat_model = LazyResource('chat_llm', lambda: ChatHuggingFace(llm=HuggingFaceEndpoint(model=model)))
+        self.llm_cache = llm_cache or LLMResponseCache()
+        self.response_model = CachedChatModel(self.chat_model, self.llm_cache, 'chat')
         self.DB_URI = DB_URI
+        self.perstMem = None
+        self.workflow = None
         self.workflow_log()
-    def give_response(self,state:ChatState):
+        if connect:
+            self.connect()
+    def build_prompt(self,state:ChatState):
         message = state['messages'][-1]
         template = ChatPromptTemplate.from_messages([
             ("system", "You are a bot i created you,"
@@ -57,9 +90,58 @@ class Chat_HuggingFaceController:
             "Secondly at the end with some new line space write 'For help write /help' so user can get that this is bot"),
            MessagesPlaceholder(variable_name="chat_history"),    ('human',"{messages}")
         ])
+        chat_history = state['messages'][:-1]
+        if state.get('summary'):
+            chat_history = [HumanMessage(content=f"Summary of our earlier conversation: {state['summary']}"),
+                            AIMessage(content="Noted.")] + chat_history
      
-        prompt = template.invoke({'messages':message.content, 'chat_history':state['messages'][:-1]})
-        result = self.chat_model.invoke(prompt)
+        return template.invoke({'messages':message.content, 'chat_history':chat_history})
+
+    def history_overflow(self,state:ChatState):
+        history = state['messages'][:-1]
+        if not window_start(history, CHAT_HISTORY_MAX_TURNS, CHAT_HISTORY_MAX_TOKENS):
+            return []
+        # past the window: drop down to the low watermark, not just back under the limit
+        return history[:window_start(history, CHAT_HISTORY_KEEP_TURNS, CHAT_HISTORY_MAX_TOKENS // 2)]
+
+    def route_history(self,state:ChatState):
+        return 'trim_history' if self.history_overflow(state) else 'give_response'
+
+    def build_summary_prompt(self,state:ChatState,dropped):
+        template = ChatPromptTemplate.from_messages([
+            ("system", "Fold the conversation below into the existing summary. "
+            "Keep names, facts, decisions and open questions. Reply with the updated summary only, at most 200 words.\n"
+            "Existing summary: {summary}"),
+            MessagesPlaceholder(variable_name="chat_history")
+        ])
+        return template.invoke({'summary': state.get('summary') or 'none', 'chat_history': dropped})
+
+    def trim_history(self,state:ChatState):
+        dropped = self.history_overflow(state)
+        update = {'messages': [RemoveMessage(id=m.id) for m in dropped]}
+        if CHAT_HISTORY_SUMMARIZE and dropped:
+            update['summary'] = self.chat_model.invoke(self.build_summary_prompt(state, dropped)).content
+        return update
+
+    async def atrim_history(self,state:ChatState):
+        dropped = self.history_overflow(state)
+        update = {'messages': [RemoveMessage(id=m.id) for m in dropped]}
+        if CHAT_HISTORY_SUMMARIZE and dropped:
+            chat_model = await self.chat_model.aget()
+            update['summary'] = (await chat_model.ainvoke(self.build_summary_prompt(state, dropped))).content
+        return update
+
+    def give_response(self,state:ChatState):
+        prompt = self.build_prompt(state)
+        result = self.response_model.invoke(prompt)
+
+        return {
+        "messages": [result]
+    }
+
+    async def agive_response(self,state:ChatState):
+        prompt = self.build_prompt(state)
+        result = await self.response_model.ainvoke(prompt)
 
         return {
         "messages": [result]
@@ -79,12 +161,30 @@ class Chat_HuggingFaceController:
         # })
         # graph_state.add_edge('query_pdf',END)
         # graph_state.add_edge('give_response',END)
-        graph_state.add_node('give_response',self.give_response)
-        graph_state.add_edge(START,'give_response')
+        graph_state.add_node('trim_history',RunnableLambda(self.trim_history, afunc=self.atrim_history))
+        graph_state.add_node('give_response',RunnableLambda(self.give_response, afunc=self.agive_response))
+        graph_state.add_conditional_edges(START,self.route_history,{
+            'trim_history':'trim_history',
+            'give_response':'give_response'
+        })
+        graph_state.add_edge('trim_history','give_response')
         graph_state.add_edge('give_response',END)
-        perstMem = PersistentMem(self.DB_URI)
-        checkpointer = perstMem.postgresDB()
-        self.workflow = graph_state.compile(checkpointer=checkpointer)
+        self.graph_state = graph_state
+        self.async_workflow = None
+
+    def connect(self):
+        self.perstMem = PersistentMem(self.DB_URI)
+        self.workflow = self.graph_state.compile(checkpointer=self.perstMem.postgresDB())
+
+    async def close(self):
+        if self.perstMem is not None:
+            await self.perstMem.close_async()
+
+    async def get_async_workflow(self):
+        if self.async_workflow is None:
+            checkpointer = await self.perstMem.async_postgresDB()
+            self.async_workflow = self.graph_state.compile(checkpointer=checkpointer)
+        return self.async_workflow
     # def set_pdf_query_bool(self,state:ChatState)->ChatState:
     #     message = state['messages'][-1]
 
@@ -134,6 +234,30 @@ class Chat_HuggingFaceController:
         result = self.workflow.invoke({'messages':[user_query]},config=config)
         return result['messages'][-1].content
 
+    async def achat(self,user_query,thread_id):
+        config = {"configurable": {"thread_id": thread_id}}
+        user_query=HumanMessage(content=user_query)
+        workflow = await self.get_async_workflow()
+
+        result = await workflow.ainvoke({'messages':[user_query]},config=config)
+        return result['messages'][-1].content
+
+    async def astream_chat(self,user_query,thread_id):
+        config = {"configurable": {"thread_id": thread_id}}
+        user_query=HumanMessage(content=user_query)
+        workflow = await self.get_async_workflow()
+
+        # messages mode streams the chat model tokens; the checkpointer still saves the final message
+        streamed = False
+        async for chunk, metadata in workflow.astream({'messages':[user_query]},config=config,stream_mode="messages"):
+            if metadata.get('langgraph_node') == 'give_response' and chunk.content:
+                streamed = True
+                yield chunk.content
+        if not streamed:
+            # a cached reply never reaches the model, send it in one piece
+            state = await workflow.aget_state(config)
+            yield state.values['messages'][-1].content
+
 
 
     # def query_pdf_handler(self,state:ChatState):
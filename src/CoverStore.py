@@ -0,0 +1,178 @@
+import base64
+import io
+import os
+import re
+import threading
+import uuid
+from collections import OrderedDict
+from PIL import Image, features
+from pdf2image import convert_from_path
+
+COVER_DIR = os.getenv('COVER_DIR', 'cover_thumbnails')
+# webp or jpeg; webp falls back to jpeg when Pillow was built without it
+COVER_FORMAT = os.getenv('COVER_FORMAT', 'webp').lower()
+COVER_WIDTH = int(os.getenv('COVER_WIDTH', '300'))
+COVER_HEIGHT = int(os.getenv('COVER_HEIGHT', '400'))
+COVER_QUALITY = int(os.getenv('COVER_QUALITY', '70'))
+COVER_MEMORY_ITEMS = int(os.getenv('COVER_MEMORY_ITEMS', '512'))
+FORMATS = {
+    'webp': ('WEBP', 'image/webp'),
+    'jpeg': ('JPEG', 'image/jpeg'),
+    'png': ('PNG', 'image/png'),
+}
+
+def cover_format(name=COVER_FORMAT):
+    if name not in ('webp', 'jpeg'):
+        print(f"unknown cover format {name}, using jpeg")
+        return 'jpeg'
+    if name == 'webp' and not features.check('webp'):
+        print("Pillow was built without WebP, storing covers as jpeg")
+        return 'jpeg'
+    return name
+
+def encode_thumbnail(image, fmt, quality=COVER_QUALITY):
+    image = image.convert('RGB')
+    image.thumbnail((COVER_WIDTH, COVER_HEIGHT))
+    buffer = io.BytesIO()
+    image.save(buffer, format=FORMATS[fmt][0], quality=quality)
+    return buffer.getvalue()
+
+def render_cover(pdf_path, fmt, quality=COVER_QUALITY):
+    # pdftoppm rasterizes page 1 straight at thumbnail height instead of 200 dpi and a resize
+    pages = convert_from_path(pdf_path, first_page=1, last_page=1, size=(None, COVER_HEIGHT))
+    if not pages:
+        return None
+    return encode_thumbnail(pages[0], fmt, quality)
+
+class CoverStore:
+    # keyed by the cover's Drive id, every cover is kept: they are a few KB each
+    def __init__(self, myDriveInst, folder=COVER_DIR):
+        self.myDrive = myDriveInst
+        self.folder = folder
+        self.format = cover_format()
+        self.lock = threading.Lock()
+        self.fetch_locks = {}
+        self.files = {}
+        self.sizes = {}
+        self.memory = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.renders = 0
+        self.converted = 0
+        os.makedirs(self.folder, exist_ok=True)
+        for name in os.listdir(self.folder):
+            if name.endswith(('.part', '.download')):
+                os.remove(os.path.join(self.folder, name))
+                continue
+            cover_id = name.rpartition('.')[0]
+            self.files[cover_id] = name
+            self.sizes[cover_id] = os.path.getsize(os.path.join(self.folder, name))
+            self.total_bytes += self.sizes[cover_id]
+
+    def mime(self, cover_id):
+        return FORMATS[self.files[cover_id].rpartition('.')[2]][1]
+
+    def put_bytes(self, cover_id, data, fmt):
+        name = f"{cover_id}.{fmt}"
+        part_path = os.path.join(self.folder, f"{name}.{uuid.uuid4().hex}.part")
+        with open(part_path, 'wb') as f:
+            f.write(data)
+        os.replace(part_path, os.path.join(self.folder, name))
+        with self.lock:
+            previous = self.files.get(cover_id)
+            self.files[cover_id] = name
+            # a replaced cover gives back its old size
+            self.total_bytes += len(data) - self.sizes.get(cover_id, 0)
+            self.sizes[cover_id] = len(data)
+            self.memory.pop(cover_id, None)
+        if previous and previous != name:
+            # stored in another format before COVER_FORMAT changed
+            try:
+                os.remove(os.path.join(self.folder, previous))
+            except FileNotFoundError:
+                pass
+
+    def create(self, fileId, pdf_path):
+        data = render_cover(pdf_path, self.format)
+        if data is None:
+            return None
+        temp_filename = f"{fileId}_cover.{self.format}"
+        try:
+            with open(temp_filename, 'wb') as f:
+                f.write(data)
+            # Drive keeps a copy so other instances and a fresh disk can still serve the cover
+            cover_id = self.myDrive.upload_image(temp_filename, mimetype=FORMATS[self.format][1], cache=False)
+        finally:
+            if os.path.exists(temp_filename): os.remove(temp_filename)
+        if cover_id:
+            self.put_bytes(cover_id, data, self.format)
+            with self.lock:
+                self.renders += 1
+        return cover_id
+
+    def get(self, cover_id):
+        # returns (path, mime) or (None, None)
+        if not re.fullmatch(r'[\w-]+', cover_id or ''):
+            return None, None
+        with self.lock:
+            if cover_id in self.files:
+                self.hits += 1
+                return os.path.join(self.folder, self.files[cover_id]), self.mime(cover_id)
+            fetch_lock = self.fetch_locks.setdefault(cover_id, threading.Lock())
+        with fetch_lock:
+            with self.lock:
+                if cover_id in self.files:
+                    self.hits += 1
+                    return os.path.join(self.folder, self.files[cover_id]), self.mime(cover_id)
+                self.misses += 1
+            # covers uploaded before this store existed are 300x400 PNGs, shrink them once
+            download_path = os.path.join(self.folder, f"{cover_id}.{uuid.uuid4().hex}.part")
+            try:
+                if not self.myDrive.download_file(cover_id, download_path):
+                    return None, None
+                with Image.open(download_path) as image:
+                    data = encode_thumbnail(image, self.format)
+                self.put_bytes(cover_id, data, self.format)
+                with self.lock:
+                    self.converted += 1
+            except Exception as e:
+                print(f"error fetching cover {cover_id}: {e}")
+                return None, None
+            finally:
+                if os.path.exists(download_path): os.remove(download_path)
+                with self.lock:
+                    self.fetch_locks.pop(cover_id, None)
+            return os.path.join(self.folder, self.files[cover_id]), self.mime(cover_id)
+
+    def read_base64(self, cover_id):
+        with self.lock:
+            if cover_id in self.memory:
+                self.memory.move_to_end(cover_id)
+                self.hits += 1
+                return self.memory[cover_id]
+        path, _ = self.get(cover_id)
+        if not path:
+            return None
+        with open(path, 'rb') as f:
+            encoded = base64.b64encode(f.read()).decode('utf-8')
+        with self.lock:
+            self.memory[cover_id] = encoded
+            while len(self.memory) > COVER_MEMORY_ITEMS:
+                self.memory.popitem(last=False)
+        return encoded
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'format': self.format,
+                'covers': len(self.files),
+                'bytes': self.total_bytes,
+                'in_memory': len(self.memory),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0,
+                'rendered': self.renders,
+                'converted_from_drive': self.converted
+            }
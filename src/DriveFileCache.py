@@ -0,0 +1,137 @@
+import os
+import shutil
+import threading
+import uuid
+from collections import OrderedDict
+
+DRIVE_CACHE_DIR = os.getenv('DRIVE_CACHE_DIR', 'drive_cache')
+DRIVE_CACHE_MAX_BYTES = int(os.getenv('DRIVE_CACHE_MAX_BYTES', str(1024 * 1024 * 1024)))
+
+class DriveFileCache:
+    # keyed by Drive file id, so only use it for files that are never updated in place
+    def __init__(self, myDriveInst, folder=DRIVE_CACHE_DIR, max_bytes=DRIVE_CACHE_MAX_BYTES):
+        self.myDrive = myDriveInst
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.fetch_locks = {}
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(self.folder, exist_ok=True)
+        self.scan()
+
+    def scan(self):
+        files = []
+        for name in os.listdir(self.folder):
+            path = os.path.join(self.folder, name)
+            if name.endswith(('.part', '.download')):
+                os.remove(path)
+                continue
+            stat = os.stat(path)
+            files.append((stat.st_atime, name, stat.st_size))
+        for _, name, size in sorted(files):
+            self.entries[name] = size
+            self.total_bytes += size
+        self.evict()
+
+    def path(self, file_id):
+        return os.path.join(self.folder, file_id)
+
+    def lookup(self, file_id):
+        with self.lock:
+            if file_id in self.entries and os.path.exists(self.path(file_id)):
+                self.entries.move_to_end(file_id)
+                self.hits += 1
+                return self.path(file_id)
+            return None
+
+    def record(self, file_id):
+        size = os.path.getsize(self.path(file_id))
+        with self.lock:
+            self.total_bytes -= self.entries.pop(file_id, 0)
+            self.entries[file_id] = size
+            self.total_bytes += size
+            self.evict()
+
+    def evict(self):
+        while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            file_id, size = self.entries.popitem(last=False)
+            self.total_bytes -= size
+            self.evictions += 1
+            try:
+                os.remove(self.path(file_id))
+            except FileNotFoundError:
+                pass
+
+    def fetch(self, file_id):
+        path = self.lookup(file_id)
+        if path:
+            return path
+        with self.lock:
+            fetch_lock = self.fetch_locks.setdefault(file_id, threading.Lock())
+        with fetch_lock:
+            # another request may have downloaded it while we waited
+            path = self.lookup(file_id)
+            if path:
+                return path
+            with self.lock:
+                self.misses += 1
+            part_path = f"{self.path(file_id)}.{uuid.uuid4().hex}.part"
+            try:
+                if not self.myDrive.download_file(file_id, part_path):
+                    return None
+                os.replace(part_path, self.path(file_id))
+            finally:
+                if os.path.exists(part_path): os.remove(part_path)
+                with self.lock:
+                    self.fetch_locks.pop(file_id, None)
+            self.record(file_id)
+            return self.path(file_id)
+
+    def read_bytes(self, file_id):
+        path = self.fetch(file_id)
+        if not path:
+            return None
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            # evicted between fetch and open
+            path = self.fetch(file_id)
+            if not path:
+                return None
+            with open(path, 'rb') as f:
+                return f.read()
+
+    def read_bytes_many(self, file_ids):
+        # misses download in parallel on the Drive transfer pool
+        return self.myDrive.run_many([(self.read_bytes, file_id) for file_id in file_ids])
+
+    def put(self, file_id, local_path):
+        if not file_id or not os.path.exists(local_path):
+            return
+        part_path = f"{self.path(file_id)}.{uuid.uuid4().hex}.part"
+        try:
+            shutil.copyfile(local_path, part_path)
+            os.replace(part_path, self.path(file_id))
+            self.record(file_id)
+        except OSError as e:
+            print(f"error caching {file_id}: {e}")
+        finally:
+            if os.path.exists(part_path): os.remove(part_path)
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0,
+                'evictions': self.evictions,
+                'entries': len(self.entries),
+                'bytes': self.total_bytes,
+                'max_bytes': self.max_bytes
+            }
@@ -0,0 +1,119 @@
+import json
+import os
+import threading
+import time
+
+DRIVE_METADATA_FILE = os.getenv('DRIVE_METADATA_FILE', 'drive_metadata.json')
+# found files are trusted this long, folders until invalidated
+DRIVE_METADATA_TTL = float(os.getenv('DRIVE_METADATA_TTL', '3600'))
+# "does not exist yet" answers, another instance may create the file meanwhile
+DRIVE_METADATA_NEGATIVE_TTL = float(os.getenv('DRIVE_METADATA_NEGATIVE_TTL', '60'))
+
+def folder_key(name):
+    return f"folder:{name}"
+
+def file_key(parent_id, name):
+    return f"file:{parent_id}:{name}"
+
+class DriveMetadataCache:
+    def __init__(self, path=DRIVE_METADATA_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.changes_polled = 0
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, 'r') as f:
+                self.entries = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.entries = {}
+
+    def save(self):
+        # only found entries are worth keeping across restarts
+        entries = {key: entry for key, entry in self.entries.items() if entry['value'] is not None}
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(entries, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"error saving the drive metadata cache: {e}")
+
+    def expired(self, key, entry):
+        if entry['value'] is None:
+            return time.time() - entry['at'] > DRIVE_METADATA_NEGATIVE_TTL
+        if key.startswith('folder:'):
+            return False
+        return time.time() - entry['at'] > DRIVE_METADATA_TTL
+
+    def get(self, key):
+        # returns (hit, value); value None is a cached "not found"
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or self.expired(key, entry):
+                self.misses += 1
+                return False, None
+            self.hits += 1
+            return True, entry['value']
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = {'value': value, 'at': time.time()}
+            if value is not None:
+                self.save()
+
+    def invalidate(self, key=None):
+        with self.lock:
+            if key is None:
+                self.invalidations += len(self.entries)
+                self.entries = {}
+            elif self.entries.pop(key, None) is not None:
+                self.invalidations += 1
+            self.save()
+
+    def forget_id(self, file_id):
+        with self.lock:
+            keys = [key for key, entry in self.entries.items()
+                    if entry['value'] is not None and entry['value'].get('id') == file_id]
+            for key in keys:
+                del self.entries[key]
+            self.invalidations += len(keys)
+            if keys:
+                self.save()
+
+    def observe_change(self, file_id, name=None, parents=(), is_folder=False, removed=False):
+        # from the Drive changes feed: a content update keeps lookups valid, a deleted
+        # file or a new file answering a cached lookup does not
+        with self.lock:
+            self.changes_polled += 1
+        if removed:
+            self.forget_id(file_id)
+            return
+        keys = [folder_key(name)] if is_folder else [file_key(parent_id, name) for parent_id in parents or ()]
+        with self.lock:
+            dropped = []
+            for key in keys:
+                entry = self.entries.get(key)
+                if entry is not None and (entry['value'] is None or entry['value'].get('id') != file_id):
+                    del self.entries[key]
+                    dropped.append(key)
+            self.invalidations += len(dropped)
+            if dropped:
+                self.save()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0,
+                'invalidations': self.invalidations,
+                'changes_polled': self.changes_polled
+            }
@@ -1,20 +1,42 @@
 import os
-import io
+import threading
+import time
+import uuid
+import google_auth_httplib2
+import httplib2
 from dotenv import load_dotenv
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
-import gdown
 from google_auth_oauthlib.flow import Flow,InstalledAppFlow
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 from googleapiclient.http import MediaFileUpload, MediaIoBaseDownload
+from DriveFileCache import DriveFileCache
+from DriveMetadataCache import DriveMetadataCache, folder_key, file_key
+from StorageBackend import StorageBackend, VECTOR_ZIP_NAME, VECTOR_SEGMENT_PREFIX
 load_dotenv()
 SCOPE = ['https://www.googleapis.com/auth/drive', 'https://www.googleapis.com/auth/drive.file']
-VECTOR_ZIP_NAME = 'pdf_vectors_archive.zip'
 LOCAL_VECTOR_FOLDER = 'pdf_vectors_store'
+# googleapiclient's default media chunk is 100MB, i.e. a whole PDF or zip in RAM
+DRIVE_CHUNK_SIZE = int(os.getenv('DRIVE_CHUNK_SIZE', str(8 * 1024 * 1024)))
+DRIVE_CHUNK_RETRIES = int(os.getenv('DRIVE_CHUNK_RETRIES', '5'))
+DRIVE_RETRY_BACKOFF = float(os.getenv('DRIVE_RETRY_BACKOFF', '0.5'))
+# seconds between Drive changes-feed polls that keep the metadata cache fresh, 0 = off
+DRIVE_CHANGES_POLL = float(os.getenv('DRIVE_CHANGES_POLL', '0'))
+# the Drive batch endpoint takes at most 100 calls per request
+DRIVE_BATCH_MAX = 100
 
-class DriveAPI:
-    def __init__(self):
+def retryable(error):
+    # 429 and 5xx are worth another try, other HTTP errors will not get better
+    if isinstance(error, HttpError):
+        return error.resp.status == 429 or error.resp.status >= 500
+    return True
+
+class DriveAPI(StorageBackend):
+    name = 'drive'
+
+    def __init__(self, connect=True):
+        super().__init__(DRIVE_CHUNK_SIZE)
         self.cred_path = '../credentials.json'
         self.token_path = '../google_token.json'
         self.parentImgVectorsFolderID = '1vgCCefOk8pjm1j3mwAJKlj90XNbmihu4' 
@@ -24,20 +46,43 @@ class DriveAPI:
         self.service = None
         self.cred_state = False
         self.cred_url = None
+        # each transfer_pool thread keeps its own authorized connection (thread_http), reused across transfers
+        self.local = threading.local()
+        self.file_cache = DriveFileCache(self)
+        self.metadata_cache = DriveMetadataCache()
+        self.changes_thread = None
+        if connect:
+            self.connect()
+    def connect(self):
         self._authenticate()
         if not self.cred_state:
             self.authorize_in_terminal()
         if self.cred_state and self.service:
             self.create_initial_folders()
-    def download_models(self):
-        if not os.path.exists('../pdf_embeder-bge-base'):
-            print("**************************************Downloading Model 1******************************")
-            model_folder = 'https://drive.google.com/drive/folders/1SZJI2xUako091gF3itdfFvlSTU8hkzzY?usp=sharing'
-            gdown.download_folder(url=model_folder,output="../pdf_embeder-bge-base", quiet=False, use_cookies=False)
-        if not os.path.exists('../siglip_model'):
-            print("**************************************Downloading Model 2******************************")
-            model_folder = 'https://drive.google.com/drive/folders/1tTBDlG7q14vTaBap9bgvjTm-eT2-_0pv?usp=sharing'
-            gdown.download_folder(url=model_folder,output="../siglip_model", quiet=False, use_cookies=False)
+            self.start_change_polling()
+    def thread_http(self):
+        # the shared httplib2 client behind self.service is not thread-safe
+        http = getattr(self.local, 'http', None)
+        if http is None or http.credentials is not self.creds:
+            http = google_auth_httplib2.AuthorizedHttp(self.creds, http=httplib2.Http())
+            self.local.http = http
+        return http
+
+    def batch_execute(self, requests):
+        # up to DRIVE_BATCH_MAX metadata calls per HTTP round trip; None where a call failed
+        results = [None] * len(requests)
+        def collect(request_id, response, exception):
+            if exception is not None:
+                print(f"error in batched drive request: {exception}")
+                return
+            results[int(request_id)] = response
+        for start in range(0, len(requests), DRIVE_BATCH_MAX):
+            batch = self.service.new_batch_http_request(callback=collect)
+            for idx, request in enumerate(requests[start:start + DRIVE_BATCH_MAX], start=start):
+                batch.add(request, request_id=str(idx))
+            batch.execute(http=self.thread_http())
+        return results
+
     def _authenticate(self):
      
         if os.path.exists(self.token_path):
@@ -78,6 +123,8 @@ class DriveAPI:
             self.cred_state = True
 
             self.service = build('drive', 'v3', credentials=self.creds)
+            # ids cached for a previous account mean nothing for this one
+            self.metadata_cache.invalidate()
 
             return True
         except Exception as e:
@@ -98,8 +145,16 @@ class DriveAPI:
             print(f'error has been occured in create_initial_folders: {e}')
 
     def _get_or_create_folder(self, folder_name):
+        hit, folder = self.metadata_cache.get(folder_key(folder_name))
+        if hit and folder:
+            return folder['id']
+        folder_id = self.find_or_create_folder(folder_name)
+        self.metadata_cache.put(folder_key(folder_name), {'id': folder_id, 'name': folder_name})
+        return folder_id
+
+    def find_or_create_folder(self, folder_name):
         query = f"name = '{folder_name}' and mimeType = 'application/vnd.google-apps.folder' and trashed = false"
-        results = self.service.files().list(q=query, spaces='drive', fields='files(id, name)').execute()
+        results = self.service.files().list(q=query, spaces='drive', fields='files(id, name)').execute(http=self.thread_http())
         files = results.get('files', [])
         
         if files:
@@ -110,7 +165,7 @@ class DriveAPI:
                 'name': folder_name,
                 'mimeType': 'application/vnd.google-apps.folder'
             }
-            folder = self.service.files().create(body=file_metadata, fields='id').execute()
+            folder = self.service.files().create(body=file_metadata, fields='id').execute(http=self.thread_http())
             print(f"created {folder_name}:{folder.get('id')}")
             return folder.get('id')
 
@@ -118,62 +173,163 @@ class DriveAPI:
         try:
             
             file_metadata = {'name': filename, 'parents': [self.parentPdfFolderID]}
-            media = MediaFileUpload(filename, mimetype='application/pdf')
-            file = self.service.files().create(body=file_metadata, media_body=media, fields='id').execute()
-            
+            media = MediaFileUpload(filename, mimetype='application/pdf', resumable=True)
+            file = self.service.files().create(body=file_metadata, media_body=media, fields='id').execute(http=self.thread_http())
+            self.file_cache.put(file.get('id'), filename)
             return file.get('id')
         except HttpError as error:
             print(f"error has been occured in upload_pdf_file: {error}")
             return None
 
+    def find_file(self, parent_id, name):
+        key = file_key(parent_id, name)
+        hit, found = self.metadata_cache.get(key)
+        if hit:
+            return found
+        query = f"'{parent_id}' in parents and name = '{name}' and trashed = false"
+        results = self.service.files().list(q=query, fields="files(id, name)").execute(http=self.thread_http())
+        files = results.get('files', [])
+        found = files[0] if files else None
+        self.metadata_cache.put(key, found)
+        return found
+
+    def put_named_file(self, parent_id, name, local_path, mimetype):
+        # update the file with this name in place, or create it
+        existing_file = self.find_file(parent_id, name)
+        if existing_file:
+            try:
+                self.service.files().update(
+                    fileId=existing_file['id'],
+                    media_body=MediaFileUpload(local_path, mimetype=mimetype, resumable=True)
+                ).execute(http=self.thread_http())
+                return existing_file['id']
+            except HttpError as e:
+                if e.resp.status != 404:
+                    raise
+                # deleted since it was cached
+                self.metadata_cache.invalidate(file_key(parent_id, name))
+        file = self.service.files().create(
+            body={'name': name, 'parents': [parent_id]},
+            media_body=MediaFileUpload(local_path, mimetype=mimetype, resumable=True),
+            fields='id'
+        ).execute(http=self.thread_http())
+        self.metadata_cache.put(file_key(parent_id, name), {'id': file.get('id'), 'name': name})
+        return file.get('id')
+
+    def start_change_polling(self):
+        if DRIVE_CHANGES_POLL <= 0 or self.changes_thread is not None:
+            return
+        self.changes_thread = threading.Thread(target=self.poll_changes, daemon=True)
+        self.changes_thread.start()
+
+    def poll_changes(self):
+        token = None
+        while True:
+            try:
+                if token is None:
+                    token = self.service.changes().getStartPageToken().execute(http=self.thread_http())['startPageToken']
+                page_token = token
+                while page_token:
+                    response = self.service.changes().list(
+                        pageToken=page_token,
+                        fields='nextPageToken, newStartPageToken, changes(fileId, removed, file(name, parents, mimeType, trashed))'
+                    ).execute(http=self.thread_http())
+                    for change in response.get('changes', []):
+                        file = change.get('file') or {}
+                        self.metadata_cache.observe_change(
+                            change.get('fileId'), file.get('name'), file.get('parents', ()),
+                            file.get('mimeType') == 'application/vnd.google-apps.folder',
+                            change.get('removed', False) or file.get('trashed', False)
+                        )
+                    page_token = response.get('nextPageToken')
+                    token = response.get('newStartPageToken', token)
+            except Exception as e:
+                print(f"error polling drive changes: {e}")
+            time.sleep(DRIVE_CHANGES_POLL)
+
     def search_vector_zip(self):
         try:
-            query = f"'{self.parentPdfVectorsFolderID}' in parents and name = '{VECTOR_ZIP_NAME}' and trashed = false"
-            results = self.service.files().list(q=query, fields="files(id, name)").execute()
-            files = results.get('files', [])
-            if files:
-                return files[0] 
-            return None
+            return self.find_file(self.parentPdfVectorsFolderID, VECTOR_ZIP_NAME)
         except HttpError as e:
             print(f"error searching the vector zip: {e}")
             return None
 
     def download_file(self, file_id, output_filename):
+        # chunks go straight to a temp file next to the target, renamed into place once complete
+        part_path = f"{output_filename}.{uuid.uuid4().hex[:8]}.download"
+        started = time.perf_counter()
         try:
             request = self.service.files().get_media(fileId=file_id)
-            fh = io.BytesIO()
-            downloader = MediaIoBaseDownload(fh, request)
-            done = False
-            while done is False:
-                status, done = downloader.next_chunk()
-            
-            fh.seek(0)
-            with open(output_filename, 'wb') as f:
-                f.write(fh.read())
+            request.http = self.thread_http()
+            with open(part_path, 'wb') as fh:
+                downloader = MediaIoBaseDownload(fh, request, chunksize=DRIVE_CHUNK_SIZE)
+                done = False
+                failures = 0
+                while done is False:
+                    try:
+                        status, done = downloader.next_chunk(num_retries=DRIVE_CHUNK_RETRIES)
+                        failures = 0
+                    except (HttpError, OSError, httplib2.HttpLib2Error) as e:
+                        # the downloader keeps its offset, the next call resumes at the failed chunk
+                        failures += 1
+                        if not retryable(e) or failures > DRIVE_CHUNK_RETRIES:
+                            raise
+                        self.transfer_stats.retry()
+                        print(f"retrying chunk of {file_id} after: {e}")
+                        time.sleep(DRIVE_RETRY_BACKOFF * 2 ** (failures - 1))
+            size = os.path.getsize(part_path)
+            os.replace(part_path, output_filename)
+            self.transfer_stats.record('download', size, time.perf_counter() - started)
             print(f"Downloaded {output_filename}")
             return True
-        except HttpError as error:
+        except (HttpError, OSError, httplib2.HttpLib2Error) as error:
             print(f"Download error: {error}")
+            self.transfer_stats.record('download', 0, 0, ok=False)
             return False
+        finally:
+            if os.path.exists(part_path): os.remove(part_path)
 
     def upload_or_update_vector_zip(self, local_zip_path):
-        existing_file = self.search_vector_zip()
+        return self.put_named_file(self.parentPdfVectorsFolderID, VECTOR_ZIP_NAME, local_zip_path, 'application/zip')
+    def list_vector_segments(self):
+        try:
+            query = f"'{self.parentPdfVectorsFolderID}' in parents and name contains '{VECTOR_SEGMENT_PREFIX}' and trashed = false"
+            files = []
+            page_token = None
+            while True:
+                results = self.service.files().list(
+                    q=query, fields="nextPageToken, files(id, name)", orderBy='name', pageToken=page_token
+                ).execute(http=self.thread_http())
+                files.extend(results.get('files', []))
+                page_token = results.get('nextPageToken')
+                if not page_token:
+                    break
+            return [f for f in files if f['name'].startswith(VECTOR_SEGMENT_PREFIX)]
+        except HttpError as e:
+            print(f"error listing the vector segments: {e}")
+            return []
+
+    def upload_vector_segment(self, local_zip_path):
+        file_metadata = {
+            'name': os.path.basename(local_zip_path),
+            'parents': [self.parentPdfVectorsFolderID]
+        }
         media = MediaFileUpload(local_zip_path, mimetype='application/zip', resumable=True)
-        if existing_file:
-            self.service.files().update(
-                fileId=existing_file['id'],
-                media_body=media
-            ).execute()
-        else:
-            file_metadata = {
-                'name': VECTOR_ZIP_NAME,
-                'parents': [self.parentPdfVectorsFolderID]
-            }
-            self.service.files().create(
-                body=file_metadata,
-                media_body=media,
-                fields='id'
-            ).execute()
+        file = self.service.files().create(
+            body=file_metadata,
+            media_body=media,
+            fields='id'
+        ).execute(http=self.thread_http())
+        return file.get('id')
+
+    def delete_file(self, file_id):
+        try:
+            self.service.files().delete(fileId=file_id).execute(http=self.thread_http())
+            self.metadata_cache.forget_id(file_id)
+            return True
+        except HttpError as e:
+            print(f"error deleting file {file_id}: {e}")
+            return False
     def authorize_in_terminal(self):
         try:
             flow = InstalledAppFlow.from_client_secrets_file(
@@ -185,42 +341,49 @@ class DriveAPI:
                 f.write(self.creds.to_json())
             self.cred_state=True
             self.service = build('drive', 'v3', credentials=self.creds)
+            self.metadata_cache.invalidate()
         except Exception as e:
             print(f"Terminal Auth failed: {e}")
     def search_vector_img(self,file_path):
         try:     
-            query = f"'{self.parentImgVectorsFolderID}' in parents and name = '{file_path}' and trashed = false"
-            results = self.service.files().list(q=query, fields="files(id, name)").execute()
-            files = results.get('files', [])
-            if files:
-                return files[0] 
-            return None
+            return self.find_file(self.parentImgVectorsFolderID, file_path)
         except HttpError as e:
             print(f"error searching the image json: {e}")
             return None
+    def search_vector_imgs(self, file_paths):
+        # cached names answer at once, the rest go out in one batched round trip
+        found = {}
+        for file_path in file_paths:
+            hit, value = self.metadata_cache.get(file_key(self.parentImgVectorsFolderID, file_path))
+            if hit:
+                found[file_path] = value
+        missing = [file_path for file_path in file_paths if file_path not in found]
+        if not missing:
+            return found
+        requests = [
+            self.service.files().list(
+                q=f"'{self.parentImgVectorsFolderID}' in parents and name = '{file_path}' and trashed = false",
+                fields="files(id, name)"
+            )
+            for file_path in missing
+        ]
+        try:
+            responses = self.batch_execute(requests)
+        except HttpError as e:
+            print(f"error searching the image vector files: {e}")
+            responses = [None] * len(missing)
+        for file_path, response in zip(missing, responses):
+            found[file_path] = (response.get('files') or [None])[0] if response else None
+            if response is not None:
+                # a failed call is not cached as "missing"
+                self.metadata_cache.put(file_key(self.parentImgVectorsFolderID, file_path), found[file_path])
+        return found
     def upload_vector_img(self,file_path):
-        existing_file = self.search_vector_img(file_path)
-        
-        media = MediaFileUpload(file_path, mimetype='application/octet-stream', resumable=True)
-        if existing_file:
-            self.service.files().update(
-                fileId=existing_file['id'],
-                media_body=media
-            ).execute()
-        else:
-            file_metadata = {
-                'name': file_path,
-                'parents': [self.parentImgVectorsFolderID]
-            }
-            self.service.files().create(
-                body=file_metadata,
-                media_body=media,
-                fields='id'
-            ).execute()
-    def upload_image(self, image_path):
+        return self.put_named_file(self.parentImgVectorsFolderID, file_path, file_path, 'application/octet-stream')
+    def upload_image(self, image_path, mimetype='image/png', cache=True):
             actual_filename = os.path.basename(image_path)
             
-            media = MediaFileUpload(image_path, mimetype='image/png') 
+            media = MediaFileUpload(image_path, mimetype=mimetype) 
             file_metadata = {
                 'name': actual_filename, 
                 'parents': [self.parentImgVectorsFolderID] 
@@ -229,6 +392,8 @@ class DriveAPI:
                 body=file_metadata,
                 media_body=media,
                 fields='id'
-            ).execute()
+            ).execute(http=self.thread_http())
+            if cache:
+                self.file_cache.put(file.get('id'), image_path)
             return file.get('id')
 
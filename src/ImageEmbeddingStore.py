@@ -0,0 +1,289 @@
+import json
+import os
+import threading
+import numpy as np
+from ImageVectorCodec import IMAGE_VECTOR_CODEC, IMAGE_PQ_TRAIN_MIN, IMAGE_PQ_TRAIN_MAX, make_codec, codec_for_rows, measure_recall
+
+INITIAL_CAPACITY = 1024
+# the file keeps its original name whatever codec the rows are in
+VECTORS_FILE = 'vectors.f32'
+LOG_FILE = 'image_map.log'
+META_FILE = 'meta.json'
+CODEBOOK_FILE = 'pq_codebook.npy'
+SAMPLE_FILE = 'recall_sample.f32'
+ENCODE_CHUNK = 65536
+# float32 originals of the first rows: a lossy codec's recall is measured on them and pq is trained on them
+IMAGE_RECALL_SAMPLE = int(os.getenv('IMAGE_RECALL_SAMPLE', '2000'))
+RECALL_MIN_SAMPLE = 16
+
+class ImageEmbeddingStore:
+    def __init__(self, folder, codec=IMAGE_VECTOR_CODEC):
+        self.folder = folder
+        self.codec_name = codec
+        self.codec = None
+        self.lock = threading.Lock()
+        self.data = None
+        self.dim = None
+        self.capacity = 0
+        self.count = 0
+        self.image_map = {}
+        self.recall = None
+        self.sample = None
+        self.sample_capacity = max(IMAGE_RECALL_SAMPLE, IMAGE_PQ_TRAIN_MIN if codec == 'pq' else 0)
+        # row index of sample[0] and how many rows after it have their original kept
+        self.sample_start = 0
+        self.sample_count = 0
+        self.measured_at = 0
+        os.makedirs(self.folder, exist_ok=True)
+        self.open()
+
+    def path(self, name):
+        return os.path.join(self.folder, name)
+
+    def write_meta(self):
+        tmp_path = f"{self.path(META_FILE)}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'dim': self.dim, 'capacity': self.capacity, 'codec': self.codec.name, 'recall_at_10': self.recall,
+                       'sample_start': self.sample_start, 'sample_count': self.sample_count}, f)
+        os.replace(tmp_path, self.path(META_FILE))
+
+    def map_vectors(self, capacity, mode='r+', path=None):
+        return np.memmap(path or self.path(VECTORS_FILE), dtype=self.codec.row_dtype(), mode=mode,
+                         shape=(capacity,) + self.codec.row_shape())
+
+    def map_sample(self, mode='r+', path=None):
+        return np.memmap(path or self.path(SAMPLE_FILE), dtype=np.float32, mode=mode, shape=(self.sample_capacity, self.dim))
+
+    def write_sample(self, start, originals):
+        # a fresh file, `originals` may be a view of the current one
+        tmp_path = f"{self.path(SAMPLE_FILE)}.tmp"
+        sample = self.map_sample('w+', tmp_path)
+        count = 0 if originals is None else min(len(originals), self.sample_capacity)
+        if count:
+            sample[:count] = originals[:count]
+        sample.flush()
+        del sample
+        self.sample = None
+        os.replace(tmp_path, self.path(SAMPLE_FILE))
+        self.sample = self.map_sample()
+        self.sample_start = start
+        self.sample_count = count
+
+    def measure(self):
+        # recall@10 of the stored codec against exact float32 search over the kept originals
+        if self.codec.name == 'float32' or self.sample_count <= RECALL_MIN_SAMPLE:
+            self.recall = None
+            return
+        self.recall = measure_recall(self.codec, self.sample[:self.sample_count])
+        self.measured_at = self.sample_count
+
+    def open(self):
+        if not os.path.exists(self.path(META_FILE)):
+            return
+        with open(self.path(META_FILE), 'r') as f:
+            meta = json.load(f)
+        self.dim = meta['dim']
+        self.capacity = meta['capacity']
+        if self.dim is None or self.capacity == 0:
+            return
+        # stores written before codecs existed only recorded a dtype
+        name = meta.get('codec', 'float16' if meta.get('dtype') == '<f2' else 'float32')
+        centroids = np.load(self.path(CODEBOOK_FILE)) if name == 'pq' else None
+        self.codec = make_codec(name, self.dim, centroids=centroids)
+        self.recall = meta.get('recall_at_10')
+        self.data = self.map_vectors(self.capacity)
+        expected = self.sample_capacity * self.dim * 4
+        if os.path.exists(self.path(SAMPLE_FILE)) and os.path.getsize(self.path(SAMPLE_FILE)) == expected:
+            self.sample = self.map_sample()
+            self.sample_start = meta.get('sample_start', 0)
+            self.sample_count = meta.get('sample_count', 0)
+            self.measured_at = self.sample_count if self.recall is not None else 0
+        else:
+            # stores from before the sample, or IMAGE_RECALL_SAMPLE changed: keep originals from here on
+            self.sample_start = None
+        # the log line is the commit point, a row written without its log line is ignored
+        if os.path.exists(self.path(LOG_FILE)):
+            committed = 0
+            with open(self.path(LOG_FILE), 'rb') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        break
+                    if not line.endswith(b'\n'):
+                        break
+                    committed += len(line)
+                    self.image_map[str(entry['idx'])] = entry['file_id']
+                    self.count = max(self.count, entry['idx'] + 1)
+            if committed < os.path.getsize(self.path(LOG_FILE)):
+                # a torn last line, appends after it would be lost with it on the next open
+                with open(self.path(LOG_FILE), 'r+b') as f:
+                    f.truncate(committed)
+        if self.sample_start is None:
+            self.write_sample(self.count, None)
+            self.write_meta()
+        if self.needs_reencode():
+            with self.lock:
+                self.reencode()
+
+    def needs_reencode(self):
+        if self.codec is None or self.codec.name == self.codec_name or self.count == 0:
+            return False
+        # a pq store stays sq8 until there are enough vectors to train the codebook
+        return not (self.codec_name == 'pq' and self.codec.name == 'sq8' and self.count < IMAGE_PQ_TRAIN_MIN)
+
+    def reencode(self):
+        # called with the lock held; rows whose float32 original was kept are encoded from it
+        print(f"re-encoding {self.count} image vectors from {self.codec.name} to {self.codec_name}")
+        count = self.count
+        image_map = {str(idx): self.image_map[str(idx)] for idx in range(count)}
+        originals = np.array(self.sample[:self.sample_count]) if self.sample_count else None
+        self.rebuild(self.matrix(count), image_map, self.codebook(), originals, self.sample_start)
+
+    def allocate(self, capacity):
+        if self.data is not None:
+            self.data.flush()
+            del self.data
+        mode = 'r+' if os.path.exists(self.path(VECTORS_FILE)) else 'w+'
+        if mode == 'r+':
+            with open(self.path(VECTORS_FILE), 'r+b') as f:
+                f.truncate(capacity * self.codec.bytes_per_vector())
+        self.data = self.map_vectors(capacity, mode)
+        self.capacity = capacity
+        self.write_meta()
+
+    def reset(self, embeddings, image_map, centroids=None):
+        # embeddings are float32 rows from older uploads or rows already in some codec's format
+        with self.lock:
+            self.rebuild(embeddings, image_map, centroids)
+
+    def rebuild(self, embeddings, image_map, centroids=None, originals=None, originals_start=0):
+        # called with the lock held; originals are float32 copies of rows originals_start onwards
+        for name in (LOG_FILE, META_FILE, CODEBOOK_FILE):
+            if os.path.exists(self.path(name)): os.remove(self.path(name))
+        self.data = None
+        self.count = 0
+        self.image_map = {}
+        self.capacity = 0
+        self.recall = None
+        self.measured_at = 0
+        if embeddings is None or len(embeddings) == 0:
+            for name in (VECTORS_FILE, SAMPLE_FILE):
+                if os.path.exists(self.path(name)): os.remove(self.path(name))
+            self.sample = None
+            self.sample_start = 0
+            self.sample_count = 0
+            self.dim = None
+            self.codec = None
+            return
+        source = codec_for_rows(embeddings, centroids)
+        self.dim = source.dim
+        if source.name == 'float32':
+            originals, originals_start = embeddings[:self.sample_capacity], 0
+        elif originals is None:
+            # the float32 vectors are gone, keep them for the rows appended from now on
+            originals_start = len(embeddings)
+        if source.name == self.codec_name:
+            self.codec = source
+        else:
+            training = None
+            if self.codec_name == 'pq':
+                if source.name != 'float32' and originals is not None and len(originals) >= IMAGE_PQ_TRAIN_MIN:
+                    training = originals
+                else:
+                    training = source.decode(embeddings[:IMAGE_PQ_TRAIN_MAX])
+            self.codec = make_codec(self.codec_name, self.dim, training)
+        capacity = INITIAL_CAPACITY
+        while capacity < len(embeddings) * 2:
+            capacity *= 2
+        # built next to the live file, `embeddings` may be a view of it
+        tmp_path = f"{self.path(VECTORS_FILE)}.tmp"
+        data = self.map_vectors(capacity, 'w+', tmp_path)
+        for start in range(0, len(embeddings), ENCODE_CHUNK):
+            block = embeddings[start:start + ENCODE_CHUNK]
+            data[start:start + len(block)] = block if self.codec is source else self.codec.encode(source.decode(block))
+        if originals is not None and len(originals) and self.codec is not source:
+            # re-encoding lossy rows compounds the error, the kept originals do not
+            end = min(originals_start + len(originals), len(embeddings))
+            data[originals_start:end] = self.codec.encode(originals[:end - originals_start])
+        data.flush()
+        del data
+        os.replace(tmp_path, self.path(VECTORS_FILE))
+        self.data = self.map_vectors(capacity)
+        self.capacity = capacity
+        self.write_sample(originals_start, originals)
+        self.measure()
+        if self.recall is not None:
+            print(f"image vectors stored as {self.codec.name}, recall@10 vs float32: {self.recall}")
+        if self.codec.name == 'pq':
+            np.save(self.path(CODEBOOK_FILE), self.codec.centroids)
+        self.write_meta()
+        tmp_path = f"{self.path(LOG_FILE)}.tmp"
+        with open(tmp_path, 'w') as f:
+            for idx in range(len(embeddings)):
+                f.write(json.dumps({'idx': idx, 'file_id': image_map.get(str(idx))}) + '\n')
+        os.replace(tmp_path, self.path(LOG_FILE))
+        self.image_map = {str(idx): image_map.get(str(idx)) for idx in range(len(embeddings))}
+        self.count = len(embeddings)
+
+    def append(self, vector, file_id):
+        vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+        with self.lock:
+            if self.codec is None:
+                # an empty store has nothing to train pq on yet
+                self.dim = vector.shape[0]
+                self.codec = make_codec(self.codec_name, self.dim)
+                self.write_sample(0, None)
+            if self.count >= self.capacity:
+                self.allocate(max(INITIAL_CAPACITY, self.capacity * 2))
+            idx = self.count
+            self.data[idx] = self.codec.encode(vector[None, :])[0]
+            self.data.flush()
+            with open(self.path(LOG_FILE), 'a') as f:
+                f.write(json.dumps({'idx': idx, 'file_id': file_id}) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            self.image_map[str(idx)] = file_id
+            self.count = idx + 1
+            if self.sample_count < self.sample_capacity and self.sample_start + self.sample_count == idx:
+                self.sample[self.sample_count] = vector
+                self.sample.flush()
+                self.sample_count += 1
+                if self.sample_count >= max(RECALL_MIN_SAMPLE, 2 * self.measured_at) or self.sample_count == self.sample_capacity:
+                    self.measure()
+                self.write_meta()
+            # pq is trained on the kept originals as soon as there are enough of them
+            if self.needs_reencode():
+                self.reencode()
+            return idx
+
+    def matrix(self, count=None):
+        if self.data is None:
+            return None
+        return self.data[:self.count if count is None else count]
+
+    def codebook(self):
+        return self.codec.centroids if self.codec is not None and self.codec.name == 'pq' else None
+
+    def snapshot(self):
+        with self.lock:
+            count = self.count
+            image_map = {str(idx): self.image_map[str(idx)] for idx in range(count)}
+            return count, image_map, self.matrix(count)
+
+    def stats(self):
+        with self.lock:
+            bytes_per_vector = self.codec.bytes_per_vector() if self.codec is not None else None
+            return {
+                'codec': self.codec.name if self.codec is not None else None,
+                'configured_codec': self.codec_name,
+                'count': self.count,
+                'dim': self.dim,
+                'bytes_per_vector': bytes_per_vector,
+                'float32_bytes_per_vector': self.dim * 4 if self.dim else None,
+                'bytes': self.count * bytes_per_vector if bytes_per_vector else 0,
+                'recall_at_10': self.recall
+            }
+
+    def __len__(self):
+        return self.count
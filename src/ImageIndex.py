@@ -0,0 +1,130 @@
+import os
+import numpy as np
+import faiss
+
+IMAGE_ANN_THRESHOLD = int(os.getenv('IMAGE_ANN_THRESHOLD', '20000'))
+IMAGE_ANN_KIND = os.getenv('IMAGE_ANN_KIND', 'hnsw')
+HNSW_M = int(os.getenv('IMAGE_HNSW_M', '32'))
+HNSW_EF_SEARCH = int(os.getenv('IMAGE_HNSW_EF_SEARCH', '64'))
+IVF_NPROBE = int(os.getenv('IMAGE_IVF_NPROBE', '16'))
+BUILD_CHUNK = 65536
+IMAGE_INDEX_FILE = 'image_ann_{kind}_{codec}.faiss'
+
+def top_k_indices(scores, k):
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k < len(scores):
+        candidates = np.argpartition(scores, -k)[-k:]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(scores[candidates])[::-1]]
+
+class FlatImageIndex:
+    kind = 'flat'
+
+    def __init__(self, embeddings=None, codec=None):
+        self.embeddings = embeddings
+        self.codec = codec
+
+    def __len__(self):
+        return 0 if self.embeddings is None else len(self.embeddings)
+
+    def add(self, vectors, embeddings, codec=None):
+        # the flat index scores the embedder's matrix directly, so only the reference changes
+        self.embeddings = embeddings
+        self.codec = codec or self.codec
+
+    def search(self, query_vec, k):
+        if self.embeddings is None or len(self.embeddings) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        # compressed rows are scored by their codec without decoding the whole matrix
+        scores = self.codec.score(self.embeddings, query_vec) if self.codec is not None else self.embeddings @ query_vec
+        indices = top_k_indices(scores, k)
+        return indices, scores[indices]
+
+def decoded(embeddings, codec, start=0, end=None):
+    rows = embeddings[start:end]
+    vectors = codec.decode(rows) if codec is not None else rows
+    return np.ascontiguousarray(vectors, dtype=np.float32)
+
+class FaissImageIndex:
+    def __init__(self, embeddings, kind=IMAGE_ANN_KIND, codec=None, index=None):
+        self.kind = kind
+        if index is not None:
+            self.index = index
+            self.tune()
+            return
+        dim = decoded(embeddings, codec, 0, 1).shape[1]
+        # keep the index about as compact as the stored rows
+        storage = None if codec is None or codec.name == 'float32' else (
+            faiss.ScalarQuantizer.QT_fp16 if codec.name == 'float16' else faiss.ScalarQuantizer.QT_8bit)
+        if kind == 'ivf':
+            nlist = max(1, int(4 * np.sqrt(len(embeddings))))
+            quantizer = faiss.IndexFlatIP(dim)
+            if storage is None:
+                self.index = faiss.IndexIVFFlat(quantizer, dim, nlist, faiss.METRIC_INNER_PRODUCT)
+            else:
+                self.index = faiss.IndexIVFScalarQuantizer(quantizer, dim, nlist, storage, faiss.METRIC_INNER_PRODUCT)
+            self.quantizer = quantizer
+        elif kind == 'hnsw':
+            if storage is None:
+                self.index = faiss.IndexHNSWFlat(dim, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+            else:
+                self.index = faiss.IndexHNSWSQ(dim, storage, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        else:
+            raise ValueError(f"unknown image index kind: {kind}")
+        if not self.index.is_trained:
+            train_rows = max(64 * nlist, 100000) if kind == 'ivf' else 100000
+            self.index.train(decoded(embeddings, codec, 0, train_rows))
+        for start in range(0, len(embeddings), BUILD_CHUNK):
+            self.index.add(decoded(embeddings, codec, start, start + BUILD_CHUNK))
+        self.tune()
+
+    def tune(self):
+        # search-time knobs follow the environment, not whatever a saved index was written with
+        if self.kind == 'ivf':
+            self.index.nprobe = IVF_NPROBE
+        else:
+            self.index.hnsw.efSearch = HNSW_EF_SEARCH
+
+    def __len__(self):
+        return self.index.ntotal
+
+    def save(self, path):
+        tmp_path = f"{path}.tmp"
+        faiss.write_index(self.index, tmp_path)
+        os.replace(tmp_path, path)
+
+    def add(self, vectors, embeddings, codec=None):
+        self.index.add(np.ascontiguousarray(vectors, dtype=np.float32))
+
+    def search(self, query_vec, k):
+        query = np.ascontiguousarray(query_vec.reshape(1, -1), dtype=np.float32)
+        scores, indices = self.index.search(query, min(k, self.index.ntotal))
+        keep = indices[0] >= 0
+        return indices[0][keep], scores[0][keep]
+
+def wants_ann(count, threshold=IMAGE_ANN_THRESHOLD, kind=IMAGE_ANN_KIND):
+    return count >= threshold and kind != 'flat'
+
+def build_image_index(embeddings, threshold=IMAGE_ANN_THRESHOLD, kind=IMAGE_ANN_KIND, codec=None):
+    if embeddings is None or not wants_ann(len(embeddings), threshold, kind):
+        return FlatImageIndex(embeddings, codec)
+    return FaissImageIndex(embeddings, kind, codec)
+
+def index_path(folder, codec, kind=IMAGE_ANN_KIND):
+    return os.path.join(folder, IMAGE_INDEX_FILE.format(kind=kind, codec=codec.name))
+
+def load_image_index(path, count, kind=IMAGE_ANN_KIND):
+    # rows are only ever appended, so a saved index holding a prefix of the store is still good
+    if not os.path.exists(path):
+        return None
+    try:
+        index = faiss.read_index(path)
+    except RuntimeError as e:
+        print(f"error reading the saved image index: {e}")
+        return None
+    if index.ntotal > count:
+        return None
+    return FaissImageIndex(None, kind, index=index)
@@ -0,0 +1,166 @@
+import os
+import numpy as np
+import faiss
+from ImageIndex import top_k_indices
+
+# how ImageEmbeddingStore keeps vectors: float32, float16, sq8 (int8 codes + per-row scale) or pq
+IMAGE_VECTOR_CODEC = os.getenv('IMAGE_VECTOR_CODEC', 'float32')
+IMAGE_PQ_SUBVECTORS = int(os.getenv('IMAGE_PQ_SUBVECTORS', '96'))
+IMAGE_PQ_TRAIN_MIN = int(os.getenv('IMAGE_PQ_TRAIN_MIN', '10000'))
+IMAGE_PQ_TRAIN_MAX = int(os.getenv('IMAGE_PQ_TRAIN_MAX', '100000'))
+SCORE_CHUNK = 4096
+
+def chunked_scores(rows, score_chunk):
+    scores = np.empty(len(rows), dtype=np.float32)
+    for start in range(0, len(rows), SCORE_CHUNK):
+        end = min(start + SCORE_CHUNK, len(rows))
+        scores[start:end] = score_chunk(rows[start:end])
+    return scores
+
+class Float32Codec:
+    name = 'float32'
+    dtype = np.dtype(np.float32)
+
+    def __init__(self, dim):
+        self.dim = dim
+
+    def row_dtype(self):
+        return self.dtype
+
+    def row_shape(self):
+        return (self.dim,)
+
+    def bytes_per_vector(self):
+        return self.row_dtype().itemsize * int(np.prod(self.row_shape()))
+
+    def encode(self, vectors):
+        return np.asarray(vectors, dtype=self.dtype)
+
+    def decode(self, rows):
+        return np.asarray(rows, dtype=np.float32)
+
+    def score(self, rows, query):
+        if self.dtype == np.float32:
+            return rows @ query
+        # decode a chunk at a time so scoring never holds a float32 copy of the library
+        return chunked_scores(rows, lambda chunk: self.decode(chunk) @ query)
+
+class Float16Codec(Float32Codec):
+    name = 'float16'
+    dtype = np.dtype(np.float16)
+
+class ScalarInt8Codec(Float32Codec):
+    name = 'sq8'
+
+    def row_dtype(self):
+        return np.dtype([('scale', '<f4'), ('codes', 'i1', (self.dim,))])
+
+    def row_shape(self):
+        return ()
+
+    def encode(self, vectors):
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        scale = np.abs(vectors).max(axis=1) / 127
+        scale[scale == 0] = 1
+        rows = np.empty(len(vectors), dtype=self.row_dtype())
+        rows['scale'] = scale
+        rows['codes'] = np.rint(vectors / scale[:, None])
+        return rows
+
+    def decode(self, rows):
+        return rows['codes'].astype(np.float32) * rows['scale'][:, None]
+
+    def score(self, rows, query):
+        return chunked_scores(rows, lambda chunk: (chunk['codes'].astype(np.float32) @ query) * chunk['scale'])
+
+class ProductQuantCodec(Float32Codec):
+    name = 'pq'
+    dtype = np.dtype(np.uint8)
+
+    def __init__(self, dim, subvectors=IMAGE_PQ_SUBVECTORS, centroids=None):
+        super().__init__(dim)
+        if dim % subvectors != 0:
+            raise ValueError(f"pq subvectors {subvectors} must divide the dimension {dim}")
+        self.subvectors = subvectors
+        self.pq = faiss.ProductQuantizer(dim, subvectors, 8)
+        self.centroids = None
+        if centroids is not None:
+            self.set_centroids(centroids)
+
+    @property
+    def trained(self):
+        return self.centroids is not None
+
+    def set_centroids(self, centroids):
+        centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        faiss.copy_array_to_vector(centroids.ravel(), self.pq.centroids)
+        self.centroids = centroids.reshape(self.subvectors, self.pq.ksub, self.pq.dsub)
+
+    def train(self, vectors):
+        sample = np.asarray(vectors[:IMAGE_PQ_TRAIN_MAX], dtype=np.float32)
+        self.pq.train(np.ascontiguousarray(sample))
+        self.centroids = faiss.vector_to_array(self.pq.centroids).reshape(self.subvectors, self.pq.ksub, self.pq.dsub)
+
+    def row_shape(self):
+        return (self.subvectors,)
+
+    def encode(self, vectors):
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        return self.pq.compute_codes(np.ascontiguousarray(vectors))
+
+    def decode(self, rows):
+        return self.pq.decode(np.ascontiguousarray(rows, dtype=np.uint8))
+
+    def score(self, rows, query):
+        # inner product of the query with every centroid, then one table lookup per code
+        table = np.einsum('mkd,md->mk', self.centroids, query.reshape(self.subvectors, -1).astype(np.float32))
+        subspaces = np.arange(self.subvectors)
+        return chunked_scores(rows, lambda chunk: table[subspaces, chunk].sum(axis=1))
+
+CODECS = {codec.name: codec for codec in (Float32Codec, Float16Codec, ScalarInt8Codec, ProductQuantCodec)}
+
+def make_codec(name, dim, training_vectors=None, centroids=None):
+    if name not in CODECS:
+        print(f"unknown image vector codec {name}, using float32")
+        name = 'float32'
+    if name != 'pq':
+        return CODECS[name](dim)
+    subvectors = IMAGE_PQ_SUBVECTORS if centroids is None else len(centroids)
+    codec = ProductQuantCodec(dim, subvectors, centroids)
+    if not codec.trained:
+        if training_vectors is None or len(training_vectors) < IMAGE_PQ_TRAIN_MIN:
+            # pq needs a trained codebook, sq8 needs nothing and is the next smallest
+            print(f"pq needs {IMAGE_PQ_TRAIN_MIN} vectors to train, storing images as sq8 for now")
+            return ScalarInt8Codec(dim)
+        codec.train(training_vectors)
+    return codec
+
+def codec_for_rows(rows, centroids=None):
+    # recognises what an uploaded imageVector.npy was written with
+    if rows.dtype.names and 'codes' in rows.dtype.names:
+        return ScalarInt8Codec(rows.dtype['codes'].shape[0])
+    if rows.dtype == np.uint8:
+        if centroids is None:
+            raise ValueError("pq image vectors need their codebook")
+        centroids = np.asarray(centroids, dtype=np.float32)
+        return ProductQuantCodec(centroids.shape[0] * centroids.shape[2], centroids.shape[0], centroids)
+    if rows.dtype == np.float16:
+        return Float16Codec(rows.shape[1])
+    return Float32Codec(rows.shape[1])
+
+def measure_recall(codec, vectors, rows=None, queries=100, k=10, max_rows=100000, seed=0):
+    # recall@k of the codec's ranking against exact float32 scores, on noisy copies of stored vectors
+    vectors = np.asarray(vectors[:max_rows], dtype=np.float32)
+    if len(vectors) <= k:
+        return None
+    rows = codec.encode(vectors) if rows is None else rows[:len(vectors)]
+    rng = np.random.default_rng(seed)
+    picks = vectors[rng.integers(0, len(vectors), queries)]
+    picks = picks + 0.3 * rng.standard_normal(picks.shape).astype(np.float32) / np.sqrt(vectors.shape[1])
+    picks /= np.linalg.norm(picks, axis=1, keepdims=True)
+    exact = vectors @ picks.T
+    hits = 0
+    for i, query in enumerate(picks):
+        truth = set(top_k_indices(exact[:, i], k))
+        hits += len(truth & set(top_k_indices(codec.score(rows, query), k)))
+    return hits / (queries * k)
@@ -0,0 +1,208 @@
+import os
+import numpy as np
+import torch
+from PIL import Image
+from transformers import SiglipImageProcessor, SiglipModel, SiglipTokenizer, SiglipProcessor
+from langchain_huggingface import HuggingFaceEmbeddings
+
+# torch = fp32 PyTorch, int8 = dynamic int8 quantization of the Linear layers, onnx = ONNX Runtime
+EMBED_BACKEND = os.getenv('EMBED_BACKEND', 'torch')
+IMAGE_EMBED_BACKEND = os.getenv('IMAGE_EMBED_BACKEND', EMBED_BACKEND)
+PDF_EMBED_BACKEND = os.getenv('PDF_EMBED_BACKEND', EMBED_BACKEND)
+EMBED_PARITY_CHECK = os.getenv('EMBED_PARITY_CHECK', 'true').lower() == 'true'
+EMBED_PARITY_MIN_COSINE = float(os.getenv('EMBED_PARITY_MIN_COSINE', '0.99'))
+ONNX_THREADS = int(os.getenv('ONNX_THREADS', '0'))
+PDF_EMBED_BATCH = int(os.getenv('PDF_EMBED_BATCH', '128'))
+BACKENDS = ('torch', 'int8', 'onnx')
+
+PARITY_TEXTS = [
+    'a photo of a cat sleeping on a sofa',
+    'handwritten lecture notes on linear algebra',
+    'a red car parked in front of a house',
+    'Introduction to machine learning, chapter 3: gradient descent',
+    'sunset over the mountains with a lake',
+    'organic chemistry reaction mechanisms and examples',
+    'a group of people playing football in a park',
+    'The history of the Roman empire from Augustus to Constantine',
+]
+backend_report = {}
+
+def parity_images(count=4, size=224):
+    # deterministic gradients plus noise, enough to exercise the whole vision tower
+    rng = np.random.default_rng(0)
+    ramp = np.linspace(0, 255, size, dtype=np.float32)
+    images = []
+    for i in range(count):
+        base = np.stack([np.add.outer(ramp, ramp * (i + 1) % 255) / 2, np.tile(ramp, (size, 1)), np.tile(ramp[:, None], (1, size))], axis=-1)
+        noisy = np.clip(base + rng.normal(0, 20, base.shape), 0, 255).astype(np.uint8)
+        images.append(Image.fromarray(noisy))
+    return images
+
+def cosine_parity(reference, candidate):
+    reference = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+    candidate = candidate / np.linalg.norm(candidate, axis=1, keepdims=True)
+    cosines = np.sum(reference * candidate, axis=1)
+    return float(cosines.min()), float(cosines.mean())
+
+def resolve_backend(name, backend, device):
+    if backend not in BACKENDS:
+        print(f"unknown inference backend {backend} for {name}, using torch")
+        return 'torch'
+    if backend != 'torch' and device != 'cpu':
+        print(f"{backend} backend is CPU only, {name} stays on torch/{device}")
+        return 'torch'
+    return backend
+
+def accept_backend(name, backend, reference, candidate):
+    report = {'backend': backend, 'requested': backend}
+    if reference is not None:
+        min_cos, mean_cos = cosine_parity(reference, candidate)
+        report.update(parity_min_cosine=round(min_cos, 5), parity_mean_cosine=round(mean_cos, 5))
+        if min_cos < EMBED_PARITY_MIN_COSINE:
+            print(f"{name} {backend} parity {min_cos:.4f} is below {EMBED_PARITY_MIN_COSINE}, using torch")
+            report['backend'] = 'torch'
+    backend_report[name] = report
+    return report['backend'] == backend
+
+def quantize_int8(module):
+    return torch.ao.quantization.quantize_dynamic(module, {torch.nn.Linear}, dtype=torch.qint8)
+
+def pooled(features, field):
+    if hasattr(features, "pooler_output"):
+        features = features.pooler_output
+    elif hasattr(features, field):
+        features = getattr(features, field)
+    return features
+
+def normalize(features):
+    return features / np.linalg.norm(features, axis=-1, keepdims=True)
+
+class TorchSiglip:
+    def __init__(self, model):
+        self.model = model
+
+    def image_features(self, inputs):
+        with torch.no_grad():
+            features = pooled(self.model.get_image_features(**inputs), "image_embeds")
+            features = features / features.norm(p=2, dim=-1, keepdim=True)
+            return features.cpu().numpy()
+
+    def text_features(self, inputs):
+        with torch.no_grad():
+            features = pooled(self.model.get_text_features(**inputs), "text_embeds")
+            features = features / features.norm(p=2, dim=-1, keepdim=True)
+            return features.cpu().numpy()
+
+class SiglipTower(torch.nn.Module):
+    # one tower per ONNX graph, so each only carries the weights it uses
+    def __init__(self, model, kind):
+        super().__init__()
+        self.model = model
+        self.kind = kind
+
+    def forward(self, x):
+        if self.kind == 'image':
+            return pooled(self.model.get_image_features(pixel_values=x), "image_embeds")
+        return pooled(self.model.get_text_features(input_ids=x), "text_embeds")
+
+class OnnxSiglip:
+    def __init__(self, model, model_folder):
+        import onnxruntime
+        folder = os.path.join(model_folder, 'onnx')
+        os.makedirs(folder, exist_ok=True)
+        options = onnxruntime.SessionOptions()
+        if ONNX_THREADS:
+            options.intra_op_num_threads = ONNX_THREADS
+        image_size = model.config.vision_config.image_size
+        text_length = model.config.text_config.max_position_embeddings
+        self.sessions = {}
+        for kind, input_name, sample in (
+            ('image', 'pixel_values', torch.zeros(1, 3, image_size, image_size)),
+            ('text', 'input_ids', torch.zeros(1, text_length, dtype=torch.long)),
+        ):
+            path = os.path.join(folder, f"{kind}.onnx")
+            if not os.path.exists(path):
+                self.export(SiglipTower(model, kind), input_name, sample, path)
+            self.sessions[kind] = onnxruntime.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+
+    def export(self, tower, input_name, sample, path):
+        axes = {0: 'batch', 1: 'sequence'} if input_name == 'input_ids' else {0: 'batch'}
+        part_path = f"{path}.part"
+        with torch.no_grad():
+            torch.onnx.export(
+                tower, (sample,), part_path,
+                input_names=[input_name], output_names=['features'],
+                dynamic_axes={input_name: axes, 'features': {0: 'batch'}},
+                opset_version=17
+            )
+        os.replace(part_path, path)
+
+    def image_features(self, inputs):
+        pixel_values = inputs['pixel_values'].cpu().numpy()
+        return normalize(self.sessions['image'].run(None, {'pixel_values': pixel_values})[0])
+
+    def text_features(self, inputs):
+        input_ids = inputs['input_ids'].cpu().numpy().astype(np.int64)
+        return normalize(self.sessions['text'].run(None, {'input_ids': input_ids})[0])
+
+def siglip_probe(processor, runner, device):
+    images = processor(images=parity_images(), return_tensors="pt").to(device)
+    texts = processor(text=PARITY_TEXTS, return_tensors="pt", padding="max_length", truncation=True).to(device)
+    return np.concatenate([runner.image_features(images), runner.text_features(texts)])
+
+def load_siglip(model_folder, device, backend=IMAGE_EMBED_BACKEND):
+    image_processor = SiglipImageProcessor.from_pretrained(model_folder, local_files_only=True)
+    tokenizer = SiglipTokenizer.from_pretrained(model_folder, local_files_only=True)
+    processor = SiglipProcessor(image_processor=image_processor, tokenizer=tokenizer)
+    model = SiglipModel.from_pretrained(model_folder, local_files_only=True).to(device)
+    model.eval()
+    fp32 = TorchSiglip(model)
+    backend = resolve_backend('siglip', backend, device)
+    if backend == 'torch':
+        backend_report['siglip'] = {'backend': 'torch', 'requested': 'torch'}
+        return processor, fp32
+    try:
+        runner = TorchSiglip(quantize_int8(model)) if backend == 'int8' else OnnxSiglip(model, model_folder)
+    except Exception as e:
+        print(f"error building the {backend} backend for siglip: {e}")
+        backend_report['siglip'] = {'backend': 'torch', 'requested': backend, 'error': str(e)}
+        return processor, fp32
+    reference = siglip_probe(processor, fp32, device) if EMBED_PARITY_CHECK else None
+    candidate = siglip_probe(processor, runner, device) if EMBED_PARITY_CHECK else None
+    if not accept_backend('siglip', backend, reference, candidate):
+        return processor, fp32
+    # the fp32 weights are dropped with the last reference to `model`
+    return processor, runner
+
+def build_bge(model_path, device, **model_kwargs):
+    return HuggingFaceEmbeddings(
+        model_name=model_path,
+        model_kwargs={'device': device, **model_kwargs},
+        encode_kwargs={'normalize_embeddings': True, 'batch_size': PDF_EMBED_BATCH}
+    )
+
+def load_bge(model_path, device, backend=PDF_EMBED_BACKEND):
+    backend = resolve_backend('bge', backend, device)
+    if backend == 'onnx' and not EMBED_PARITY_CHECK:
+        backend_report['bge'] = {'backend': 'onnx', 'requested': 'onnx'}
+        return build_bge(model_path, device, backend='onnx')
+    embeddings = build_bge(model_path, device)
+    if backend == 'torch':
+        backend_report['bge'] = {'backend': 'torch', 'requested': 'torch'}
+        return embeddings
+    reference = np.asarray(embeddings.embed_documents(PARITY_TEXTS)) if EMBED_PARITY_CHECK else None
+    try:
+        if backend == 'int8':
+            quantized = quantize_int8(embeddings._client)
+            candidate = quantized.encode(PARITY_TEXTS, normalize_embeddings=True) if EMBED_PARITY_CHECK else None
+            if accept_backend('bge', backend, reference, candidate):
+                embeddings._client = quantized
+            return embeddings
+        # sentence-transformers exports and caches the ONNX graph next to the model on first load
+        onnx_embeddings = build_bge(model_path, device, backend='onnx')
+        candidate = np.asarray(onnx_embeddings.embed_documents(PARITY_TEXTS))
+        return onnx_embeddings if accept_backend('bge', backend, reference, candidate) else embeddings
+    except Exception as e:
+        print(f"error building the {backend} backend for bge: {e}")
+        backend_report['bge'] = {'backend': 'torch', 'requested': backend, 'error': str(e)}
+        return embeddings
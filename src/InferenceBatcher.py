@@ -0,0 +1,63 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+class InferenceBatcher:
+    def __init__(self, run_batch, max_batch_size=16, max_wait_ms=5, name='inference'):
+        self.run_batch = run_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue = queue.Queue()
+        self.batches = 0
+        self.items = 0
+        self.worker = threading.Thread(target=self.run, name=f"{name}-batcher", daemon=True)
+        self.worker.start()
+
+    def submit(self, item):
+        future = Future()
+        self.queue.put((item, future))
+        return future
+
+    def __call__(self, item):
+        return self.submit(item).result()
+
+    def collect(self):
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def run(self):
+        while True:
+            batch = self.collect()
+            pending = [(item, future) for item, future in batch if future.set_running_or_notify_cancel()]
+            if not pending:
+                continue
+            try:
+                outputs = self.run_batch([item for item, _ in pending])
+                # a short result would leave the unmatched callers waiting forever
+                if len(outputs) != len(pending):
+                    raise RuntimeError(f"batch of {len(pending)} returned {len(outputs)} outputs")
+                for (_, future), output in zip(pending, outputs):
+                    future.set_result(output)
+            except Exception as e:
+                for _, future in pending:
+                    future.set_exception(e)
+            self.batches += 1
+            self.items += len(pending)
+
+    def stats(self):
+        return {
+            'batches': self.batches,
+            'items': self.items,
+            'avg_batch_size': self.items / self.batches if self.batches else 0,
+            'pending': self.queue.qsize()
+        }
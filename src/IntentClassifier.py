@@ -0,0 +1,71 @@
+import re
+
+ORDINALS = {
+    'first': 1, 'second': 2, 'third': 3, 'fourth': 4, 'fifth': 5,
+    'sixth': 6, 'seventh': 7, 'eighth': 8, 'ninth': 9, 'tenth': 10,
+    '1st': 1, '2nd': 2, '3rd': 3, '4th': 4, '5th': 5,
+    '6th': 6, '7th': 7, '8th': 8, '9th': 9, '10th': 10,
+}
+CARDINALS = {
+    'two': 2, 'three': 3, 'four': 4, 'five': 5,
+    'six': 6, 'seven': 7, 'eight': 8, 'nine': 9, 'ten': 10,
+}
+SELECTOR_NOUNS = {'book', 'pdf', 'file', 'document', 'doc', 'option', 'number', 'no', 'result', 'item', 'choice'}
+# words that can appear around a selection without naming a new topic
+FILLER = {
+    'send', 'give', 'gimme', 'get', 'open', 'download', 'share', 'show', 'want', 'wanted', 'need', 'pick',
+    'choose', 'select', 'take', 'go', 'with', 'me', 'i', 'ill', 'id', 'we', 'us', 'the', 'a', 'an', 'that',
+    'this', 'it', 'one', 'ones', 'please', 'pls', 'plz', 'yes', 'yeah', 'yep', 'ok', 'okay', 'sure', 'and',
+    'of', 'from', 'list', 'them', 'those', 'these', 'is', 'was', 'would', 'like', 'can', 'could', 'you',
+    'to', 'now', 'just', 'only', 'thanks', 'thank', 'in', 'on', 'for', 'my', 'your', 'above', 'there',
+    'here', 'lets', 'let', 'do', 'its', 'bro', 'sir', 'hey', 'hi', 'pdfs', 'books', 'files', 'results',
+    'options', 'last', 'final', 'what', 'about', 'how',
+} | SELECTOR_NOUNS
+LAST_WORDS = {'last', 'final'}
+# "not that one", "another one": a rejection, whether it means a new search is the router's call
+NEGATIONS = {'not', 'dont', 'nope', 'nah', 'never', 'none', 'neither', 'other', 'another', 'different', 'else', 'instead'}
+
+def tokenize(text):
+    text = text.lower().replace("'", '')
+    return re.findall(r'#?[a-z0-9]+', text)
+
+def classify_intent(text, has_results, result_count=None):
+    # returns the same strings the LLM router produces, or None when unsure
+    if not has_results:
+        # without earlier results the router can only ever answer POSITIVE
+        return "POSITIVE"
+
+    tokens = tokenize(text)
+    if not tokens or NEGATIONS.intersection(tokens):
+        return None
+
+    picks = []
+    leftovers = []
+    for i, token in enumerate(tokens):
+        previous = tokens[i - 1] if i > 0 else None
+        if token in ORDINALS:
+            picks.append(ORDINALS[token])
+        elif (token.lstrip('#').isdigit() and (token.startswith('#') or len(token) <= 2)) or token in CARDINALS:
+            # "3", "#3", "book 3" pick a result; "I need 3 books" or "give me 2" may be asking for a count
+            if not (token.startswith('#') or previous in SELECTOR_NOUNS or len(tokens) == 1):
+                return None
+            picks.append(CARDINALS.get(token) or int(token.lstrip('#')))
+        elif token == 'one' and previous in SELECTOR_NOUNS:
+            picks.append(1)
+        elif token in LAST_WORDS and (len(tokens) <= 2 or (i + 1 < len(tokens) and tokens[i + 1] in SELECTOR_NOUNS | {'one'})):
+            if result_count is None:
+                return None
+            picks.append(result_count)
+        elif token not in FILLER:
+            leftovers.append(token)
+
+    if leftovers:
+        # topic words with no ordinal are a new search; topic words plus an ordinal
+        # ("first chapter of physics") are ambiguous
+        return None if picks else "POSITIVE"
+    if len(set(picks)) != 1 or picks[0] < 1:
+        return None
+    if result_count is not None and picks[0] > result_count:
+        # "I need 3 books" with two on screen is not a pick
+        return None
+    return f"NEGATIVE {picks[0] - 1}"
@@ -0,0 +1,154 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from AsyncRuntime import run_model
+from StartupOrchestrator import LazyResource
+
+LLM_CACHE_MAX_ENTRIES = int(os.getenv('LLM_CACHE_MAX_ENTRIES', '2048'))
+LLM_CACHE_TTL = float(os.getenv('LLM_CACHE_TTL', '3600'))
+LLM_CACHE_SIMILARITY = float(os.getenv('LLM_CACHE_SIMILARITY', '0.97'))
+
+def split_prompt(prompt):
+    if hasattr(prompt, 'to_messages'):
+        messages = prompt.to_messages()
+    elif isinstance(prompt, list):
+        messages = prompt
+    else:
+        return '', str(prompt)
+    if not messages:
+        return '', ''
+    context = "\n".join(f"{m.type}:{m.content}" for m in messages[:-1])
+    return context, str(messages[-1].content)
+
+def digest(*parts):
+    return hashlib.sha256("\x00".join(parts).encode('utf-8')).hexdigest()
+
+class LLMResponseCache:
+    def __init__(self, max_entries=LLM_CACHE_MAX_ENTRIES, ttl=LLM_CACHE_TTL, similarity=LLM_CACHE_SIMILARITY):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity = similarity
+        self.embedding_model = None
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.groups = {}
+        self.metrics = {}
+
+    def set_embedder(self, embedding_model):
+        self.embedding_model = embedding_model
+
+    def site_metrics(self, site):
+        return self.metrics.setdefault(site, {'exact_hits': 0, 'semantic_hits': 0, 'misses': 0})
+
+    def remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        group = self.groups.get(entry['group'])
+        if group is not None:
+            group.pop(key, None)
+            if not group:
+                del self.groups[entry['group']]
+
+    def embed(self, text):
+        if self.embedding_model is None:
+            return None
+        return np.asarray(self.embedding_model.embed_query(text), dtype=np.float32)
+
+    def lookup(self, site, prompt, semantic=True):
+        # semantic matches only compare the last message, and only between prompts whose
+        # earlier messages (system prompt, chat history) are identical
+        context, query = split_prompt(prompt)
+        group = digest(site, context)
+        key = digest(group, query)
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry['expires'] > now:
+                self.entries.move_to_end(key)
+                self.site_metrics(site)['exact_hits'] += 1
+                return entry['response'], None
+            if entry is not None:
+                self.remove(key)
+            has_group = group in self.groups
+        vector = self.embed(query) if semantic and has_group else None
+        with self.lock:
+            if vector is not None:
+                best_key, best_score = None, self.similarity
+                for other_key, other_vector in list(self.groups.get(group, {}).items()):
+                    other = self.entries.get(other_key)
+                    if other is None or other['expires'] <= now:
+                        self.remove(other_key)
+                        continue
+                    if other_vector is None:
+                        continue
+                    score = float(vector @ other_vector)
+                    if score >= best_score:
+                        best_key, best_score = other_key, score
+                if best_key is not None:
+                    self.entries.move_to_end(best_key)
+                    self.site_metrics(site)['semantic_hits'] += 1
+                    return self.entries[best_key]['response'], None
+            self.site_metrics(site)['misses'] += 1
+        return None, (group, key, query, vector)
+
+    def store(self, pending, response, semantic=True, ttl=None):
+        group, key, query, vector = pending
+        if semantic and vector is None:
+            vector = self.embed(query)
+        with self.lock:
+            self.remove(key)
+            self.entries[key] = {
+                'group': group,
+                'response': response,
+                'expires': time.monotonic() + (self.ttl if ttl is None else ttl)
+            }
+            self.groups.setdefault(group, {})[key] = vector if semantic else None
+            while len(self.entries) > self.max_entries:
+                self.remove(next(iter(self.entries)))
+
+    def stats(self):
+        with self.lock:
+            sites = {}
+            for site, counts in self.metrics.items():
+                lookups = counts['exact_hits'] + counts['semantic_hits'] + counts['misses']
+                hits = counts['exact_hits'] + counts['semantic_hits']
+                sites[site] = dict(counts, hit_rate=hits / lookups if lookups else 0)
+            return {'entries': len(self.entries), 'max_entries': self.max_entries, 'sites': sites}
+
+class CachedChatModel:
+    def __init__(self, chat_model, cache, site, semantic=True, ttl=None):
+        self.chat_model = chat_model
+        self.cache = cache
+        self.site = site
+        self.semantic = semantic
+        self.ttl = ttl
+
+    def fresh(self, response):
+        # a new id so LangGraph's add_messages appends instead of replacing the cached message
+        return response.model_copy(update={'id': None})
+
+    def invoke(self, prompt, *args, **kwargs):
+        cached, pending = self.cache.lookup(self.site, prompt, self.semantic)
+        if cached is not None:
+            return self.fresh(cached)
+        response = self.chat_model.invoke(prompt, *args, **kwargs)
+        self.cache.store(pending, response, self.semantic, self.ttl)
+        return response
+
+    async def ainvoke(self, prompt, *args, **kwargs):
+        # lookups may embed the prompt locally, keep that off the event loop
+        cached, pending = await run_model(self.cache.lookup, self.site, prompt, self.semantic)
+        if cached is not None:
+            return self.fresh(cached)
+        if isinstance(self.chat_model, LazyResource):
+            await self.chat_model.aget()
+        response = await self.chat_model.ainvoke(prompt, *args, **kwargs)
+        await run_model(self.cache.store, pending, response, self.semantic, self.ttl)
+        return response
+
+    def __getattr__(self, name):
+        return getattr(self.chat_model, name)
@@ -0,0 +1,237 @@
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from DriveFileCache import DriveFileCache
+from StorageBackend import StorageBackend, VECTOR_ZIP_NAME, VECTOR_SEGMENT_PREFIX
+
+STORAGE_DIR = os.getenv('STORAGE_DIR', 'local_storage')
+INDEX_FILE = 'index.json'
+# the same folder names the Drive backend creates
+IMG_FOLDER = 'ImgVectors'
+PDF_VECTOR_FOLDER = 'PdfVectors'
+PDF_FOLDER = 'Pdfs'
+
+class LocalFileCache:
+    # stored files already sit on local disk, fetching one is just its path
+    def __init__(self, storage):
+        self.storage = storage
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def fetch(self, file_id):
+        found = self.storage.has_object(file_id)
+        with self.lock:
+            if found:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return self.storage.object_path(file_id) if found else None
+
+    def read_bytes(self, file_id):
+        path = self.fetch(file_id)
+        if not path:
+            return None
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            # deleted between fetch and open
+            return None
+
+    def read_bytes_many(self, file_ids):
+        return self.storage.run_many([(self.read_bytes, file_id) for file_id in file_ids])
+
+    def put(self, file_id, local_path):
+        pass
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0,
+                'entries': len(self.storage.index)
+            }
+
+class LocalStorage(StorageBackend):
+    # one file per id under objects/, names and folders in index.json. Point STORAGE_DIR at a
+    # co-located disk or a mounted object store to skip the WAN round trips and quotas of Drive
+    name = 'local'
+
+    def __init__(self, root=STORAGE_DIR):
+        super().__init__()
+        self.root = root
+        self.lock = threading.Lock()
+        self.index = {}
+        # (folder, name) -> latest file id with that name
+        self.names = {}
+        self.load_index()
+        self.file_cache = LocalFileCache(self)
+
+    def index_path(self):
+        return os.path.join(self.root, INDEX_FILE)
+
+    def object_path(self, file_id):
+        return os.path.join(self.root, 'objects', file_id)
+
+    def load_index(self):
+        os.makedirs(os.path.join(self.root, 'objects'), exist_ok=True)
+        for name in os.listdir(os.path.join(self.root, 'objects')):
+            if name.endswith('.part'):
+                os.remove(os.path.join(self.root, 'objects', name))
+        try:
+            with open(self.index_path(), 'r') as f:
+                self.index = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.index = {}
+        for file_id, entry in self.index.items():
+            self.names[(entry['folder'], entry['name'])] = file_id
+
+    def save_index(self):
+        tmp_path = f"{self.index_path()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.index, f)
+        os.replace(tmp_path, self.index_path())
+
+    def has_object(self, file_id):
+        # ids reach here from URLs too, never let one name a path
+        if not re.fullmatch(r'[\w-]+', file_id or ''):
+            return False
+        return file_id in self.index and os.path.exists(self.object_path(file_id))
+
+    def write_object(self, file_id, local_path):
+        part_path = f"{self.object_path(file_id)}.{uuid.uuid4().hex}.part"
+        try:
+            shutil.copyfile(local_path, part_path)
+            os.replace(part_path, self.object_path(file_id))
+        finally:
+            if os.path.exists(part_path): os.remove(part_path)
+
+    def copy_object(self, file_id, output_filename):
+        shutil.copyfile(self.object_path(file_id), output_filename)
+
+    def remove_object(self, file_id):
+        try:
+            os.remove(self.object_path(file_id))
+        except FileNotFoundError:
+            pass
+
+    def put_file(self, folder, name, local_path, file_id=None):
+        file_id = file_id or uuid.uuid4().hex
+        self.write_object(file_id, local_path)
+        with self.lock:
+            self.index[file_id] = {'name': name, 'folder': folder}
+            self.names[(folder, name)] = file_id
+            self.save_index()
+        return file_id
+
+    def find_file(self, folder, name):
+        with self.lock:
+            file_id = self.names.get((folder, name))
+        return {'id': file_id, 'name': name} if file_id else None
+
+    def put_named_file(self, folder, name, local_path):
+        # overwritten in place, the id stays stable like a Drive update
+        existing_file = self.find_file(folder, name)
+        return self.put_file(folder, name, local_path, existing_file['id'] if existing_file else None)
+
+    def download_file(self, file_id, output_filename):
+        part_path = f"{output_filename}.{uuid.uuid4().hex[:8]}.download"
+        started = time.perf_counter()
+        try:
+            if not self.has_object(file_id):
+                raise FileNotFoundError(f"no stored file {file_id}")
+            self.copy_object(file_id, part_path)
+            size = os.path.getsize(part_path)
+            os.replace(part_path, output_filename)
+            self.transfer_stats.record('download', size, time.perf_counter() - started)
+            return True
+        except OSError as error:
+            print(f"Download error: {error}")
+            self.transfer_stats.record('download', 0, 0, ok=False)
+            return False
+        finally:
+            if os.path.exists(part_path): os.remove(part_path)
+
+    def delete_file(self, file_id):
+        with self.lock:
+            entry = self.index.pop(file_id, None)
+            if entry is None:
+                return False
+            key = (entry['folder'], entry['name'])
+            if self.names.get(key) == file_id:
+                del self.names[key]
+            self.save_index()
+        self.remove_object(file_id)
+        return True
+
+    def upload_pdf_file(self, filename):
+        try:
+            return self.put_file(PDF_FOLDER, filename, filename)
+        except OSError as error:
+            print(f"error has been occured in upload_pdf_file: {error}")
+            return None
+
+    def upload_image(self, image_path, mimetype='image/png', cache=True):
+        return self.put_file(IMG_FOLDER, os.path.basename(image_path), image_path)
+
+    def search_vector_zip(self):
+        return self.find_file(PDF_VECTOR_FOLDER, VECTOR_ZIP_NAME)
+
+    def upload_or_update_vector_zip(self, local_zip_path):
+        return self.put_named_file(PDF_VECTOR_FOLDER, VECTOR_ZIP_NAME, local_zip_path)
+
+    def list_vector_segments(self):
+        with self.lock:
+            files = [{'id': file_id, 'name': entry['name']} for file_id, entry in self.index.items()
+                     if entry['folder'] == PDF_VECTOR_FOLDER and entry['name'].startswith(VECTOR_SEGMENT_PREFIX)]
+        return sorted(files, key=lambda f: f['name'])
+
+    def upload_vector_segment(self, local_zip_path):
+        return self.put_file(PDF_VECTOR_FOLDER, os.path.basename(local_zip_path), local_zip_path)
+
+    def search_vector_img(self, file_path):
+        return self.find_file(IMG_FOLDER, file_path)
+
+    def upload_vector_img(self, file_path):
+        return self.put_named_file(IMG_FOLDER, file_path, file_path)
+
+class MemoryStorage(LocalStorage):
+    # everything in process memory and gone on exit: a fake for tests and offline benchmarks
+    name = 'memory'
+
+    def __init__(self):
+        self.blobs = {}
+        super().__init__(root=None)
+        # callers want file paths, so reads go through an on-disk cache like Drive's
+        self.file_cache = DriveFileCache(self, folder=tempfile.mkdtemp(prefix='memory_storage_'))
+
+    def load_index(self):
+        pass
+
+    def save_index(self):
+        pass
+
+    def has_object(self, file_id):
+        return file_id in self.blobs
+
+    def write_object(self, file_id, local_path):
+        with open(local_path, 'rb') as f:
+            self.blobs[file_id] = f.read()
+
+    def copy_object(self, file_id, output_filename):
+        data = self.blobs.get(file_id)
+        if data is None:
+            raise FileNotFoundError(f"no stored file {file_id}")
+        with open(output_filename, 'wb') as f:
+            f.write(data)
+
+    def remove_object(self, file_id):
+        self.blobs.pop(file_id, None)
@@ -0,0 +1,30 @@
+import os
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from InferenceBackend import PDF_EMBED_BATCH
+
+PDF_CHUNK_SIZE = int(os.getenv('PDF_CHUNK_SIZE', '1000'))
+PDF_CHUNK_OVERLAP = int(os.getenv('PDF_CHUNK_OVERLAP', '150'))
+MIN_CHUNK_CHARS = 40
+
+def chunk_pages(pages, base_metadata, chunk_size=PDF_CHUNK_SIZE, overlap=PDF_CHUNK_OVERLAP):
+    # split page by page so every chunk keeps the page it came from
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=overlap)
+    documents = []
+    for page_number, page in enumerate(pages, start=1):
+        for text in splitter.split_text(page.page_content or ''):
+            text = text.strip()
+            if len(text) < MIN_CHUNK_CHARS:
+                continue
+            documents.append(Document(
+                page_content=text,
+                metadata={**base_metadata, 'kind': 'chunk', 'page': page_number, 'chunkIndex': len(documents) + 1}
+            ))
+    return documents
+
+def embed_in_batches(embedding_model, texts, batch_size=PDF_EMBED_BATCH):
+    # one embed_documents call per batch keeps peak memory flat on long books
+    vectors = []
+    for start in range(0, len(texts), batch_size):
+        vectors.extend(embedding_model.embed_documents(texts[start:start + batch_size]))
+    return vectors
@@ -1,43 +1,79 @@
 import base64
 import io
 import os
-from langchain_huggingface import HuggingFaceEmbeddings, ChatHuggingFace, HuggingFaceEndpoint
+from langchain_huggingface import ChatHuggingFace, HuggingFaceEndpoint
 from langchain_community.document_loaders import PyPDFLoader
 import re 
 from langchain_community.vectorstores import FAISS
 from langchain_core.prompts import PromptTemplate
-import json
-import shutil
-import zipfile
 from langchain_core.documents import Document
-from pdf2image import convert_from_path
 import gc
+import shutil
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import numpy as np
 from datetime import date
+from PdfIndexManager import PdfIndexManager
+from PdfSegmentStore import PdfSegmentStore
+from AsyncRuntime import run_drive, run_model
+from LLMResponseCache import LLMResponseCache, CachedChatModel
+from IntentClassifier import classify_intent
+from SearchSessionStore import SearchSessionStore
+from StartupOrchestrator import LazyResource, LazyEmbeddings
+from InferenceBackend import load_bge
+from PdfChunker import chunk_pages, embed_in_batches
+from CoverStore import CoverStore
 VECTOR_ZIP_NAME = 'pdf_vectors_archive.zip'
 LOCAL_VECTOR_FOLDER = 'pdf_vectors_store'
-RESULT_JSON_FILE = 'result.json'
+PDF_BATCH_STAGE_WORKERS = int(os.getenv('PDF_BATCH_STAGE_WORKERS', '4'))
+PDF_BATCH_IO_WORKERS = int(os.getenv('PDF_BATCH_IO_WORKERS', '4'))
+PDF_BATCH_LLM_WORKERS = int(os.getenv('PDF_BATCH_LLM_WORKERS', '4'))
+# also index every page in chunks, not just the summary of the first pages
+PDF_CHUNK_INDEX = os.getenv('PDF_CHUNK_INDEX', 'false').lower() == 'true'
 
 class PDFEmbed:
-    def __init__(self, model_path, device, myDriveInst,repo_id):
+    def __init__(self, model_path, device, myDriveInst,repo_id, llm_cache=None, session_store=None, preload=True):
         self.model_path = model_path
         self.device = device
         self.myDrive = myDriveInst
         self.pdf_path_name = ''
-        self.embedding_model = HuggingFaceEmbeddings(
-            model_name=self.model_path,
-            model_kwargs={'device': device},
-            encode_kwargs={'normalize_embeddings': True}
-        )
-        self.llm = HuggingFaceEndpoint(
-            repo_id=repo_id,
+        self.repo_id = repo_id
+        self.embedding_model = LazyEmbeddings('bge', self.load_embedding_model)
+        self.chat_model = LazyResource('pdf_llm', self.load_chat_model)
+        self.llm_cache = llm_cache or LLMResponseCache()
+        self.llm_cache.set_embedder(self.embedding_model)
+        # both are exact-match only: volumes of one book share their front matter, and
+        # selections like "first one"/"second one" embed almost identically
+        self.summary_model = CachedChatModel(self.chat_model, self.llm_cache, 'pdf_summary', semantic=False)
+        self.router_model = CachedChatModel(self.chat_model, self.llm_cache, 'pdf_router', semantic=False)
+        self.intent_stats = {'rule': 0, 'llm': 0}
+        self.session_store = session_store or SearchSessionStore()
+        self.segment_store = PdfSegmentStore(LOCAL_VECTOR_FOLDER, self.embedding_model, self.myDrive)
+        self.index_manager = PdfIndexManager(self.segment_store, self.embedding_model)
+        self.cover_store = CoverStore(self.myDrive)
+        if preload:
+            self.load_index()
+
+    def load_embedding_model(self):
+        self.myDrive.download_model(self.model_path)
+        return load_bge(self.model_path, self.device)
+
+    def load_chat_model(self):
+        llm = HuggingFaceEndpoint(
+            repo_id=self.repo_id,
             task="text-generation",
             max_new_tokens=512,
             do_sample=False,
             repetition_penalty=1.03,
         )
-        self.chat_model = ChatHuggingFace(llm=self.llm)
+        return ChatHuggingFace(llm=llm)
+
+    def load_index(self):
+        if self.segment_store.read_manifest() is not None:
+            try:
+                self.index_manager.get()
+            except Exception as e:
+                print(f"error loading the pdf index at startup: {e}")
 
     def create_pdf_from_buffer(self, pdf_buffer, pdf_file_name):
         pdf_bytes = bytes(pdf_buffer)
@@ -56,17 +92,15 @@ class PDFEmbed:
         print('final_content','we camed2')
         return self.myDrive.upload_pdf_file(self.pdf_path_name)
 
-    def get_buffer_cover(self, fileId):
+    def create_pdf_from_file(self, local_path, pdf_file_name):
+        # the spool may be on another filesystem, where a rename cannot reach
+        shutil.move(local_path, pdf_file_name)
+        self.pdf_path_name = pdf_file_name
+        return self.myDrive.upload_pdf_file(self.pdf_path_name)
+
+    def get_buffer_cover(self, fileId, pdf_path=None):
         try:
-            pages = convert_from_path(self.pdf_path_name, first_page=1, last_page=1)
-            if not pages: return None
-            
-            cover_image = pages[0].resize((300, 400))
-            self.temp_filename = f"{fileId}_cover.png"
-            cover_image.save(self.temp_filename, format='PNG')
-            uploaded_cover_id = self.myDrive.upload_image(self.temp_filename)
-            if os.path.exists(self.temp_filename): os.remove(self.temp_filename)
-            return uploaded_cover_id
+            return self.cover_store.create(fileId, pdf_path or self.pdf_path_name)
         except Exception as e:
             print(f"error has been occured in get_buffer_cover: {e}")
             return None
@@ -92,11 +126,11 @@ class PDFEmbed:
         )
 
         ai_response_prompt = summary_prompt.invoke({'raw_text_context': text})
-        ai_response = self.chat_model.invoke(ai_response_prompt)
+        ai_response = self.summary_model.invoke(ai_response_prompt)
         return ai_response.content
 
-    def formatTheQuery(self, text):
-        if os.path.exists(RESULT_JSON_FILE):
+    def build_router_prompt(self, text, has_results):
+        if has_results:
             router_prompt = PromptTemplate(
                 template=("""
                 You are a strict Intent Classifier. You are NOT a chatbot. 
@@ -129,51 +163,88 @@ class PDFEmbed:
                 input_variables=["text"]
             )
 
-        response = self.chat_model.invoke(router_prompt.invoke({'text': text})).content.strip()
+        return router_prompt.invoke({'text': text})
+
+    def parse_router_response(self, content):
+        response = content.strip()
         response = response.replace('"', '').replace("'", "")
         
         if "NEGATIVE" in response: return response
         return "POSITIVE"
+
+    def fast_intent(self, text, history_results):
+        intent = classify_intent(text, bool(history_results), len(history_results or []))
+        self.intent_stats['rule' if intent else 'llm'] += 1
+        return intent
+
+    def formatTheQuery(self, text, history_results=None):
+        intent = self.fast_intent(text, history_results)
+        if intent:
+            return intent
+        response = self.router_model.invoke(self.build_router_prompt(text, bool(history_results)))
+        return self.parse_router_response(response.content)
+
+    async def aformatTheQuery(self, text, history_results=None):
+        intent = self.fast_intent(text, history_results)
+        if intent:
+            return intent
+        response = await self.router_model.ainvoke(self.build_router_prompt(text, bool(history_results)))
+        return self.parse_router_response(response.content)
     def getThePdfBytes(self,file_name):
         with open(file_name,'+rb') as f:
             pdf_bytes = f.read()
 
         pdf_bytes = base64.b64encode(pdf_bytes).decode('utf-8')
         return pdf_bytes
-    def handle_selection(self, index):
-        if not os.path.exists(RESULT_JSON_FILE):
+    def handle_selection(self, index, session_id=None, history_results=None, inline=True):
+        if history_results is None:
+            history_results = self.session_store.get(session_id)
+        if not history_results:
             return [] 
         try:
-            with open(RESULT_JSON_FILE, 'r') as f:
-                history_results = json.load(f)
-            
             if 0 <= index < len(history_results):
                 doc_data = history_results[index]
                 file_id = doc_data['metadata'].get('fileId')
                 file_name = doc_data['metadata'].get('fileName', 'downloaded_file.pdf')
                 
-                if file_id:
-                    self.myDrive.download_file(file_id, file_name)
-                pdfBytes = self.getThePdfBytes(file_name)
-                os.remove(RESULT_JSON_FILE)
-                os.remove(file_name)
+                if not file_id:
+                    return []
+                pdf_path = self.myDrive.file_cache.fetch(file_id)
+                if not pdf_path:
+                    return []
+                self.session_store.pop(session_id)
+                if not inline:
+                    # the caller streams the cached file instead of holding it base64-encoded
+                    return {'pdf_path': pdf_path, 'pdf_name': file_name, 'fileId': file_id}
+                pdfBytes = self.getThePdfBytes(pdf_path)
                 return {'pdfBytes':pdfBytes,'pdf_name':file_name}
             else:
                 return []
         except Exception as e:
             print(f"Error in handle_selection: {e}")
             return []
-    def createEmbedding(self, fileId):
-        loader = PyPDFLoader(self.pdf_path_name)
+    def parse_pdf(self, pdf_path):
+        loader = PyPDFLoader(pdf_path)
         all_pages = loader.load()
         total_pages_count = len(all_pages)
         
         pages_for_ai = all_pages[:10] if len(all_pages) > 10 else all_pages
         raw_text_context = " ".join([p.page_content for p in pages_for_ai])[:8000]
-        
-        clean_filename = os.path.basename(self.pdf_path_name)
+        if not PDF_CHUNK_INDEX:
+            del all_pages
+            all_pages = None
+        return total_pages_count, raw_text_context, all_pages
+
+    def build_documents(self, pdf_path, fileId, total_pages_count, ai_summary_text, cover_id, pages=None):
+        summary_doc = self.build_summary_document(pdf_path, fileId, total_pages_count, ai_summary_text, cover_id)
+        if not pages:
+            return [summary_doc]
+        base_metadata = {key: value for key, value in summary_doc.metadata.items() if key not in ('chunkIndex', 'kind')}
+        return [summary_doc] + chunk_pages(pages, base_metadata)
+
+    def build_summary_document(self, pdf_path, fileId, total_pages_count, ai_summary_text, cover_id):
+        clean_filename = os.path.basename(pdf_path)
         clean_filename_spaced = re.sub(r'[_\-\.]', ' ', clean_filename).replace("pdf", "")
-        ai_summary_text = self.getAIResponse(raw_text_context)
         
         final_content = (
             f"Book Title: {clean_filename_spaced}\n" 
@@ -181,91 +252,153 @@ class PDFEmbed:
             f"AI Analysis: {ai_summary_text}"
         )
         
-        summary_doc = Document(
+        return Document(
             page_content=final_content,
             metadata={
-                'coverPageid': self.get_buffer_cover(fileId),
+                'coverPageid': cover_id,
                 "fileId": fileId,
-                "fileName": self.pdf_path_name,
+                "fileName": pdf_path,
+                "kind": "summary",
                 "chunkIndex": 0,
                 "total_pages": total_pages_count, 
                 "date": str(date.today())
             }
         )
 
-        new_vector_store = FAISS.from_documents([summary_doc], self.embedding_model)
-        final_vector_store = None
-        drive_zip = self.myDrive.search_vector_zip()
-      
-
-        if drive_zip:
-            self.myDrive.download_file(drive_zip['id'], VECTOR_ZIP_NAME)
-            if os.path.exists(LOCAL_VECTOR_FOLDER):
-                shutil.rmtree(LOCAL_VECTOR_FOLDER)
-            with zipfile.ZipFile(VECTOR_ZIP_NAME, 'r') as zip_ref:
-                zip_ref.extractall(LOCAL_VECTOR_FOLDER)
-            try:
-                old_vector_store = FAISS.load_local(
-                    LOCAL_VECTOR_FOLDER, 
-                    self.embedding_model,
-                    allow_dangerous_deserialization=True 
-                )
-                old_vector_store.merge_from(new_vector_store)
-                final_vector_store = old_vector_store
-            except Exception as e:
-                final_vector_store = new_vector_store
+    def commit_documents(self, documents):
+        texts = [doc.page_content for doc in documents]
+        vectors = embed_in_batches(self.embedding_model, texts)
+        new_vector_store = FAISS.from_embeddings(
+            list(zip(texts, vectors)), self.embedding_model, metadatas=[doc.metadata for doc in documents]
+        )
+        segment_name = self.segment_store.append(new_vector_store)
+        self.index_manager.publish(segment_name, new_vector_store)
+        return segment_name
+
+    def createEmbedding(self, fileId, pdf_path=None):
+        pdf_path = pdf_path or self.pdf_path_name
+        # cover render and upload overlap with parsing and the LLM summary
+        cover_future = self.myDrive.transfer_pool.submit(self.get_buffer_cover, fileId, pdf_path)
+        try:
+            total_pages_count, raw_text_context, pages = self.parse_pdf(pdf_path)
+            ai_summary_text = self.getAIResponse(raw_text_context)
+            cover_id = cover_future.result()
+            documents = self.build_documents(
+                pdf_path, fileId, total_pages_count, ai_summary_text, cover_id, pages
+            )
+            self.commit_documents(documents)
+            self.cleanup()
+        finally:
+            # the cover render reads the same file, let it finish before the file goes
+            cover_future.result()
+            if os.path.exists(pdf_path): os.remove(pdf_path)
+            gc.collect()
+
+    def process_batch_item(self, pdf_source, pdf_file_name, io_pool, llm_pool):
+        if isinstance(pdf_source, (bytes, bytearray)):
+            with open(pdf_file_name, 'wb') as f:
+                f.write(pdf_source)
         else:
-            final_vector_store = new_vector_store
-
-        final_vector_store.save_local(LOCAL_VECTOR_FOLDER)
-        shutil.make_archive('upload_temp', 'zip', LOCAL_VECTOR_FOLDER)
-        self.myDrive.upload_or_update_vector_zip('upload_temp.zip')
-        self.cleanup()
-        del new_vector_store
-        del final_vector_store
-        del all_pages
-        os.remove(self.pdf_path_name)
+            shutil.move(pdf_source, pdf_file_name)
+        try:
+            upload_future = io_pool.submit(self.myDrive.upload_pdf_file, pdf_file_name)
+            total_pages_count, raw_text_context, pages = self.parse_pdf(pdf_file_name)
+            summary_future = llm_pool.submit(self.getAIResponse, raw_text_context)
+            fileId = upload_future.result()
+            if not fileId:
+                raise Exception("fail to upload the pdf.")
+            cover_future = io_pool.submit(self.get_buffer_cover, fileId, pdf_file_name)
+            return self.build_documents(
+                pdf_file_name, fileId, total_pages_count, summary_future.result(), cover_future.result(), pages
+            )
+        finally:
+            if os.path.exists(pdf_file_name): os.remove(pdf_file_name)
+
+    def createEmbeddingBatch(self, pdfs):
+        documents = []
+        indexed = []
+        failed = []
+        unique_pdfs = {}
+        for pdf_source, pdf_file_name in pdfs:
+            if pdf_file_name in unique_pdfs:
+                failed.append({'pdf_name': pdf_file_name, 'error': 'duplicate pdf_name in batch'})
+                continue
+            unique_pdfs[pdf_file_name] = pdf_source
+        with ThreadPoolExecutor(max_workers=PDF_BATCH_STAGE_WORKERS) as stage_pool, \
+                ThreadPoolExecutor(max_workers=PDF_BATCH_IO_WORKERS) as io_pool, \
+                ThreadPoolExecutor(max_workers=PDF_BATCH_LLM_WORKERS) as llm_pool:
+            futures = {
+                stage_pool.submit(self.process_batch_item, pdf_source, pdf_file_name, io_pool, llm_pool): pdf_file_name
+                for pdf_file_name, pdf_source in unique_pdfs.items()
+            }
+            for future in as_completed(futures):
+                try:
+                    documents.extend(future.result())
+                    indexed.append(futures[future])
+                except Exception as e:
+                    print(f"error has been occured in createEmbeddingBatch for {futures[future]}: {e}")
+                    failed.append({'pdf_name': futures[future], 'error': str(e)})
+
+        if documents:
+            self.commit_documents(documents)
         gc.collect()
+        return {
+            'indexed': [os.path.basename(pdf_file_name) for pdf_file_name in indexed],
+            'failed': failed
+        }
 
-    def search_query(self, query_text, k=3):
-        intent = self.formatTheQuery(query_text)
+    def selection_index(self, intent):
         if "NEGATIVE" in intent:
             try:
                 match = re.search(r'\d+', intent)
                 
                 if match:
-                    index = int(match.group())
-                    return self.handle_selection(index)
+                    return int(match.group())
                     
             except Exception as e:
                 print(f"Parsing Error: {e}")
+        return None
 
+    def search_query(self, query_text, k=3, session_id=None, inline_pdf=True):
+        history_results = self.session_store.get(session_id)
+        index = self.selection_index(self.formatTheQuery(query_text, history_results))
+        if index is not None:
+            return self.handle_selection(index, session_id, history_results, inline_pdf)
+        return self.run_search(query_text, k, session_id)
 
-        if not os.path.exists(LOCAL_VECTOR_FOLDER):
-            drive_zip = self.myDrive.search_vector_zip()
-            if drive_zip:
-                self.myDrive.download_file(drive_zip['id'], VECTOR_ZIP_NAME)
-                with zipfile.ZipFile(VECTOR_ZIP_NAME, 'r') as zip_ref:
-                    zip_ref.extractall(LOCAL_VECTOR_FOLDER)
-            else:
-                return [] 
+    async def asearch_query(self, query_text, k=3, session_id=None, inline_pdf=True):
+        history_results = await run_drive(self.session_store.get, session_id)
+        index = self.selection_index(await self.aformatTheQuery(query_text, history_results))
+        if index is not None:
+            return await run_drive(self.handle_selection, index, session_id, history_results, inline_pdf)
+        # Drive downloads stay on the drive pool, only the index search takes a model slot
+        if not await run_drive(self.ensure_synced):
+            return []
+        results = await run_model(self.index_manager.search, query_text, k=k)
+        await run_drive(self.remember_results, session_id, results)
+        return results
 
-        vector_store = FAISS.load_local(
-            LOCAL_VECTOR_FOLDER, 
-            self.embedding_model,
-            allow_dangerous_deserialization=True
-        )
-        results = vector_store.max_marginal_relevance_search(query_text, k=k, fetch_k=10)
+    def ensure_synced(self):
+        if self.segment_store.read_manifest() is None:
+            return self.segment_store.sync_from_drive() is not None
+        return True
+
+    def run_search(self, query_text, k=3, session_id=None):
+        if not self.ensure_synced():
+            return []
+
+        results = self.index_manager.search(query_text, k=k)
+        self.remember_results(session_id, results)
+        return results
+
+    def remember_results(self, session_id, results):
         serializable_results = []
         for doc in results:
             serializable_results.append({
                 "page_content": doc.page_content,
                 "metadata": doc.metadata
             })
-        with open(RESULT_JSON_FILE, 'w') as f:
-            json.dump(serializable_results, f)
-            
-        return results
+        self.session_store.put(session_id, serializable_results)
 
     def cleanup(self):
         try:
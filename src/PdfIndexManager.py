@@ -0,0 +1,145 @@
+import os
+import threading
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from PdfKeywordIndex import KeywordIndex
+
+PDF_CHUNK_HITS = int(os.getenv('PDF_CHUNK_HITS', '50'))
+PDF_HIT_BONUS = float(os.getenv('PDF_HIT_BONUS', '0.1'))
+# fuse BM25 over the document text with the dense results
+PDF_HYBRID_SEARCH = os.getenv('PDF_HYBRID_SEARCH', 'true').lower() == 'true'
+PDF_RRF_K = int(os.getenv('PDF_RRF_K', '60'))
+
+def rank_files(hits, bonus=PDF_HIT_BONUS):
+    # a book ranks by its best chunk plus a small bonus for its next two matching chunks
+    by_file = {}
+    for doc, score in hits:
+        file_id = doc.metadata.get('fileId') or doc.metadata.get('fileName')
+        by_file.setdefault(file_id, []).append((score, doc))
+    ranked = []
+    for file_id, matches in by_file.items():
+        matches.sort(key=lambda match: match[0], reverse=True)
+        best_score, best_doc = matches[0]
+        score = best_score + bonus * sum(match_score for match_score, _ in matches[1:3])
+        pages = {doc.metadata['page'] for _, doc in matches if doc.metadata.get('page')}
+        ranked.append((file_id, score, best_doc, pages))
+    ranked.sort(key=lambda item: item[1], reverse=True)
+    return ranked
+
+def fuse_rankings(rankings, k, rrf_k=PDF_RRF_K):
+    # reciprocal rank fusion, the first ranking that has a book supplies its metadata
+    fused = {}
+    for ranking in rankings:
+        for rank, (file_id, _, doc, pages) in enumerate(ranking, start=1):
+            entry = fused.setdefault(file_id, {'score': 0.0, 'doc': doc, 'pages': set()})
+            entry['score'] += 1 / (rrf_k + rank)
+            entry['pages'].update(pages)
+    return sorted(fused.values(), key=lambda entry: entry['score'], reverse=True)[:k]
+
+def to_results(entries):
+    results = []
+    for entry in entries:
+        metadata = {**entry['doc'].metadata, 'score': round(entry['score'], 4), 'matchedPages': sorted(entry['pages'])}
+        results.append(Document(page_content=entry['doc'].page_content, metadata=metadata))
+    return results
+
+def aggregate_hits(hits, k, bonus=PDF_HIT_BONUS):
+    # squared L2 between normalized vectors -> cosine similarity
+    ranked = rank_files([(doc, 1 - float(distance) / 2) for doc, distance in hits], bonus)
+    return to_results({'score': score, 'doc': doc, 'pages': pages} for _, score, doc, pages in ranked[:k])
+
+class PdfIndexManager:
+    def __init__(self, segment_store, embedding_model):
+        self.segment_store = segment_store
+        self.embedding_model = embedding_model
+        self.lock = threading.Lock()
+        self.reload_lock = threading.Lock()
+        self.segments = {}
+        self.keyword_index = KeywordIndex()
+        self.segment_files = {}
+        self.generation = None
+        self.hits = 0
+        self.reloads = 0
+
+    def get(self, preloaded=None):
+        manifest = self.segment_store.read_manifest()
+        generation = manifest['generation'] if manifest else None
+        with self.lock:
+            if self.segments and (generation is None or generation == self.generation):
+                self.hits += 1
+                return list(self.segments.values())
+        if generation is None:
+            return []
+        with self.reload_lock:
+            with self.lock:
+                if self.segments and generation == self.generation:
+                    self.hits += 1
+                    return list(self.segments.values())
+                current = dict(self.segments)
+            if preloaded:
+                current.update(preloaded)
+            segments = {}
+            try:
+                for segment in manifest['segments']:
+                    name = segment['name']
+                    if name in current:
+                        segments[name] = current[name]
+                        continue
+                    segments[name] = FAISS.load_local(
+                        self.segment_store.segment_path(name),
+                        self.embedding_model,
+                        allow_dangerous_deserialization=True
+                    )
+            except Exception as e:
+                # a compaction may have swapped the manifest under us, keep serving the old view
+                print(f"error reloading pdf segments: {e}")
+                with self.lock:
+                    return list(self.segments.values())
+            if PDF_HYBRID_SEARCH:
+                self.keyword_index.sync(segments)
+            segment_files = {
+                name: self.segment_files.get(name) or {
+                    doc.metadata.get('fileId') for doc in vector_store.docstore._dict.values()
+                }
+                for name, vector_store in segments.items()
+            }
+            with self.lock:
+                self.segments = segments
+                self.segment_files = segment_files
+                self.generation = generation
+                self.reloads += 1
+            return list(segments.values())
+
+    def publish(self, name, vector_store):
+        return self.get(preloaded={name: vector_store})
+
+    def search(self, query_text, k=3, fetch_k=PDF_CHUNK_HITS):
+        vector_stores = self.get()
+        if not vector_stores:
+            return []
+        query_vec = self.embedding_model.embed_query(query_text)
+        hits = []
+        for vector_store in vector_stores:
+            hits.extend(vector_store.similarity_search_with_score_by_vector(query_vec, k=fetch_k))
+        # summaries and page chunks of the same book collapse into one result
+        if not PDF_HYBRID_SEARCH:
+            return aggregate_hits(hits, k)
+        dense = rank_files([(doc, 1 - float(distance) / 2) for doc, distance in hits])
+        keyword = rank_files(self.keyword_index.search(query_text, fetch_k))
+        return to_results(fuse_rankings([dense, keyword], k))
+
+    def has_file(self, file_id):
+        self.get()
+        with self.lock:
+            return any(file_id in file_ids for file_ids in self.segment_files.values())
+
+    def stats(self):
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'reloads': self.reloads,
+                'generation': self.generation,
+                'segments': len(self.segments),
+                'keyword': self.keyword_index.stats(),
+                'compactions': self.segment_store.compactions
+            }
@@ -0,0 +1,118 @@
+import math
+import os
+import re
+import threading
+from collections import Counter
+import numpy as np
+
+BM25_K1 = float(os.getenv('PDF_BM25_K1', '1.2'))
+BM25_B = float(os.getenv('PDF_BM25_B', '0.75'))
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall((text or '').lower())
+
+class SegmentTerms:
+    # postings of one immutable FAISS segment, built once when the segment is loaded
+    def __init__(self, documents):
+        self.doc_ids = list(documents)
+        self.documents = documents
+        self.lengths = np.zeros(len(self.doc_ids), dtype=np.float32)
+        postings = {}
+        for position, doc_id in enumerate(self.doc_ids):
+            terms = Counter(tokenize(documents[doc_id].page_content))
+            self.lengths[position] = sum(terms.values())
+            for term, count in terms.items():
+                postings.setdefault(term, []).append((position, count))
+        self.postings = {
+            term: (np.array([p for p, _ in entries], dtype=np.int64), np.array([c for _, c in entries], dtype=np.float32))
+            for term, entries in postings.items()
+        }
+
+        # this segment's share of the corpus statistics
+        self.frequency = {term: len(positions) for term, (positions, _) in self.postings.items()}
+        self.total_length = float(self.lengths.sum())
+        self.norm_cache = None
+
+    def norms(self, average_length):
+        # the length part of the BM25 denominator, redone when a sync moves the corpus average
+        cached = self.norm_cache
+        if cached is None or cached[0] != average_length:
+            cached = (average_length, BM25_K1 * (1 - BM25_B + BM25_B * self.lengths / average_length))
+            self.norm_cache = cached
+        return cached[1]
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+def idf(doc_count, frequency):
+    return math.log(1 + (doc_count - frequency + 0.5) / (frequency + 0.5))
+
+class KeywordIndex:
+    # corpus statistics are running totals: a sync adds the new segments' counts and subtracts the
+    # removed ones'. idf is computed per query term at search time
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.segments = {}
+        self.document_frequency = Counter()
+        self.doc_count = 0
+        self.total_length = 0.0
+        self.builds = 0
+
+    def sync(self, vector_stores):
+        # vector_stores: segment name -> FAISS store; only segments not seen before are tokenized
+        with self.lock:
+            current = self.segments
+        added = {
+            name: SegmentTerms(dict(vector_store.docstore._dict))
+            for name, vector_store in vector_stores.items() if name not in current
+        }
+        self.builds += len(added)
+        with self.lock:
+            current = self.segments
+            removed = [current[name] for name in current if name not in vector_stores]
+            for segment in removed:
+                self.document_frequency.subtract(segment.frequency)
+                self.doc_count -= len(segment)
+                self.total_length -= segment.total_length
+            for segment in added.values():
+                self.document_frequency.update(segment.frequency)
+                self.doc_count += len(segment)
+                self.total_length += segment.total_length
+            for segment in removed:
+                for term in segment.frequency:
+                    if self.document_frequency[term] <= 0:
+                        del self.document_frequency[term]
+            # searches keep the dict they started with, a sync swaps in a new one
+            self.segments = {name: added[name] if name in added else current[name] for name in vector_stores}
+
+    def search(self, query_text, k=10):
+        with self.lock:
+            segments = self.segments
+            doc_count = self.doc_count
+            average_length = max(self.total_length / max(doc_count, 1), 1e-9)
+            weights = {
+                term: idf(doc_count, self.document_frequency[term])
+                for term in set(tokenize(query_text)) if self.document_frequency.get(term, 0) > 0
+            }
+        if not weights:
+            return []
+        results = []
+        for segment in segments.values():
+            scores = np.zeros(len(segment), dtype=np.float32)
+            norms = segment.norms(average_length)
+            for term, weight in weights.items():
+                if term not in segment.postings:
+                    continue
+                positions, counts = segment.postings[term]
+                scores[positions] += weight * counts * (BM25_K1 + 1) / (counts + norms[positions])
+            top = np.flatnonzero(scores)
+            if len(top) > k:
+                top = top[np.argpartition(scores[top], -k)[-k:]]
+            results.extend((segment.documents[segment.doc_ids[position]], float(scores[position])) for position in top)
+        results.sort(key=lambda item: item[1], reverse=True)
+        return results[:k]
+
+    def stats(self):
+        with self.lock:
+            return {'documents': self.doc_count, 'terms': len(self.document_frequency), 'segment_builds': self.builds}
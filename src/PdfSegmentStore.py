@@ -0,0 +1,220 @@
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+import zipfile
+from langchain_community.vectorstores import FAISS
+
+MANIFEST_FILE = 'manifest.json'
+LEGACY_SEGMENT = 'legacy'
+SEGMENT_PREFIX = 'pdf_segment_'
+# a run of this many neighbouring segments of similar size is merged into one
+COMPACT_THRESHOLD = int(os.getenv('PDF_SEGMENT_COMPACT_THRESHOLD', '8'))
+# "similar": the largest in a run is at most this many times the smallest
+COMPACT_SIZE_RATIO = float(os.getenv('PDF_SEGMENT_COMPACT_RATIO', '4'))
+
+def segment_span(name):
+    # (first, last) append time a segment holds; compacted segments are named first-last_hex
+    if name == LEGACY_SEGMENT:
+        return 0, 0
+    first, _, last = name.split('_')[0].partition('-')
+    return int(first), int(last or first)
+
+def superseded(segments):
+    # a segment whose span lies inside another's was merged into it, even if it is still on Drive
+    spans = {s['name']: segment_span(s['name']) for s in segments}
+    return {
+        name for name, (first, last) in spans.items()
+        if any(other != name and o_first <= first and last <= o_last and (o_first, o_last) != (first, last)
+               for other, (o_first, o_last) in spans.items())
+    }
+
+class PdfSegmentStore:
+    def __init__(self, folder, embedding_model, myDriveInst):
+        self.folder = folder
+        self.embedding_model = embedding_model
+        self.myDrive = myDriveInst
+        self.lock = threading.Lock()
+        self.compaction_lock = threading.Lock()
+        self.compactions = 0
+        self.migrate_legacy_folder()
+
+    def manifest_path(self):
+        return os.path.join(self.folder, MANIFEST_FILE)
+
+    def segment_path(self, name):
+        return os.path.join(self.folder, name)
+
+    def read_manifest(self):
+        try:
+            with open(self.manifest_path(), 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def write_manifest(self, segments):
+        manifest = {'generation': str(time.time_ns()), 'segments': segments}
+        os.makedirs(self.folder, exist_ok=True)
+        tmp_path = f"{self.manifest_path()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self.manifest_path())
+        return manifest
+
+    def migrate_legacy_folder(self):
+        # stores written before segments existed keep index.faiss/index.pkl at the folder root
+        if self.read_manifest() is not None:
+            return
+        root_index = os.path.join(self.folder, 'index.faiss')
+        if not os.path.exists(root_index):
+            return
+        legacy_path = self.segment_path(LEGACY_SEGMENT)
+        os.makedirs(legacy_path, exist_ok=True)
+        for file_name in ('index.faiss', 'index.pkl'):
+            src = os.path.join(self.folder, file_name)
+            if os.path.exists(src):
+                os.replace(src, os.path.join(legacy_path, file_name))
+        self.write_manifest([{'name': LEGACY_SEGMENT, 'drive_id': None}])
+
+    def extract_zip(self, zip_path, name):
+        target = self.segment_path(name)
+        if os.path.exists(target):
+            shutil.rmtree(target)
+        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+            zip_ref.extractall(target)
+        os.remove(zip_path)
+
+    def sync_from_drive(self):
+        remote = []
+        legacy_zip = self.myDrive.search_vector_zip()
+        if legacy_zip:
+            remote.append({'name': LEGACY_SEGMENT, 'drive_id': legacy_zip['id']})
+        for f in self.myDrive.list_vector_segments():
+            name = f['name'][len(SEGMENT_PREFIX):-len('.zip')]
+            remote.append({'name': name, 'drive_id': f['id']})
+        if not remote:
+            return None
+        # old segments stay on Drive until a compaction has published their replacement
+        dropped = superseded(remote)
+        remote = sorted((segment for segment in remote if segment['name'] not in dropped), key=lambda s: segment_span(s['name']))
+
+        with self.lock:
+            for segment in remote:
+                if os.path.exists(os.path.join(self.segment_path(segment['name']), 'index.faiss')):
+                    continue
+                zip_path = f"{segment['name']}_download.zip"
+                if self.myDrive.download_file(segment['drive_id'], zip_path):
+                    self.extract_zip(zip_path, segment['name'])
+            return self.write_manifest(remote)
+
+    def append(self, vector_store):
+        if self.read_manifest() is None:
+            self.sync_from_drive()
+        name = f"{time.time_ns()}_{uuid.uuid4().hex[:8]}"
+        drive_id = self.write_segment(name, vector_store)
+        with self.lock:
+            manifest = self.read_manifest() or {'segments': []}
+            segments = manifest['segments'] + [{'name': name, 'drive_id': drive_id}]
+            self.write_manifest(segments)
+        if len(segments) >= COMPACT_THRESHOLD:
+            self.compact_in_background()
+        return name
+
+    def write_segment(self, name, vector_store):
+        vector_store.save_local(self.segment_path(name))
+        archive_base = f"{SEGMENT_PREFIX}{name}"
+        zip_path = shutil.make_archive(archive_base, 'zip', self.segment_path(name))
+        try:
+            return self.myDrive.upload_vector_segment(zip_path)
+        finally:
+            if os.path.exists(zip_path): os.remove(zip_path)
+
+    def compact_in_background(self):
+        if self.compaction_lock.locked():
+            return
+        threading.Thread(target=self.compact, daemon=True).start()
+
+    def segment_size(self, name):
+        # None when the segment is not on local disk, it cannot be merged then
+        try:
+            return os.path.getsize(os.path.join(self.segment_path(name), 'index.faiss'))
+        except OSError:
+            return None
+
+    def pick_run(self, segments):
+        # the oldest run of COMPACT_THRESHOLD neighbouring segments of similar size. Merging only
+        # neighbours keeps every segment a contiguous span of appends. A merged segment is at least
+        # COMPACT_THRESHOLD / COMPACT_SIZE_RATIO times the largest in its run (2x by default), so it
+        # does not rejoin the one-PDF segments after it and each document is rewritten O(log n) times
+        sizes = [self.segment_size(s['name']) for s in segments]
+        for start in range(len(segments)):
+            if sizes[start] is None:
+                continue
+            low = high = sizes[start]
+            end = start + 1
+            while end < len(segments) and sizes[end] is not None:
+                low, high = min(low, sizes[end]), max(high, sizes[end])
+                if high > COMPACT_SIZE_RATIO * low:
+                    break
+                end += 1
+            if end - start >= COMPACT_THRESHOLD:
+                return segments[start:end]
+        return None
+
+    def compact(self):
+        if not self.compaction_lock.acquire(blocking=False):
+            return
+        try:
+            while True:
+                manifest = self.read_manifest()
+                merged_segments = self.pick_run(manifest['segments']) if manifest else None
+                if not merged_segments:
+                    return
+                self.compact_run(merged_segments)
+                self.compactions += 1
+        except Exception as e:
+            print(f"error has been occured in compact: {e}")
+        finally:
+            self.compaction_lock.release()
+
+    def compact_run(self, merged_segments):
+        merged_store = None
+        for segment in merged_segments:
+            store = FAISS.load_local(
+                self.segment_path(segment['name']),
+                self.embedding_model,
+                allow_dangerous_deserialization=True
+            )
+            if merged_store is None:
+                merged_store = store
+            else:
+                merged_store.merge_from(store)
+
+        # named after the span it covers, so a node syncing from Drive before the old
+        # segments are deleted there knows to skip them (see superseded)
+        first, last = segment_span(merged_segments[0]['name'])[0], segment_span(merged_segments[-1]['name'])[1]
+        name = f"{first}-{last}_{uuid.uuid4().hex[:8]}"
+        drive_id = self.write_segment(name, merged_store)
+        merged_names = {s['name'] for s in merged_segments}
+        with self.lock:
+            current = self.read_manifest() or {'segments': []}
+            # the merged segment takes the run's place, segments appended meanwhile stay after it
+            segments = []
+            for segment in current['segments']:
+                if segment['name'] not in merged_names:
+                    segments.append(segment)
+                elif name not in [s['name'] for s in segments]:
+                    segments.append({'name': name, 'drive_id': drive_id})
+            self.write_manifest(segments)
+
+        for segment in merged_segments:
+            shutil.rmtree(self.segment_path(segment['name']), ignore_errors=True)
+            drive_id = segment.get('drive_id')
+            if drive_id is None and segment['name'] == LEGACY_SEGMENT:
+                legacy_zip = self.myDrive.search_vector_zip()
+                drive_id = legacy_zip['id'] if legacy_zip else None
+            if drive_id:
+                self.myDrive.delete_file(drive_id)
+        print(f"compacted {len(merged_segments)} pdf segments into {name}")
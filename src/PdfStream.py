@@ -0,0 +1,51 @@
+import os
+import re
+from urllib.parse import quote
+
+PDF_STREAM_CHUNK = int(os.getenv('PDF_STREAM_CHUNK', str(256 * 1024)))
+RANGE_PATTERN = re.compile(r'bytes=(\d*)-(\d*)')
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+def parse_range(header, size):
+    # a single byte range, (start, end) inclusive; None means the whole file
+    if not header:
+        return None
+    match = RANGE_PATTERN.fullmatch(header.strip())
+    if not match or match.groups() == ('', ''):
+        # multi-range or other units, answering with the whole file is allowed
+        return None
+    first, last = match.groups()
+    if not first:
+        suffix = int(last)
+        if suffix == 0 or size == 0:
+            raise RangeNotSatisfiable()
+        return max(size - suffix, 0), size - 1
+    start = int(first)
+    if last and int(last) < start:
+        # syntactically invalid, RFC 7233 says to ignore the header
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable()
+    end = min(int(last), size - 1) if last else size - 1
+    return start, end
+
+def iter_file(f, start, length, chunk_size=PDF_STREAM_CHUNK):
+    # takes an open file so a cache eviction during the response cannot cut it short
+    try:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            data = f.read(min(chunk_size, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+    finally:
+        f.close()
+
+def content_disposition(file_name, disposition='inline'):
+    name = os.path.basename(file_name or 'document.pdf')
+    fallback = name.encode('ascii', 'ignore').decode().replace('"', '') or 'document.pdf'
+    return f"{disposition}; filename=\"{fallback}\"; filename*=UTF-8''{quote(name)}"
@@ -1,14 +1,44 @@
+import asyncio
 from langgraph.checkpoint.postgres import PostgresSaver
-from psycopg_pool import ConnectionPool
+from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+from psycopg_pool import ConnectionPool, AsyncConnectionPool
 
 class PersistentMem:
     def __init__(self,DB_URI):
         self.DB_URI = DB_URI
         pool = ConnectionPool(conninfo=DB_URI,kwargs={"autocommit": True})
+        self.pool = pool
         self.checkpointer = PostgresSaver(pool)
         self.checkpointer.setup()  
+        self.async_checkpointer = None
+        self.async_lock = asyncio.Lock()
     def postgresDB(self):
         return self.checkpointer
 
+    async def async_postgresDB(self):
+        # the async pool has to be opened inside the running event loop
+        if self.async_checkpointer is not None:
+            return self.async_checkpointer
+        # concurrent first requests would each open a pool, only one would ever be closed
+        async with self.async_lock:
+            if self.async_checkpointer is None:
+                pool = AsyncConnectionPool(conninfo=self.DB_URI, kwargs={"autocommit": True}, open=False)
+                await pool.open()
+                checkpointer = AsyncPostgresSaver(pool)
+                try:
+                    await checkpointer.setup()
+                except Exception:
+                    await pool.close()
+                    raise
+                self.async_pool = pool
+                self.async_checkpointer = checkpointer
+        return self.async_checkpointer
+
+    async def close_async(self):
+        async with self.async_lock:
+            if self.async_checkpointer is not None:
+                await self.async_pool.close()
+                self.async_checkpointer = None
+
+ 
  
-  
\ No newline at end of file
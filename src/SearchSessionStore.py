@@ -0,0 +1,95 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from psycopg.types.json import Jsonb
+
+SEARCH_SESSION_TTL = float(os.getenv('SEARCH_SESSION_TTL', '1800'))
+SEARCH_SESSION_MAX = int(os.getenv('SEARCH_SESSION_MAX', '10000'))
+
+class SearchSessionStore:
+    def __init__(self, pool=None, ttl=SEARCH_SESSION_TTL, max_sessions=SEARCH_SESSION_MAX):
+        self.pool = pool
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.lock = threading.Lock()
+        self.sessions = OrderedDict()
+        if self.pool is not None:
+            self.setup()
+
+    def attach(self, pool):
+        # the Postgres pool may only exist once startup has connected
+        self.pool = pool
+        self.setup()
+
+    def setup(self):
+        with self.pool.connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS pdf_search_sessions ("
+                "session_id TEXT PRIMARY KEY, results JSONB NOT NULL, expires_at TIMESTAMPTZ NOT NULL)"
+            )
+
+    def put(self, session_id, results):
+        # no shared fallback key: without an id two clients would pick from each other's results
+        if not session_id:
+            return
+        with self.lock:
+            self.sessions.pop(session_id, None)
+            self.sessions[session_id] = (time.monotonic() + self.ttl, results)
+            while len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+        if self.pool is not None:
+            try:
+                with self.pool.connection() as conn:
+                    conn.execute(
+                        "INSERT INTO pdf_search_sessions (session_id, results, expires_at) "
+                        "VALUES (%s, %s, now() + make_interval(secs => %s)) "
+                        "ON CONFLICT (session_id) DO UPDATE SET results = EXCLUDED.results, expires_at = EXCLUDED.expires_at",
+                        (session_id, Jsonb(results), self.ttl)
+                    )
+            except Exception as e:
+                print(f"error persisting search session {session_id}: {e}")
+
+    def get(self, session_id):
+        if not session_id:
+            return None
+        with self.lock:
+            entry = self.sessions.get(session_id)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    return entry[1]
+                del self.sessions[session_id]
+        if self.pool is None:
+            return None
+        # another worker (or a restart) may have stored it
+        try:
+            with self.pool.connection() as conn:
+                row = conn.execute(
+                    "SELECT results, EXTRACT(EPOCH FROM expires_at - now()) FROM pdf_search_sessions "
+                    "WHERE session_id = %s AND expires_at > now()",
+                    (session_id,)
+                ).fetchone()
+        except Exception as e:
+            print(f"error loading search session {session_id}: {e}")
+            return None
+        if row is None:
+            return None
+        with self.lock:
+            self.sessions[session_id] = (time.monotonic() + float(row[1]), row[0])
+        return row[0]
+
+    def pop(self, session_id):
+        if not session_id:
+            return
+        with self.lock:
+            self.sessions.pop(session_id, None)
+        if self.pool is not None:
+            try:
+                with self.pool.connection() as conn:
+                    conn.execute("DELETE FROM pdf_search_sessions WHERE session_id = %s", (session_id,))
+            except Exception as e:
+                print(f"error deleting search session {session_id}: {e}")
+
+    def stats(self):
+        with self.lock:
+            return {'sessions': len(self.sessions), 'persistent': self.pool is not None}
@@ -0,0 +1,163 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from langchain_core.embeddings import Embeddings
+from AsyncRuntime import run_model
+
+STARTUP_WORKERS = int(os.getenv('STARTUP_WORKERS', '4'))
+
+class LazyResource:
+    # builds the wrapped object on first use and proxies attribute access to it
+    def __init__(self, name, loader):
+        self._name = name
+        self._loader = loader
+        self._value = None
+        self._seconds = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        if self._value is None:
+            with self._lock:
+                if self._value is None:
+                    started = time.perf_counter()
+                    value = self._loader()
+                    self._seconds = time.perf_counter() - started
+                    print(f"loaded {self._name} in {self._seconds:.2f}s")
+                    self._value = value
+        return self._value
+
+    async def aget(self):
+        # the first load can take seconds, keep it off the event loop
+        if self._value is None:
+            await run_model(self.get)
+        return self._value
+
+    @property
+    def loaded(self):
+        return self._value is not None
+
+    def stats(self):
+        return {'loaded': self.loaded, 'seconds': round(self._seconds, 3) if self._seconds is not None else None}
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.get(), name)
+
+class LazyEmbeddings(Embeddings):
+    # FAISS only calls embedding objects that are real Embeddings instances
+    def __init__(self, name, loader):
+        self.resource = LazyResource(name, loader)
+
+    def embed_documents(self, texts):
+        return self.resource.get().embed_documents(texts)
+
+    def embed_query(self, text):
+        return self.resource.get().embed_query(text)
+
+class StartupOrchestrator:
+    def __init__(self, workers=STARTUP_WORKERS):
+        self.workers = workers
+        self.steps = {}
+        self.futures = {}
+        self.timings = {}
+        self.resources = {}
+        self.lock = threading.Lock()
+        self.created = time.perf_counter()
+        self.started = None
+        self.finished = None
+        self.executor = None
+
+    def step(self, name, fn, after=(), required=True):
+        self.steps[name] = {'fn': fn, 'after': tuple(after), 'required': required, 'scheduled': False}
+        self.futures[name] = Future()
+        self.timings[name] = {'status': 'pending', 'required': required}
+
+    def record(self, name, seconds):
+        # work that already happened before the orchestrator existed, e.g. imports
+        self.timings[name] = {'status': 'ok', 'required': False, 'start': 0.0, 'seconds': round(seconds, 3)}
+
+    def track(self, *resources):
+        for resource in resources:
+            self.resources[resource._name] = resource
+
+    def start(self):
+        if self.started is not None:
+            return
+        for name, step in self.steps.items():
+            for dep in step['after']:
+                if dep not in self.steps:
+                    raise ValueError(f"startup step {name} depends on unknown step {dep}")
+        self.started = time.perf_counter()
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='startup')
+        for name in list(self.steps):
+            self.schedule(name)
+
+    def schedule(self, name):
+        step = self.steps[name]
+        with self.lock:
+            if step['scheduled'] or not all(self.futures[dep].done() for dep in step['after']):
+                return
+            step['scheduled'] = True
+        failed = [dep for dep in step['after'] if self.futures[dep].exception() is not None]
+        if failed:
+            self.finish(name, None, error=RuntimeError(f"startup step {failed[0]} failed"))
+            return
+        self.executor.submit(self.run, name)
+
+    def run(self, name):
+        timing = self.timings[name]
+        begun = time.perf_counter()
+        timing['status'] = 'running'
+        timing['start'] = round(begun - self.started, 3)
+        try:
+            result = self.steps[name]['fn']()
+        except Exception as e:
+            print(f"startup step {name} failed: {e}")
+            self.finish(name, begun, error=e)
+            return
+        self.finish(name, begun, result=result)
+
+    def finish(self, name, begun, result=None, error=None):
+        timing = self.timings[name]
+        if begun is not None:
+            timing['seconds'] = round(time.perf_counter() - begun, 3)
+        if error is not None:
+            timing['status'] = 'failed'
+            timing['error'] = str(error)
+            self.futures[name].set_exception(error)
+        else:
+            timing['status'] = 'ok'
+            self.futures[name].set_result(result)
+        for other, step in self.steps.items():
+            if name in step['after']:
+                self.schedule(other)
+        with self.lock:
+            if self.finished is None and all(f.done() for f in self.futures.values()):
+                self.finished = time.perf_counter()
+                self.executor.shutdown(wait=False)
+
+    def wait(self, name, timeout=None):
+        return self.futures[name].result(timeout)
+
+    async def await_steps(self, *names):
+        await asyncio.gather(*[asyncio.wrap_future(self.futures[name]) for name in names])
+
+    def succeeded(self, name):
+        future = self.futures.get(name)
+        return future is not None and future.done() and future.exception() is None
+
+    def ready(self):
+        return all(self.succeeded(name) for name, step in self.steps.items() if step['required'])
+
+    def report(self):
+        end = self.finished or time.perf_counter()
+        return {
+            'ready': self.ready(),
+            'elapsed': round(end - self.created, 3),
+            'background': round(end - self.started, 3) if self.started is not None else None,
+            'steps': self.timings,
+            'models': {name: resource.stats() for name, resource in self.resources.items()}
+        }
@@ -0,0 +1,163 @@
+import os
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+import gdown
+
+# drive (Google Drive), local (files under STORAGE_DIR) or memory (in-process, for tests and benchmarks)
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'drive').lower()
+DRIVE_TRANSFER_WORKERS = int(os.getenv('DRIVE_TRANSFER_WORKERS', '8'))
+VECTOR_ZIP_NAME = 'pdf_vectors_archive.zip'
+VECTOR_SEGMENT_PREFIX = 'pdf_segment_'
+MODEL_FOLDERS = {
+    '../pdf_embeder-bge-base': 'https://drive.google.com/drive/folders/1SZJI2xUako091gF3itdfFvlSTU8hkzzY?usp=sharing',
+    '../siglip_model': 'https://drive.google.com/drive/folders/1tTBDlG7q14vTaBap9bgvjTm-eT2-_0pv?usp=sharing',
+}
+
+class TransferStats:
+    def __init__(self, chunk_size=None):
+        self.lock = threading.Lock()
+        self.chunk_size = chunk_size
+        self.kinds = {}
+        self.retries = 0
+
+    def record(self, kind, size, seconds, ok=True):
+        with self.lock:
+            entry = self.kinds.setdefault(kind, {'files': 0, 'failures': 0, 'bytes': 0, 'seconds': 0.0, 'last': None})
+            if not ok:
+                entry['failures'] += 1
+                return
+            entry['files'] += 1
+            entry['bytes'] += size
+            entry['seconds'] += seconds
+            entry['last'] = {'bytes': size, 'seconds': round(seconds, 3),
+                             'mb_per_s': round(size / 2**20 / seconds, 2) if seconds else None}
+
+    def retry(self):
+        with self.lock:
+            self.retries += 1
+
+    def stats(self):
+        with self.lock:
+            report = {'chunk_size': self.chunk_size, 'chunk_retries': self.retries}
+            for kind, entry in self.kinds.items():
+                report[kind] = {
+                    'files': entry['files'],
+                    'failures': entry['failures'],
+                    'bytes': entry['bytes'],
+                    'mb_per_s': round(entry['bytes'] / 2**20 / entry['seconds'], 2) if entry['seconds'] else None,
+                    'last': entry['last']
+                }
+            return report
+
+class StorageBackend(ABC):
+    # what ImgEmbedder, PDFEmbed, CoverStore and app.py persist through: PDFs, images/covers,
+    # the image map and vectors, and the PDF vector segments, all addressed by an opaque file id.
+    # A backend missing one of the abstract methods fails when it is constructed, not mid-request
+    name = None
+
+    def __init__(self, chunk_size=None):
+        self.cred_state = True
+        self.cred_url = None
+        self.transfer_stats = TransferStats(chunk_size)
+        self.transfer_pool = ThreadPoolExecutor(max_workers=DRIVE_TRANSFER_WORKERS, thread_name_prefix=f"{self.name}-transfer")
+        self.metadata_cache = None
+        self.model_locks = {folder: threading.Lock() for folder in MODEL_FOLDERS}
+
+    def connect(self):
+        pass
+
+    def oauth2callback(self, auth_code):
+        return True
+
+    def download_model(self, folder):
+        # the startup prefetch and a lazy model load may ask for the same folder
+        with self.model_locks[folder]:
+            if os.path.exists(folder):
+                return
+            print(f"**************************************Downloading {folder}******************************")
+            part_folder = f"{folder}.part"
+            gdown.download_folder(url=MODEL_FOLDERS[folder],output=part_folder, quiet=False, use_cookies=False)
+            os.replace(part_folder, folder)
+
+    def download_models(self):
+        for folder in MODEL_FOLDERS:
+            self.download_model(folder)
+
+    def run_many(self, calls):
+        # calls: [(fn, *args)]; results in order, None where a call raised.
+        # not for use from inside a transfer_pool task, it would wait on its own pool
+        futures = [self.transfer_pool.submit(fn, *args) for fn, *args in calls]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                print(f"error in {self.name} transfer: {e}")
+                results.append(None)
+        return results
+
+    def download_many(self, downloads):
+        # downloads: [(file_id, output_filename)]
+        return [bool(ok) for ok in self.run_many([(self.download_file, file_id, path) for file_id, path in downloads])]
+
+    def upload_many(self, paths, upload=None):
+        # upload is any single-file method (upload_image, upload_vector_img, ...); returns the file ids
+        upload = upload or self.upload_image
+        return self.run_many([(upload, path) for path in paths])
+
+    def search_vector_imgs(self, file_paths):
+        return {file_path: self.search_vector_img(file_path) for file_path in file_paths}
+
+    @abstractmethod
+    def upload_pdf_file(self, filename):
+        pass
+
+    @abstractmethod
+    def upload_image(self, image_path, mimetype='image/png', cache=True):
+        pass
+
+    @abstractmethod
+    def download_file(self, file_id, output_filename):
+        pass
+
+    @abstractmethod
+    def delete_file(self, file_id):
+        pass
+
+    @abstractmethod
+    def search_vector_zip(self):
+        pass
+
+    @abstractmethod
+    def upload_or_update_vector_zip(self, local_zip_path):
+        pass
+
+    @abstractmethod
+    def list_vector_segments(self):
+        pass
+
+    @abstractmethod
+    def upload_vector_segment(self, local_zip_path):
+        pass
+
+    @abstractmethod
+    def search_vector_img(self, file_path):
+        pass
+
+    @abstractmethod
+    def upload_vector_img(self, file_path):
+        pass
+
+def create_storage(backend=STORAGE_BACKEND, connect=True):
+    # imported here so the local backends run without the Google client libraries
+    if backend == 'local':
+        from LocalStorage import LocalStorage
+        return LocalStorage()
+    if backend == 'memory':
+        from LocalStorage import MemoryStorage
+        return MemoryStorage()
+    if backend != 'drive':
+        print(f"unknown storage backend {backend}, using drive")
+    from GoogleDrive import DriveAPI
+    return DriveAPI(connect=connect)
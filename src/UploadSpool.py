@@ -0,0 +1,79 @@
+import os
+import tempfile
+import uuid
+from starlette.datastructures import UploadFile
+
+UPLOAD_CHUNK_SIZE = int(os.getenv('UPLOAD_CHUNK_SIZE', str(1024 * 1024)))
+MAX_UPLOAD_BYTES = int(os.getenv('MAX_UPLOAD_BYTES', str(500 * 1024 * 1024)))
+# spooled uploads live outside the working tree
+UPLOAD_SPOOL_DIR = os.getenv('UPLOAD_SPOOL_DIR', tempfile.gettempdir())
+
+class UploadTooLarge(Exception):
+    pass
+
+def temp_upload_path(suffix=''):
+    return os.path.join(UPLOAD_SPOOL_DIR, f"upload_{uuid.uuid4().hex}{suffix}")
+
+def write_chunk(f, chunk, size):
+    size += len(chunk)
+    if size > MAX_UPLOAD_BYTES:
+        raise UploadTooLarge(f"upload exceeds {MAX_UPLOAD_BYTES} bytes")
+    f.write(chunk)
+    return size
+
+async def spool_upload_file(upload, suffix=''):
+    path = temp_upload_path(suffix)
+    size = 0
+    try:
+        with open(path, 'wb') as f:
+            while True:
+                chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size = write_chunk(f, chunk, size)
+    except Exception:
+        if os.path.exists(path): os.remove(path)
+        raise
+    return path
+
+async def spool_body(request, suffix=''):
+    path = temp_upload_path(suffix)
+    size = 0
+    try:
+        with open(path, 'wb') as f:
+            async for chunk in request.stream():
+                if chunk:
+                    size = write_chunk(f, chunk, size)
+    except Exception:
+        if os.path.exists(path): os.remove(path)
+        raise
+    return path
+
+async def spool_request(request, suffix=''):
+    # multipart parts are spooled by starlette (in memory up to 1MB, then disk) and copied out
+    # in chunks; any other body is streamed straight to disk. Returns ([(path, filename)], fields)
+    content_type = request.headers.get('content-type', '')
+    files = []
+    fields = dict(request.query_params)
+    try:
+        if content_type.startswith('multipart/form-data'):
+            form = await request.form()
+            try:
+                for key, value in form.multi_items():
+                    if isinstance(value, UploadFile):
+                        files.append((await spool_upload_file(value, suffix), value.filename))
+                    else:
+                        fields[key] = value
+            finally:
+                await form.close()
+        else:
+            files.append((await spool_body(request, suffix), fields.get('filename')))
+    except Exception:
+        remove_spooled(files)
+        raise
+    return files, fields
+
+def remove_spooled(files):
+    for path, _ in files:
+        if path and os.path.exists(path):
+            os.remove(path)
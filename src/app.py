@@ -1,15 +1,28 @@
+import time
+IMPORT_STARTED = time.perf_counter()
 from typing import List, Optional
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Request, HTTPException
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse, FileResponse, Response
 from ChatController import Chat_HuggingFaceController
 from PdfEmbedding import PDFEmbed
-from pydantic import BaseModel
+from pydantic import BaseModel, ValidationError
 import torch
-from GoogleDrive import DriveAPI
+from StorageBackend import create_storage
 import os
 from imageEmbedCreation import ImgEmbedder
 import base64
+import uuid
+import asyncio
+import json
+from UploadSpool import spool_request, remove_spooled
+from AsyncRuntime import run_drive, run_ingest, shutdown_executors
+from LLMResponseCache import LLMResponseCache
+from SearchSessionStore import SearchSessionStore
+from StartupOrchestrator import StartupOrchestrator
+from InferenceBackend import backend_report
+from PdfStream import parse_range, iter_file, content_disposition, RangeNotSatisfiable
 app = FastAPI()
 app.add_middleware(
     CORSMiddleware,
@@ -25,11 +38,43 @@ PDF_MODEL = "Qwen/Qwen2.5-7B-Instruct"
 IMAGE_MODEL_FOLDER = "../siglip_model"
 PDF_MODEL_FOLDER = '../pdf_embeder-bge-base' 
 device = 'cuda' if torch.cuda.is_available() else 'cpu'
-mydriveInst = DriveAPI()
-mydriveInst.download_models()
-img_embedder = ImgEmbedder(IMAGE_MODEL_FOLDER,mydriveInst,device)
-chat_model = Chat_HuggingFaceController(MODEL, DB_URI)
-myPdfInsta = PDFEmbed(PDF_MODEL_FOLDER, device, mydriveInst,PDF_MODEL)
+# share pending search results across workers by keeping them in Postgres too
+SEARCH_SESSION_PERSIST = os.getenv('SEARCH_SESSION_PERSIST', 'false').lower() == 'true'
+# inline = base64 cover in the search reply, url = the client loads /covers/{id} itself
+COVER_RESPONSE = os.getenv('COVER_RESPONSE', 'inline')
+# stream = the selected PDF comes back as application/pdf, base64 = the old JSON body
+PDF_SELECTION_RESPONSE = os.getenv('PDF_SELECTION_RESPONSE', 'stream')
+# load every model during startup instead of on the first request
+STARTUP_WARMUP = os.getenv('STARTUP_WARMUP', 'false').lower() == 'true'
+
+# constructors only wire things up; storage, Postgres and the models are brought up by startup
+startup = StartupOrchestrator()
+startup.record('imports', time.perf_counter() - IMPORT_STARTED)
+# STORAGE_BACKEND picks Google Drive, a local directory or an in-memory store
+mydriveInst = create_storage(connect=False)
+img_embedder = ImgEmbedder(IMAGE_MODEL_FOLDER,mydriveInst,device, autostart=False)
+llm_cache = LLMResponseCache()
+chat_model = Chat_HuggingFaceController(MODEL, DB_URI, llm_cache, connect=False)
+search_sessions = SearchSessionStore()
+myPdfInsta = PDFEmbed(PDF_MODEL_FOLDER, device, mydriveInst,PDF_MODEL, llm_cache, search_sessions, preload=False)
+
+def connect_postgres():
+    chat_model.connect()
+    if SEARCH_SESSION_PERSIST:
+        search_sessions.attach(chat_model.perstMem.pool)
+
+startup.step('drive_auth', mydriveInst.connect)
+startup.step('download_bge', lambda: mydriveInst.download_model(PDF_MODEL_FOLDER))
+startup.step('download_siglip', lambda: mydriveInst.download_model(IMAGE_MODEL_FOLDER))
+startup.step('postgres', connect_postgres)
+startup.step('image_state', img_embedder.start, after=['drive_auth'])
+startup.step('pdf_index', myPdfInsta.load_index, after=['drive_auth'])
+if STARTUP_WARMUP:
+    startup.step('warmup_bge', lambda: myPdfInsta.embedding_model.embed_query('warmup'), after=['download_bge'])
+    startup.step('warmup_siglip', lambda: img_embedder.embed_texts(['warmup']), after=['download_siglip'])
+    startup.step('warmup_chat_llm', chat_model.chat_model.get)
+    startup.step('warmup_pdf_llm', myPdfInsta.chat_model.get)
+startup.track(img_embedder.siglip, myPdfInsta.embedding_model.resource, chat_model.chat_model, myPdfInsta.chat_model)
 
 class ChatRequest(BaseModel):
     message: str
@@ -45,15 +90,31 @@ class PdfRequest(BaseModel):
     buffer: Buffer_data   
     pdf_name: str
 
+class PdfBatchRequest(BaseModel):
+    pdfs: List[PdfRequest]
+
 class PdfQuerySearch(BaseModel):
     Pdf_query: str   
+    thread_id: Optional[str] = None
 
 class ImageQueryRequest(BaseModel):
     img_query: str
 
+@app.on_event('startup')
+async def start_background_init():
+    # returns at once so liveness answers while Drive, Postgres and the models come up
+    startup.start()
+
+@app.on_event('shutdown')
+async def flush_image_vectors():
+    await run_drive(img_embedder.flush)
+    await chat_model.close()
+    shutdown_executors()
+    mydriveInst.transfer_pool.shutdown(wait=False, cancel_futures=True)
+
 def createBase64Bytes(file_path):
     try:
-        if not os.path.exists(file_path):
+        if not file_path or not os.path.exists(file_path):
             return None
         with open(file_path, 'rb') as f:
             image_data = f.read()
@@ -71,34 +132,107 @@ def check_drive_auth():
         return {'error': str(e)}
 
 @app.get('/')
-def testing():
+async def testing():
     return {'response': "Server is running"}
 
+@app.get('/health/live')
+async def liveness():
+    return {'status': 'alive'}
+
+@app.get('/health/ready')
+async def readiness():
+    if startup.ready():
+        return {'status': 'ready'}
+    return JSONResponse(status_code=503, content={'status': 'starting', 'steps': startup.report()['steps']})
+
+@app.get('/health/startup')
+async def startup_report():
+    return {**startup.report(), 'backends': backend_report}
+
 @app.get("/oauth2callback")
 async def handle_callback(request: Request):
     auth_code = request.query_params.get("code")
     if not auth_code:
         return {"error": "No code"}
     try:
-        mydriveInst.oauth2callback(auth_code)
+        await startup.await_steps('drive_auth')
+        await run_drive(mydriveInst.oauth2callback, auth_code)
         return {"message": "Login Successfully"}
     except Exception as e:
         return {"error": str(e)}
 
+@app.get('/pdf-index/stats')
+async def pdf_index_stats():
+    return {**myPdfInsta.index_manager.stats(), 'intent': myPdfInsta.intent_stats, 'sessions': search_sessions.stats()}
+
+@app.get('/image-store/stats')
+async def image_store_stats():
+    return img_embedder.store.stats()
+
+@app.get('/cover-store/stats')
+async def cover_store_stats():
+    return myPdfInsta.cover_store.stats()
+
+@app.get('/covers/{cover_id}')
+async def get_cover(cover_id: str):
+    await startup.await_steps('drive_auth')
+    path, mime = await run_drive(myPdfInsta.cover_store.get, cover_id)
+    if not path:
+        return JSONResponse(status_code=404, content={'error': 'cover not found'})
+    # a cover id always points at the same image
+    return FileResponse(path, media_type=mime, headers={'Cache-Control': 'public, max-age=31536000, immutable'})
+
+@app.get('/drive-transfers/stats')
+async def drive_transfer_stats():
+    return mydriveInst.transfer_stats.stats()
+
+@app.get('/drive-metadata/stats')
+async def drive_metadata_stats():
+    if mydriveInst.metadata_cache is None:
+        return {'backend': mydriveInst.name}
+    return mydriveInst.metadata_cache.stats()
+
+@app.get('/drive-cache/stats')
+async def drive_cache_stats():
+    return mydriveInst.file_cache.stats()
+
+@app.get('/llm-cache/stats')
+async def llm_cache_stats():
+    return llm_cache.stats()
+
 @app.post('/chat')
-def getReply_text(request: ChatRequest):
+async def getReply_text(request: ChatRequest):
     try:
-        return {'reply': chat_model.chat(request.message, request.thread_id)}
+        await startup.await_steps('postgres')
+        return {'reply': await chat_model.achat(request.message, request.thread_id)}
     except Exception as e:
         return {'error': str(e)}
 
+@app.post('/chat/stream')
+async def streamReply_text(request: ChatRequest):
+    async def event_stream():
+        try:
+            await startup.await_steps('postgres')
+            async for token in chat_model.astream_chat(request.message, request.thread_id):
+                yield f"data: {json.dumps({'token': token})}\n\n"
+            yield "event: done\ndata: {}\n\n"
+        except Exception as e:
+            print('error in streamReply_text', e)
+            yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
+    return StreamingResponse(
+        event_stream(),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 @app.post('/chat-img')
-def getReply_imgQuery(request: ImageQueryRequest):
+async def getReply_imgQuery(request: ImageQueryRequest):
     try:
+        await startup.await_steps('image_state')
         auth = check_drive_auth()
         if not auth.get('auth'): return auth
      
-        img_buffer = img_embedder.search_and_send(request.img_query)
+        img_buffer = await img_embedder.asearch_and_send(request.img_query)
         if img_buffer and isinstance(img_buffer, list) and len(img_buffer) > 0:
             return {'imageResponse': base64.b64encode(img_buffer[0]).decode('utf-8')}
         else:
@@ -108,64 +242,186 @@ def getReply_imgQuery(request: ImageQueryRequest):
     except Exception as e:
         print('error in getReply_imgQuery', e)
         return {'error': str(e)}
+
+def is_json_request(request: Request):
+    return request.headers.get('content-type', '').startswith('application/json')
+
+async def parse_json_body(request: Request, model):
+    # these routes used to take the model as a typed parameter, keep answering bad bodies with 422
+    try:
+        return model(**await request.json())
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=jsonable_encoder(e.errors()))
+    except (ValueError, TypeError) as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+def clean_pdf_name(pdf_name, fallback):
+    pdf_name = os.path.basename(pdf_name or fallback or '')
+    if not pdf_name:
+        pdf_name = f"{uuid.uuid4().hex}.pdf"
+    if not pdf_name.lower().endswith('.pdf'):
+        pdf_name = f"{pdf_name}.pdf"
+    return pdf_name
+
 @app.post('/create-embed-img')
-def createEmbeddingRoute(data: EmbeddingRequest):
+async def createEmbeddingRoute(request: Request):
+    files = []
     try:
+        await startup.await_steps('image_state')
         auth = check_drive_auth()
         if not auth.get('auth'): return auth
-    
-        img_embedder.add_image(bytes(data.buffer.data))
+
+        if is_json_request(request):
+            data = await parse_json_body(request, EmbeddingRequest)
+            await run_ingest(img_embedder.add_image, bytes(data.buffer.data))
+        else:
+            files, _ = await spool_request(request)
+            if not files:
+                return {'error': 'No image in request'}
+            await run_ingest(img_embedder.add_image, files[0][0])
         return {'reply': 'Image Saved and indexed Successfully '}
+    except HTTPException:
+        raise
     except Exception as e:
         return {'error': str(e)}
+    finally:
+        remove_spooled(files)
 
 @app.post('/send-pdfbuffer')
-def pdf_embedding_and_drive(data: PdfRequest):
+async def pdf_embedding_and_drive(request: Request):
+    files = []
     try:
+        await startup.await_steps('pdf_index')
         auth = check_drive_auth()
         if not auth.get('auth'): return auth
-        fileId = myPdfInsta.create_pdf_from_buffer(data.buffer.data, data.pdf_name)
-        myPdfInsta.createEmbedding(fileId)
+
+        if is_json_request(request):
+            data = await parse_json_body(request, PdfRequest)
+            pdf_name = clean_pdf_name(data.pdf_name, None)
+            fileId = await run_drive(myPdfInsta.create_pdf_from_buffer, data.buffer.data, pdf_name)
+        else:
+            files, fields = await spool_request(request, '.pdf')
+            if not files:
+                return {'error': 'No pdf in request'}
+            local_path, filename = files[0]
+            pdf_name = clean_pdf_name(fields.get('pdf_name'), filename)
+            fileId = await run_drive(myPdfInsta.create_pdf_from_file, local_path, pdf_name)
+        await run_ingest(myPdfInsta.createEmbedding, fileId, pdf_name)
         return {'reply': 'PDF metadata indexed successfully'}
+    except HTTPException:
+        raise
     except Exception as e:
         print('Error:', e)
         return {'error': str(e)}
+    finally:
+        remove_spooled(files)
+
+@app.post('/send-pdfbuffer/batch')
+async def pdf_batch_embedding_and_drive(request: Request):
+    files = []
+    try:
+        await startup.await_steps('pdf_index')
+        auth = check_drive_auth()
+        if not auth.get('auth'): return auth
+
+        if is_json_request(request):
+            data = await parse_json_body(request, PdfBatchRequest)
+            pdfs = [(bytes(pdf.buffer.data), clean_pdf_name(pdf.pdf_name, None)) for pdf in data.pdfs]
+        else:
+            files, _ = await spool_request(request, '.pdf')
+            pdfs = [(local_path, clean_pdf_name(None, filename)) for local_path, filename in files]
+        result = await run_ingest(myPdfInsta.createEmbeddingBatch, pdfs)
+        return {'reply': result}
+    except HTTPException:
+        raise
+    except Exception as e:
+        print('Error in pdf_batch_embedding_and_drive:', e)
+        return {'error': str(e)}
+    finally:
+        remove_spooled(files)
+
+async def fetch_cover_base64(cover_id):
+    if not cover_id or COVER_RESPONSE == 'url':
+        return None
+    try:
+        return await run_drive(myPdfInsta.cover_store.read_base64, cover_id)
+    except Exception as e:
+        print(f"Cover download failed: {e}")
+        return None
+
+def pdf_stream_response(pdf_path, pdf_name, range_header=None, file_id=None):
+    f = open(pdf_path, 'rb')
+    size = os.fstat(f.fileno()).st_size
+    try:
+        byte_range = parse_range(range_header, size)
+    except RangeNotSatisfiable:
+        f.close()
+        return Response(status_code=416, headers={'Content-Range': f"bytes */{size}"})
+    headers = {'Accept-Ranges': 'bytes', 'Content-Disposition': content_disposition(pdf_name)}
+    if file_id:
+        # where the client can resume or seek with Range requests
+        headers['Content-Location'] = f"/pdf/{file_id}"
+    status_code = 200
+    start, end = 0, size - 1
+    if byte_range is not None:
+        start, end = byte_range
+        status_code = 206
+        headers['Content-Range'] = f"bytes {start}-{end}/{size}"
+    headers['Content-Length'] = str(end - start + 1)
+    return StreamingResponse(iter_file(f, start, end - start + 1), status_code=status_code,
+                             media_type='application/pdf', headers=headers)
+
+@app.get('/pdf/{file_id}')
+async def get_pdf(file_id: str, request: Request, name: Optional[str] = None):
+    try:
+        await startup.await_steps('pdf_index')
+        auth = check_drive_auth()
+        if not auth.get('auth'): return auth
+        # only books in the index, not arbitrary Drive files
+        if not await run_drive(myPdfInsta.index_manager.has_file, file_id):
+            return JSONResponse(status_code=404, content={'error': 'pdf not found'})
+        pdf_path = await run_drive(mydriveInst.file_cache.fetch, file_id)
+        if not pdf_path:
+            return JSONResponse(status_code=404, content={'error': 'pdf not found'})
+        return pdf_stream_response(pdf_path, name or f"{file_id}.pdf", request.headers.get('range'))
+    except Exception as e:
+        print('Error in get_pdf:', e)
+        return JSONResponse(status_code=500, content={'error': str(e)})
 
 @app.post('/search_pdf_query')
-def pdf_query_search(data: PdfQuerySearch):
+async def pdf_query_search(data: PdfQuerySearch):
     try:
+        await startup.await_steps('pdf_index')
         auth = check_drive_auth()
         if not auth.get('auth'): return auth
 
-        results = myPdfInsta.search_query(data.Pdf_query, k=2)
+        # a request without a thread_id has nothing to pick from, it gets its own id to send back
+        thread_id = data.thread_id or uuid.uuid4().hex
+        results = await myPdfInsta.asearch_query(
+            data.Pdf_query, k=2, session_id=thread_id, inline_pdf=PDF_SELECTION_RESPONSE == 'base64'
+        )
         if not results:
-            return {'reply': []}
+            return {'reply': [], 'thread_id': thread_id}
+        if isinstance(results, dict) and 'pdf_path' in results:
+            return pdf_stream_response(results['pdf_path'], results['pdf_name'], file_id=results['fileId'])
         if not 'pdfBytes' in results:
             response_list = []
-            for doc in results:
+            covers = await asyncio.gather(*[fetch_cover_base64(doc.metadata.get('coverPageid')) for doc in results])
+            for doc, base64Bytes in zip(results, covers):
                 meta = doc.metadata 
-                cover_id = meta.get('coverPageid')
-                base64Bytes = None
-                
-                if cover_id:
-                    temp_name = f"{cover_id}_temp.png"
-                    try:
-                        mydriveInst.download_file(cover_id, temp_name)
-                        base64Bytes = createBase64Bytes(temp_name)
-                    except Exception as e:
-                        print(f"Cover download failed: {e}")
-                    finally:
-                        if os.path.exists(temp_name): os.remove(temp_name)
 
                 response_list.append({
                     'File_Name': meta.get('fileName', 'Unknown'),
                     'date': meta.get('date', ''),
                     'total_pages': meta.get('total_pages', 'N/A'),
-                    'cover_buffer': base64Bytes
+                    'pages': meta.get('matchedPages', []),
+                    'cover_buffer': base64Bytes,
+                    'cover_url': f"/covers/{meta['coverPageid']}" if meta.get('coverPageid') else None,
+                    'pdf_url': f"/pdf/{meta['fileId']}" if meta.get('fileId') else None
                 })
-            return {'reply': response_list}
+            return {'reply': response_list, 'thread_id': thread_id}
         elif 'pdfBytes' in results:
-            return JSONResponse(content={'reply':results['pdfBytes'],'pdf_name':results['pdf_name']})
+            return JSONResponse(content={'reply':results['pdfBytes'],'pdf_name':results['pdf_name'],'thread_id':thread_id})
     except Exception as e:
         print('Error in pdf_query_search:', e)
         return {'error in pdf_query_search': str(e)}
\ No newline at end of file
@@ -0,0 +1,48 @@
+# Render time and size of a PDF cover: the old 200 dpi + resize + PNG path against the thumbnail path.
+# Run from src/:  python -m benchmarks.cover_bench --pdf some_book.pdf --runs 5   (needs poppler's pdftoppm)
+import argparse
+import io
+import os
+import tempfile
+import time
+import numpy as np
+from pdf2image import convert_from_path
+from CoverStore import render_cover, cover_format
+from benchmarks.pdf_chunk_bench import write_synthetic_pdf
+
+def old_cover(pdf_path):
+    pages = convert_from_path(pdf_path, first_page=1, last_page=1)
+    buffer = io.BytesIO()
+    pages[0].resize((300, 400)).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+def timed(fn, runs):
+    fn()
+    latencies = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        data = fn()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return np.array(latencies), len(data)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pdf', help='a real book; a synthetic text page is used otherwise')
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    pdf_path = args.pdf
+    if pdf_path is None:
+        pdf_path = os.path.join(tempfile.mkdtemp(), 'synthetic.pdf')
+        write_synthetic_pdf(pdf_path, 1)
+
+    print(f"{'pipeline':>10} {'p50_ms':>8} {'p95_ms':>8} {'bytes':>8}")
+    pipelines = [('png-200dpi', lambda: old_cover(pdf_path))]
+    for fmt in dict.fromkeys([cover_format(), 'jpeg']):
+        pipelines.append((fmt, lambda fmt=fmt: render_cover(pdf_path, fmt)))
+    for name, fn in pipelines:
+        latencies, size = timed(fn, args.runs)
+        print(f"{name:>10} {np.percentile(latencies, 50):>8.1f} {np.percentile(latencies, 95):>8.1f} {size:>8}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+# Latency, memory and fp32 parity of the SigLIP and bge inference backends on CPU.
+# Run from src/:  python -m benchmarks.embed_backend_bench --models siglip bge --backends torch int8 onnx
+# Every (model, backend) pair loads in its own process so the memory numbers do not mix.
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+
+def rss_mb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def peak_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def timed(fn, runs):
+    fn()
+    latencies = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - start)
+    return np.array(latencies) * 1000
+
+def worker(args):
+    # parity is measured by the parent against the torch run, skip the in-process check
+    os.environ['EMBED_PARITY_CHECK'] = 'false'
+    from InferenceBackend import load_siglip, load_bge, parity_images, siglip_probe, PARITY_TEXTS
+    texts = (PARITY_TEXTS * (args.batch // len(PARITY_TEXTS) + 1))[:args.batch]
+    before = rss_mb()
+    start = time.perf_counter()
+    result = {}
+    if args.model == 'siglip':
+        processor, runner = load_siglip(args.siglip_folder, 'cpu', args.backend)
+        load_s = time.perf_counter() - start
+        images = processor(images=parity_images(args.batch), return_tensors="pt")
+        text_inputs = processor(text=texts, return_tensors="pt", padding="max_length", truncation=True)
+        result['image_ms'] = timed(lambda: runner.image_features(images), args.runs)
+        result['text_ms'] = timed(lambda: runner.text_features(text_inputs), args.runs)
+        probe = siglip_probe(processor, runner, 'cpu')
+    else:
+        embeddings = load_bge(args.bge_folder, 'cpu', args.backend)
+        load_s = time.perf_counter() - start
+        result['text_ms'] = timed(lambda: embeddings.embed_documents(texts), args.runs)
+        probe = np.asarray(embeddings.embed_documents(PARITY_TEXTS))
+    np.save(args.probe_path, probe)
+    summary = {'load_s': load_s, 'rss_mb': rss_mb() - before, 'peak_mb': peak_mb()}
+    for name, latencies in result.items():
+        summary[f"{name}_p50"] = float(np.percentile(latencies, 50))
+        summary[f"{name}_p95"] = float(np.percentile(latencies, 95))
+    print(json.dumps(summary))
+
+def run_pair(args, model, backend, probe_path):
+    command = [
+        sys.executable, '-m', 'benchmarks.embed_backend_bench', '--worker',
+        '--model', model, '--backend', backend, '--probe-path', probe_path,
+        '--batch', str(args.batch), '--runs', str(args.runs),
+        '--siglip-folder', args.siglip_folder, '--bge-folder', args.bge_folder,
+    ]
+    completed = subprocess.run(command, capture_output=True, text=True)
+    if completed.returncode != 0:
+        print(completed.stderr[-2000:])
+        return None
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--models', nargs='+', default=['siglip', 'bge'])
+    parser.add_argument('--backends', nargs='+', default=['torch', 'int8', 'onnx'])
+    parser.add_argument('--batch', type=int, default=8)
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--siglip-folder', default='../siglip_model')
+    parser.add_argument('--bge-folder', default='../pdf_embeder-bge-base')
+    parser.add_argument('--worker', action='store_true')
+    parser.add_argument('--model')
+    parser.add_argument('--backend')
+    parser.add_argument('--probe-path')
+    args = parser.parse_args()
+    if args.worker:
+        worker(args)
+        return
+
+    from InferenceBackend import cosine_parity
+    probes = tempfile.mkdtemp(prefix='embed_bench_')
+    print(f"{'model':>7} {'backend':>8} {'load_s':>7} {'rss_mb':>8} {'peak_mb':>8} "
+          f"{'img_p50':>8} {'img_p95':>8} {'txt_p50':>8} {'txt_p95':>8} {'min_cos':>8} {'mean_cos':>8}")
+    for model in args.models:
+        reference = None
+        # torch first, it is the parity reference for the others
+        for backend in ['torch'] + [b for b in args.backends if b != 'torch']:
+            probe_path = os.path.join(probes, f"{model}_{backend}.npy")
+            summary = run_pair(args, model, backend, probe_path)
+            if summary is None:
+                print(f"{model:>7} {backend:>8} failed")
+                continue
+            probe = np.load(probe_path)
+            if backend == 'torch':
+                reference = probe
+            min_cos, mean_cos = cosine_parity(reference, probe) if reference is not None else (float('nan'),) * 2
+            if backend == 'torch' and 'torch' not in args.backends:
+                continue
+            print(f"{model:>7} {backend:>8} {summary['load_s']:>7.2f} {summary['rss_mb']:>8.0f} {summary['peak_mb']:>8.0f} "
+                  f"{summary.get('image_ms_p50', float('nan')):>8.2f} {summary.get('image_ms_p95', float('nan')):>8.2f} "
+                  f"{summary['text_ms_p50']:>8.2f} {summary['text_ms_p95']:>8.2f} {min_cos:>8.4f} {mean_cos:>8.4f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+# Memory, scoring latency and recall of the image vector codecs against float32.
+# Run from src/:  python -m benchmarks.image_codec_bench --sizes 20000 200000
+import argparse
+import time
+import numpy as np
+from ImageIndex import top_k_indices
+from ImageVectorCodec import make_codec
+from benchmarks.image_index_bench import synthetic_embeddings, synthetic_queries
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[20000, 200000])
+    parser.add_argument('--dim', type=int, default=768)
+    parser.add_argument('--queries', type=int, default=100)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--codecs', nargs='+', default=['float16', 'sq8', 'pq'])
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    print(f"{'n':>8} {'codec':>8} {'B/vec':>6} {'ratio':>6} {'MB':>8} {'encode_s':>9} "
+          f"{'p50_ms':>8} {'p95_ms':>8} {'recall@k':>9}")
+    for n in args.sizes:
+        embeddings = synthetic_embeddings(n, args.dim, rng)
+        queries = synthetic_queries(embeddings, args.queries, rng)
+        exact = embeddings @ queries.T
+        truth = [set(top_k_indices(exact[:, i], args.k)) for i in range(len(queries))]
+        for name in ['float32'] + args.codecs:
+            start = time.perf_counter()
+            codec = make_codec(name, args.dim, embeddings)
+            rows = codec.encode(embeddings)
+            encode_s = time.perf_counter() - start
+            latencies = []
+            hits = 0
+            for query, expected in zip(queries, truth):
+                start = time.perf_counter()
+                scores = codec.score(rows, query)
+                found = top_k_indices(scores, args.k)
+                latencies.append((time.perf_counter() - start) * 1000)
+                hits += len(expected & set(found))
+            bytes_per_vector = codec.bytes_per_vector()
+            print(f"{n:>8} {codec.name:>8} {bytes_per_vector:>6} {args.dim * 4 / bytes_per_vector:>6.1f} "
+                  f"{n * bytes_per_vector / 2**20:>8.1f} {encode_s:>9.2f} {np.percentile(latencies, 50):>8.2f} "
+                  f"{np.percentile(latencies, 95):>8.2f} {hits / (len(queries) * args.k):>9.3f}")
+            del rows
+        del embeddings
+
+if __name__ == '__main__':
+    main()
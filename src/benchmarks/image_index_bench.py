@@ -0,0 +1,72 @@
+# Recall vs latency of the image search indexes on synthetic SigLIP-sized embeddings.
+# Run from src/:  python -m benchmarks.image_index_bench --sizes 10000 100000 1000000
+import argparse
+import time
+import numpy as np
+from ImageIndex import FlatImageIndex, FaissImageIndex
+
+def synthetic_embeddings(n, dim, rng, clusters=256, chunk=100000):
+    # clustered unit vectors are closer to real image embeddings than isotropic noise
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    out = np.empty((n, dim), dtype=np.float32)
+    for start in range(0, n, chunk):
+        end = min(start + chunk, n)
+        block = centers[rng.integers(0, clusters, end - start)]
+        block += 0.6 * rng.standard_normal(block.shape).astype(np.float32)
+        block /= np.linalg.norm(block, axis=1, keepdims=True)
+        out[start:end] = block
+    return out
+
+def synthetic_queries(embeddings, count, rng):
+    picks = embeddings[rng.integers(0, len(embeddings), count)].copy()
+    picks += 0.3 * rng.standard_normal(picks.shape).astype(np.float32) / np.sqrt(picks.shape[1])
+    picks /= np.linalg.norm(picks, axis=1, keepdims=True)
+    return picks
+
+def run_queries(index, queries, k):
+    latencies = []
+    results = []
+    for q in queries:
+        start = time.perf_counter()
+        indices, _ = index.search(q, k)
+        latencies.append(time.perf_counter() - start)
+        results.append(indices)
+    return results, np.array(latencies) * 1000
+
+def recall(results, truth, k):
+    hits = sum(len(set(r[:k]) & set(t[:k])) for r, t in zip(results, truth))
+    return hits / (len(truth) * k)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--dim', type=int, default=768)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--kinds', nargs='+', default=['hnsw', 'ivf'])
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    print(f"{'n':>9} {'index':>6} {'build_s':>8} {'p50_ms':>8} {'p95_ms':>8} {'recall@k':>9}")
+    for n in args.sizes:
+        embeddings = synthetic_embeddings(n, args.dim, rng)
+        queries = synthetic_queries(embeddings, args.queries, rng)
+
+        flat = FlatImageIndex(embeddings)
+        truth, latencies = run_queries(flat, queries, args.k)
+        print(f"{n:>9} {'flat':>6} {0.0:>8.2f} {np.percentile(latencies, 50):>8.3f} "
+              f"{np.percentile(latencies, 95):>8.3f} {1.0:>9.3f}")
+
+        for kind in args.kinds:
+            start = time.perf_counter()
+            index = FaissImageIndex(embeddings, kind)
+            build_s = time.perf_counter() - start
+            results, latencies = run_queries(index, queries, args.k)
+            print(f"{n:>9} {kind:>6} {build_s:>8.2f} {np.percentile(latencies, 50):>8.3f} "
+                  f"{np.percentile(latencies, 95):>8.3f} {recall(results, truth, args.k):>9.3f}")
+            del index
+        del embeddings
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+# Accuracy, coverage and latency of the rule-based PDF intent classifier on a labelled corpus.
+# Inputs it is unsure about fall back to the LLM router, so they count against coverage, not accuracy.
+# Run from src/:  python -m benchmarks.intent_bench
+import argparse
+import json
+import os
+import time
+from IntentClassifier import classify_intent
+
+CORPUS = os.path.join(os.path.dirname(__file__), 'intent_corpus.jsonl')
+
+def load_corpus(path):
+    with open(path, 'r') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--corpus', default=CORPUS)
+    parser.add_argument('--repeat', type=int, default=1000)
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    rows = load_corpus(args.corpus)
+    handled = correct = 0
+    errors = []
+    for row in rows:
+        predicted = classify_intent(row['text'], row['has_results'], row['result_count'])
+        if predicted is None:
+            if args.verbose:
+                print(f"fallback  {row['text']!r}")
+            continue
+        handled += 1
+        if predicted == row['label']:
+            correct += 1
+        else:
+            errors.append((row['text'], row['label'], predicted))
+
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        for row in rows:
+            classify_intent(row['text'], row['has_results'], row['result_count'])
+    per_call_us = (time.perf_counter() - start) / (args.repeat * len(rows)) * 1e6
+
+    print(f"examples:  {len(rows)}")
+    print(f"coverage:  {handled / len(rows):.1%} answered without the LLM")
+    print(f"accuracy:  {correct / handled if handled else 0:.1%} of answered ({correct}/{handled})")
+    print(f"latency:   {per_call_us:.1f} us per call")
+    for text, label, predicted in errors:
+        print(f"wrong     {text!r}: expected {label}, got {predicted}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+# Ingest throughput of the chunked PDF index: parse, chunk, embed and FAISS build of one long book.
+# Run from src/:  python -m benchmarks.pdf_chunk_bench --pages 500 --batches 32 128 256
+import argparse
+import os
+import random
+import tempfile
+import time
+
+WORDS = ('vector matrix gradient theorem energy molecule empire treaty enzyme circuit voltage market '
+         'inflation protein orbit lattice equation sequence cell genome algorithm network proof river').split()
+
+def write_synthetic_pdf(path, pages, lines_per_page=40, seed=0):
+    # a bare PDF 1.4 writer, enough for pypdf to extract the text of every page
+    rng = random.Random(seed)
+    objects = ['<< /Type /Catalog /Pages 2 0 R >>', None, '<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>']
+    kids = []
+    for page in range(pages):
+        lines = [' '.join(rng.choice(WORDS) for _ in range(12)) for _ in range(lines_per_page)]
+        body = ['BT /F1 10 Tf 14 TL 40 800 Td', f"(Chapter {page // 20 + 1} page {page + 1}) Tj T*"]
+        body += [f"({line}) Tj T*" for line in lines]
+        stream = '\n'.join(body + ['ET'])
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>")
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {pages} >>"
+    out = bytearray(b'%PDF-1.4\n')
+    offsets = []
+    for number, obj in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{obj}\nendobj\n".encode('latin-1')
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode('latin-1')
+    out += ''.join(f"{offset:010d} 00000 n \n" for offset in offsets).encode('latin-1')
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode('latin-1')
+    with open(path, 'wb') as f:
+        f.write(out)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pdf', help='benchmark a real book instead of a synthetic one')
+    parser.add_argument('--pages', type=int, default=500)
+    parser.add_argument('--batches', type=int, nargs='+', default=[32, 128, 256])
+    parser.add_argument('--bge-folder', default='../pdf_embeder-bge-base')
+    parser.add_argument('--device', default='cpu')
+    args = parser.parse_args()
+
+    from langchain_community.document_loaders import PyPDFLoader
+    from langchain_community.vectorstores import FAISS
+    from InferenceBackend import load_bge
+    from PdfChunker import chunk_pages, embed_in_batches
+
+    pdf_path = args.pdf
+    if pdf_path is None:
+        pdf_path = os.path.join(tempfile.mkdtemp(), 'synthetic.pdf')
+        write_synthetic_pdf(pdf_path, args.pages)
+
+    start = time.perf_counter()
+    pages = PyPDFLoader(pdf_path).load()
+    parse_s = time.perf_counter() - start
+    start = time.perf_counter()
+    chunks = chunk_pages(pages, {'fileId': 'bench', 'fileName': pdf_path})
+    chunk_s = time.perf_counter() - start
+    texts = [chunk.page_content for chunk in chunks]
+    print(f"{len(pages)} pages, {len(chunks)} chunks")
+    print(f"parse  {parse_s:8.2f}s  {len(pages) / parse_s:8.1f} pages/s")
+    print(f"chunk  {chunk_s:8.2f}s  {len(chunks) / chunk_s:8.1f} chunks/s")
+
+    embedding_model = load_bge(args.bge_folder, args.device)
+    embedding_model.embed_documents(texts[:8])
+    vectors = None
+    for batch in args.batches:
+        embedding_model.encode_kwargs['batch_size'] = batch
+        start = time.perf_counter()
+        vectors = embed_in_batches(embedding_model, texts, batch)
+        embed_s = time.perf_counter() - start
+        print(f"embed  {embed_s:8.2f}s  {len(chunks) / embed_s:8.1f} chunks/s  "
+              f"{len(pages) / embed_s:8.1f} pages/s  (batch {batch})")
+
+    start = time.perf_counter()
+    FAISS.from_embeddings(list(zip(texts, vectors)), embedding_model, metadatas=[chunk.metadata for chunk in chunks])
+    build_s = time.perf_counter() - start
+    print(f"faiss  {build_s:8.2f}s")
+    print(f"total for the book at batch {args.batches[-1]}: {parse_s + chunk_s + embed_s + build_s:.1f}s")
+
+if __name__ == '__main__':
+    main()
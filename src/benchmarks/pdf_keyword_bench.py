@@ -0,0 +1,62 @@
+# Build time, incremental update time, query latency and exact-title hit rate of the BM25 PDF index.
+# Run from src/:  python -m benchmarks.pdf_keyword_bench --docs 1000 20000 100000
+import argparse
+import random
+import time
+from types import SimpleNamespace
+import numpy as np
+from PdfKeywordIndex import KeywordIndex
+
+WORDS = ('vector matrix gradient theorem energy molecule empire treaty enzyme circuit voltage market '
+         'inflation protein orbit lattice equation sequence cell genome algorithm network proof river '
+         'history physics chemistry biology economics calculus geometry poetry novel grammar').split()
+
+def synthetic_segment(start, count, rng):
+    # summary-shaped documents, the title and filename are unique per book like real uploads
+    documents = {}
+    for i in range(start, start + count):
+        title = f"{rng.choice(WORDS)} {rng.choice(WORDS)} volume {i}"
+        text = (f"Book Title: {title}\nFile Name: {title.replace(' ', '_')}_{i}.pdf\n"
+                f"AI Analysis: {' '.join(rng.choice(WORDS) for _ in range(150))}")
+        documents[f"doc-{i}"] = SimpleNamespace(page_content=text, metadata={'fileId': str(i), 'title': title})
+    return SimpleNamespace(docstore=SimpleNamespace(_dict=documents))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--docs', type=int, nargs='+', default=[1000, 20000, 100000])
+    parser.add_argument('--segment', type=int, default=2500)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'docs':>7} {'build_s':>8} {'append_ms':>10} {'p50_ms':>8} {'p95_ms':>8} {'title@1':>8}")
+    for n in args.docs:
+        rng = random.Random(args.seed)
+        segments = {}
+        for start in range(0, n, args.segment):
+            segments[f"segment-{start}"] = synthetic_segment(start, min(args.segment, n - start), rng)
+        index = KeywordIndex()
+        started = time.perf_counter()
+        index.sync(segments)
+        build_s = time.perf_counter() - started
+
+        # one more upload: only the new segment is tokenized, corpus statistics are recomputed
+        segments['segment-new'] = synthetic_segment(n, 1, rng)
+        started = time.perf_counter()
+        index.sync(segments)
+        append_ms = (time.perf_counter() - started) * 1000
+
+        documents = [doc for segment in segments.values() for doc in segment.docstore._dict.values()]
+        latencies = []
+        hits = 0
+        for doc in rng.sample(documents, min(args.queries, len(documents))):
+            started = time.perf_counter()
+            results = index.search(doc.metadata['title'], args.k)
+            latencies.append((time.perf_counter() - started) * 1000)
+            hits += bool(results) and results[0][0] is doc
+        print(f"{n:>7} {build_s:>8.2f} {append_ms:>10.1f} {np.percentile(latencies, 50):>8.2f} "
+              f"{np.percentile(latencies, 95):>8.2f} {hits / len(latencies):>8.3f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+# Peak Python memory of returning a PDF as base64-in-JSON against streaming it in chunks.
+# Run from src/:  python -m benchmarks.pdf_stream_bench --sizes 10 50 200
+import argparse
+import base64
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+from PdfStream import iter_file, parse_range
+
+def base64_response(path):
+    with open(path, 'rb') as f:
+        pdf_bytes = base64.b64encode(f.read()).decode('utf-8')
+    return len(json.dumps({'reply': pdf_bytes, 'pdf_name': 'book.pdf'}).encode('utf-8'))
+
+def streamed_response(path, range_header=None):
+    f = open(path, 'rb')
+    size = os.fstat(f.fileno()).st_size
+    start, end = parse_range(range_header, size) or (0, size - 1)
+    return sum(len(chunk) for chunk in iter_file(f, start, end - start + 1))
+
+def measure(fn, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    sent = fn(*args)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return sent, peak, elapsed
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 50, 200], help='file sizes in MB')
+    args = parser.parse_args()
+
+    print(f"{'MB':>6} {'mode':>10} {'sent_MB':>8} {'peak_MB':>8} {'ms':>8}")
+    for size_mb in args.sizes:
+        with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as f:
+            f.write(os.urandom(size_mb * 2**20))
+            path = f.name
+        try:
+            for mode, fn, extra in (
+                ('base64', base64_response, ()),
+                ('stream', streamed_response, ()),
+                ('range1MB', streamed_response, ('bytes=0-1048575',)),
+            ):
+                sent, peak, elapsed = measure(fn, path, *extra)
+                print(f"{size_mb:>6} {mode:>10} {sent / 2**20:>8.1f} {peak / 2**20:>8.1f} {elapsed * 1000:>8.1f}")
+        finally:
+            os.remove(path)
+
+if __name__ == '__main__':
+    main()
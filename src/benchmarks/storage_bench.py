@@ -0,0 +1,73 @@
+# Upload, download and name-lookup throughput of each storage backend, no network needed for local/memory.
+# Run from src/:  python -m benchmarks.storage_bench --backends local memory --size-kb 64 4096 --files 32
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import numpy as np
+from StorageBackend import create_storage
+from LocalStorage import LocalStorage
+
+def make_backend(name, root):
+    if name == 'local':
+        return LocalStorage(root=os.path.join(root, 'local_storage'))
+    # drive needs a valid google_token.json, it is authorized on connect
+    return create_storage(name, connect=True)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--backends', nargs='+', default=['local', 'memory'])
+    parser.add_argument('--size-kb', type=int, nargs='+', default=[64, 4096])
+    parser.add_argument('--files', type=int, default=32)
+    parser.add_argument('--lookups', type=int, default=1000)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix='storage_bench_')
+    rng = np.random.default_rng(0)
+    print(f"{'backend':>8} {'size_kb':>8} {'up_mb_s':>9} {'down_mb_s':>10} {'lookup_us':>10}")
+    try:
+        for backend_name in args.backends:
+            storage = make_backend(backend_name, root)
+            for size_kb in args.size_kb:
+                folder = os.path.join(root, f"{backend_name}_{size_kb}")
+                os.makedirs(folder)
+                paths = []
+                for i in range(args.files):
+                    path = os.path.join(folder, f"bench_{i}.bin")
+                    with open(path, 'wb') as f:
+                        f.write(rng.bytes(size_kb * 1024))
+                    paths.append(path)
+                total_mb = args.files * size_kb / 1024
+
+                started = time.perf_counter()
+                file_ids = storage.upload_many(paths)
+                upload_s = time.perf_counter() - started
+
+                started = time.perf_counter()
+                storage.download_many([(file_id, f"{path}.out") for file_id, path in zip(file_ids, paths)])
+                download_s = time.perf_counter() - started
+
+                # the image map lookup every sync does
+                name = f"bench_map_{size_kb}.json"
+                with open(name, 'w') as f:
+                    f.write('{}')
+                try:
+                    storage.upload_vector_img(name)
+                finally:
+                    os.remove(name)
+                started = time.perf_counter()
+                for _ in range(args.lookups):
+                    storage.search_vector_img(name)
+                lookup_us = (time.perf_counter() - started) / args.lookups * 1e6
+
+                for file_id in file_ids:
+                    storage.delete_file(file_id)
+                print(f"{backend_name:>8} {size_kb:>8} {total_mb / upload_s:>9.1f} "
+                      f"{total_mb / download_s:>10.1f} {lookup_us:>10.1f}")
+            storage.transfer_pool.shutdown()
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
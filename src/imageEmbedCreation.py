@@ -2,60 +2,216 @@ import io
 import uuid
 import numpy as np
 from PIL import Image
-from transformers import SiglipImageProcessor, SiglipModel, SiglipTokenizer, SiglipProcessor
 import json
 import os
-import torch
+import threading
+import asyncio
+from ImageEmbeddingStore import ImageEmbeddingStore
+from InferenceBatcher import InferenceBatcher
+from AsyncRuntime import run_drive, run_model
+from ImageIndex import FlatImageIndex, build_image_index, wants_ann, index_path, load_image_index, decoded
+from StartupOrchestrator import LazyResource
+from InferenceBackend import load_siglip
+IMAGE_STORE_FOLDER = 'image_store'
+IMAGE_SYNC_EVERY = int(os.getenv('IMAGE_SYNC_EVERY', '25'))
+IMAGE_SYNC_INTERVAL = float(os.getenv('IMAGE_SYNC_INTERVAL', '300'))
+IMAGE_BATCH_SIZE = int(os.getenv('IMAGE_BATCH_SIZE', '8'))
+TEXT_BATCH_SIZE = int(os.getenv('TEXT_BATCH_SIZE', '32'))
+INFERENCE_BATCH_WAIT_MS = float(os.getenv('INFERENCE_BATCH_WAIT_MS', '5'))
 
 class ImgEmbedder:
-    def __init__(self, MODEL_FOLDER, myDrive, device):
+    def __init__(self, MODEL_FOLDER, myDrive, device, autostart=True):
         self.mydrive = myDrive
         self.device = device
         self.npy_filename = 'imageVector.npy'
         self.json_filename = 'image.json'
+        self.codebook_filename = 'imageVectorPQ.npy'
         self.npy_file_id = None
         self.json_file_id = None
-        image_processor = SiglipImageProcessor.from_pretrained(MODEL_FOLDER, local_files_only=True)
-        tokenizer = SiglipTokenizer.from_pretrained(MODEL_FOLDER, local_files_only=True)
-        self.processor = SiglipProcessor(image_processor=image_processor, tokenizer=tokenizer)
-        self.model = SiglipModel.from_pretrained(MODEL_FOLDER, local_files_only=True).to(self.device)
-        self.model.eval()
-        self.image_map = {}   
+        self.model_folder = MODEL_FOLDER
+        self.siglip = LazyResource('siglip', self.load_model)
+        self.image_batcher = InferenceBatcher(self.embed_images, IMAGE_BATCH_SIZE, INFERENCE_BATCH_WAIT_MS, 'siglip-image')
+        self.text_batcher = InferenceBatcher(self.embed_texts, TEXT_BATCH_SIZE, INFERENCE_BATCH_WAIT_MS, 'siglip-text')
+        self.store = ImageEmbeddingStore(IMAGE_STORE_FOLDER)
+        self.image_map = self.store.image_map
         self.embeddings = None 
+        self.index = FlatImageIndex()
+        self.index_lock = threading.Lock()
+        self.index_build_lock = threading.Lock()
+        self.sync_lock = threading.Lock()
+        self.sync_wakeup = threading.Event()
+        self.stop_sync = threading.Event()
+        self.synced_count = 0
+        self.started = False
+        if autostart:
+            self.start()
+
+    def start(self):
         self.load_state()
+        self.started = True
+        threading.Thread(target=self.sync_loop, daemon=True).start()
+
+    def load_model(self):
+        self.mydrive.download_model(self.model_folder)
+        return load_siglip(self.model_folder, self.device)
 
     def load_state(self):
-        found_json = self.mydrive.search_vector_img(self.json_filename)
-       
+        found = self.mydrive.search_vector_imgs([self.json_filename, self.npy_filename, self.codebook_filename])
+        found_json, found_npy, found_codebook = (found[name] for name in (self.json_filename, self.npy_filename, self.codebook_filename))
+        remote_map = {}
+        prefetched = set()
         if found_json and 'id' in found_json:
             self.json_file_id = found_json['id']
-            self.mydrive.download_file(self.json_file_id, self.json_filename)
+            downloads = [(self.json_file_id, self.json_filename)]
+            if len(self.store) == 0:
+                # an empty store will need the vectors too, fetch them alongside the map
+                downloads += [(f['id'], name) for f, name in ((found_npy, self.npy_filename), (found_codebook, self.codebook_filename)) if f]
+            prefetched = {name for (_, name), ok in zip(downloads, self.mydrive.download_many(downloads)) if ok}
             if os.path.exists(self.json_filename):
                 with open(self.json_filename, "r") as f:
-                    self.image_map = json.load(f)
-        else:
-            self.image_map = {}
-        found_npy = self.mydrive.search_vector_img(self.npy_filename)
-        if found_npy and 'id' in found_npy:
-            self.npy_file_id = found_npy['id']
-            self.mydrive.download_file(self.npy_file_id, self.npy_filename)
-            if os.path.exists(self.npy_filename):
-                self.embeddings = np.load(self.npy_filename)
+                    remote_map = json.load(f)
+
+        # the local store may hold images that were appended but not synced yet
+        if len(self.store) < len(remote_map) or len(self.store) == 0:
+            embeddings = None
+            centroids = None
+            if found_npy and 'id' in found_npy:
+                self.npy_file_id = found_npy['id']
+                if self.npy_filename not in prefetched:
+                    self.mydrive.download_file(self.npy_file_id, self.npy_filename)
+                if os.path.exists(self.npy_filename):
+                    embeddings = np.load(self.npy_filename, mmap_mode='r')
+            if embeddings is not None and embeddings.dtype == np.uint8:
+                # pq codes are meaningless without the codebook they were encoded with
+                if found_codebook and 'id' in found_codebook:
+                    if self.codebook_filename not in prefetched:
+                        self.mydrive.download_file(found_codebook['id'], self.codebook_filename)
+                    centroids = np.load(self.codebook_filename)
+            self.store.reset(embeddings, remote_map, centroids)
+            self.synced_count = len(self.store)
+            if self.store.codec is not None and os.path.exists(self.saved_index_path()):
+                # the saved index described the rows the store held before
+                os.remove(self.saved_index_path())
         else:
-            self.embeddings = None
+            self.synced_count = len(remote_map)
+        self.image_map = self.store.image_map
+        self.embeddings = self.store.matrix()
+        # searches start on the exact flat scan, an ANN index is reloaded or built off the request path
+        self.index = FlatImageIndex(self.embeddings, self.store.codec)
+        if self.embeddings is not None and wants_ann(len(self.embeddings)):
+            saved = load_image_index(self.saved_index_path(), len(self.embeddings))
+            if saved is not None:
+                if len(saved) < len(self.embeddings):
+                    saved.add(decoded(self.embeddings, self.store.codec, len(saved)), self.embeddings, self.store.codec)
+                self.index = saved
+            else:
+                self.build_index_in_background()
+
+    def saved_index_path(self):
+        return index_path(self.store.folder, self.store.codec)
+
+    def update_index(self, new_embedding):
+        # called with index_lock held
+        self.index.add(new_embedding, self.embeddings, self.store.codec)
+        if isinstance(self.index, FlatImageIndex) and wants_ann(len(self.embeddings)):
+            self.build_index_in_background()
+
+    def build_index_in_background(self):
+        if self.index_build_lock.locked():
+            return
+        threading.Thread(target=self.build_index, daemon=True).start()
+
+    def build_index(self):
+        if not self.index_build_lock.acquire(blocking=False):
+            return
+        try:
+            while True:
+                with self.index_lock:
+                    embeddings, codec = self.embeddings, self.store.codec
+                index = build_image_index(embeddings, codec=codec)
+                with self.index_lock:
+                    # a re-encode while building changes the rows, start over on the new ones
+                    if self.store.codec is not codec:
+                        continue
+                    # images added during the build
+                    if len(self.embeddings) > len(index):
+                        index.add(decoded(self.embeddings, codec, len(index)), self.embeddings, codec)
+                    self.index = index
+                    break
+            print(f"built {index.kind} image index over {len(index)} vectors")
+            self.save_index()
+        except Exception as e:
+            print(f"error building the image index: {e}")
+        finally:
+            self.index_build_lock.release()
+
+    def save_index(self):
+        # faiss cannot serialize an index while another thread adds to it
+        with self.index_lock:
+            if isinstance(self.index, FlatImageIndex):
+                return
+            try:
+                self.index.save(self.saved_index_path())
+            except Exception as e:
+                print(f"error saving the image index: {e}")
 
     def save_state(self):
-        with open(self.json_filename, "w") as f:
-            json.dump(self.image_map, f)
-        self.json_file_id = self.mydrive.upload_vector_img(self.json_filename)
-        if self.embeddings is not None:
-            np.save(self.npy_filename, self.embeddings)
-            self.npy_file_id = self.mydrive.upload_vector_img(self.npy_filename)
+        with self.sync_lock:
+            count, image_map, embeddings = self.store.snapshot()
+            if count == self.synced_count:
+                return
+            with open(self.json_filename, "w") as f:
+                json.dump(image_map, f)
+            uploads = [self.json_filename]
+            if embeddings is not None:
+                # uploaded in the store's codec, so sync size shrinks with it
+                codebook = self.store.codebook()
+                if codebook is not None:
+                    np.save(self.codebook_filename, codebook)
+                    uploads.append(self.codebook_filename)
+                np.save(self.npy_filename, embeddings)
+                uploads.append(self.npy_filename)
+            file_ids = dict(zip(uploads, self.mydrive.upload_many(uploads, self.mydrive.upload_vector_img)))
+            if None in file_ids.values():
+                raise Exception(f"image vector upload failed: {file_ids}")
+            self.json_file_id = file_ids[self.json_filename]
+            self.npy_file_id = file_ids.get(self.npy_filename, self.npy_file_id)
+            self.synced_count = count
+        self.save_index()
+
+    def sync_loop(self):
+        while not self.stop_sync.is_set():
+            self.sync_wakeup.wait(IMAGE_SYNC_INTERVAL)
+            self.sync_wakeup.clear()
+            try:
+                self.save_state()
+            except Exception as e:
+                print(f"error syncing image vectors: {e}")
+
+    def flush(self):
+        if not self.started:
+            # nothing was loaded from Drive, uploading now would overwrite it
+            return
+        self.stop_sync.set()
+        self.sync_wakeup.set()
+        self.save_state()
 
-    def add_image(self, img_binary):
+    def embed_images(self, images):
+        processor, runner = self.siglip.get()
+        inputs = processor(images=images, return_tensors="pt").to(self.device)
+        return runner.image_features(inputs)
+
+    def embed_texts(self, texts):
+        processor, runner = self.siglip.get()
+        inputs = processor(text=texts, return_tensors="pt", padding="max_length", truncation=True).to(self.device)
+        return runner.text_features(inputs)
+
+    def add_image(self, img_source):
 
         try:
-            img = Image.open(io.BytesIO(img_binary)).convert('RGB')
+            if isinstance(img_source, (bytes, bytearray)):
+                img_source = io.BytesIO(img_source)
+            img = Image.open(img_source).convert('RGB')
             unique_name = f"{uuid.uuid4().hex}.png"
             img.save(unique_name, "PNG")
             image_drive_id = self.mydrive.upload_image(unique_name)
@@ -65,61 +221,54 @@ class ImgEmbedder:
             if os.path.exists(unique_name):
                 os.remove(unique_name)
 
-            inputs = self.processor(images=img, return_tensors="pt").to(self.device)
-            with torch.no_grad():
-                features = self.model.get_image_features(**inputs)
-                if hasattr(features, "pooler_output"):
-                    features = features.pooler_output
-                elif hasattr(features, "image_embeds"):
-                    features = features.image_embeds
-                features = features / features.norm(p=2, dim=-1, keepdim=True)
-                new_embedding = features.cpu().numpy()
-            current_idx = len(self.image_map)
-            self.image_map[str(current_idx)] = image_drive_id
-            
-            if self.embeddings is None:
-                self.embeddings = new_embedding
-            else:
-                self.embeddings = np.vstack((self.embeddings, new_embedding))
-            self.save_state()
+            new_embedding = self.image_batcher(img)[None, :]
+            with self.index_lock:
+                self.store.append(new_embedding[0], image_drive_id)
+                self.embeddings = self.store.matrix()
+                self.update_index(new_embedding)
+            if len(self.store) - self.synced_count >= IMAGE_SYNC_EVERY:
+                self.sync_wakeup.set()
 
         except Exception as e:
             print(f"Error adding image: {e}")
 
+    def result_file_ids(self, text_vec, top_k):
+        # HNSW/IVF searches are not safe against a concurrent add
+        with self.index_lock:
+            top_indices, _ = self.index.search(text_vec, top_k)
+        file_ids = []
+        for idx in top_indices:
+            idx_str = str(idx)
+            if idx_str not in self.image_map:
+                continue
+            file_ids.append(self.image_map[idx_str])
+        return file_ids
+
     def search_and_send(self, query, top_k=1):
 
         if self.embeddings is None or len(self.image_map) == 0:
             return {"reply": "Database is empty."}
 
         try:
-            inputs = self.processor(text=[query], return_tensors="pt", padding="max_length", truncation=True).to(self.device)
-            with torch.no_grad():
-                text_feat = self.model.get_text_features(**inputs)
-                if hasattr(text_feat, "pooler_output"):
-                    text_feat = text_feat.pooler_output
-                elif hasattr(text_feat, "text_embeds"):
-                    text_feat = text_feat.text_embeds
-                text_feat = text_feat / text_feat.norm(p=2, dim=-1, keepdim=True)
-                text_vec = text_feat.cpu().numpy()
-            scores = text_vec @ self.embeddings.T
-            top_indices = scores[0].argsort()[-top_k:][::-1]
-
-            results = []
-            for idx in top_indices:
-                idx_str = str(idx)
-                if idx_str not in self.image_map:
-                    continue
-                file_id = self.image_map[idx_str]
-                temp_dl_path = f"temp_{idx_str}.png"
-                try:
-                    self.mydrive.download_file(file_id, temp_dl_path)
-                    if os.path.exists(temp_dl_path):
-                        with open(temp_dl_path, "rb") as f:
-                            results.append(f.read())
-                        os.remove(temp_dl_path)
-                except Exception as dl_error:
-                    print(f"Failed to download image {file_id}: {dl_error}")
-            return results
+            text_vec = self.text_batcher(query)
+
+            downloads = self.mydrive.file_cache.read_bytes_many(self.result_file_ids(text_vec, top_k))
+            return [img_bytes for img_bytes in downloads if img_bytes is not None]
+        except Exception as e:
+            print(f"Error in search: {e}")
+            return []
+
+    async def asearch_and_send(self, query, top_k=1):
+
+        if self.embeddings is None or len(self.image_map) == 0:
+            return {"reply": "Database is empty."}
+
+        try:
+            text_vec = await asyncio.wrap_future(self.text_batcher.submit(query))
+            file_ids = await run_model(self.result_file_ids, text_vec, top_k)
+            # one drive-io slot per search, the top-k fetches fan out on the transfer pool
+            downloads = await run_drive(self.mydrive.file_cache.read_bytes_many, file_ids)
+            return [img_bytes for img_bytes in downloads if img_bytes is not None]
         except Exception as e:
             print(f"Error in search: {e}")
-            return []
\ No newline at end of file
+            return []
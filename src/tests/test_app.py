@@ -0,0 +1,75 @@
+import os
+import tempfile
+import pytest
+
+pytest.importorskip('fastapi')
+pytest.importorskip('torch')
+from fastapi.testclient import TestClient
+
+# app.py builds its stores on import relative to the working directory, keep them out of src/
+working_dir = os.getcwd()
+os.chdir(tempfile.mkdtemp(prefix='app_test_'))
+try:
+    app_module = pytest.importorskip('app')
+finally:
+    os.chdir(working_dir)
+
+@pytest.fixture
+def client(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    # the routes wait on startup steps and Drive auth, neither runs in tests
+    async def ready(*names):
+        pass
+    monkeypatch.setattr(app_module.startup, 'await_steps', ready)
+    monkeypatch.setattr(app_module.mydriveInst, 'cred_state', True)
+    return TestClient(app_module.app)
+
+def test_search_without_thread_id_gets_its_own_session(client, monkeypatch):
+    seen = []
+
+    async def search(query, k=3, session_id=None, inline_pdf=True):
+        seen.append(session_id)
+        return []
+    monkeypatch.setattr(app_module.myPdfInsta, 'asearch_query', search)
+    first = client.post('/search_pdf_query', json={'Pdf_query': 'linear algebra'}).json()
+    second = client.post('/search_pdf_query', json={'Pdf_query': 'the first one'}).json()
+    assert first['thread_id'] and second['thread_id'] and first['thread_id'] != second['thread_id']
+    assert seen == [first['thread_id'], second['thread_id']]
+    # a client that sends its id back keeps using it
+    third = client.post('/search_pdf_query', json={'Pdf_query': 'the first one', 'thread_id': first['thread_id']}).json()
+    assert third['thread_id'] == first['thread_id'] and seen[-1] == first['thread_id']
+
+@pytest.mark.parametrize('body', ['not json', '{"pdf_name": "a.pdf"}', '{"pdf_name": "a.pdf", "buffer": {"data": "x"}}', '[]'])
+def test_invalid_json_body_is_422(client, body):
+    response = client.post('/send-pdfbuffer', content=body, headers={'content-type': 'application/json'})
+    assert response.status_code == 422
+    assert 'detail' in response.json()
+
+def test_large_multipart_upload_is_spooled_to_the_temp_dir(client, monkeypatch, tmp_path):
+    import UploadSpool
+    spool_dir = tmp_path / 'spool'
+    spool_dir.mkdir()
+    monkeypatch.setattr(UploadSpool, 'UPLOAD_SPOOL_DIR', str(spool_dir))
+    seen = {}
+
+    def create_pdf_from_file(local_path, pdf_name):
+        seen.update(path=local_path, name=pdf_name, size=os.path.getsize(local_path))
+        return 'file-id'
+    monkeypatch.setattr(app_module.myPdfInsta, 'create_pdf_from_file', create_pdf_from_file)
+    monkeypatch.setattr(app_module.myPdfInsta, 'createEmbedding', lambda file_id, pdf_name: None)
+    # past starlette's 1 MB in-memory limit for a form part
+    data = b'%PDF-1.4\n' + os.urandom(3 * 1024 * 1024)
+    response = client.post('/send-pdfbuffer', files={'file': ('big book.pdf', data, 'application/pdf')})
+    assert response.json() == {'reply': 'PDF metadata indexed successfully'}
+    assert os.path.dirname(seen['path']) == str(spool_dir)
+    assert seen['size'] == len(data) and seen['name'] == 'big book.pdf'
+    assert list(spool_dir.iterdir()) == []
+    assert not any(name.startswith('upload_') for name in os.listdir(tmp_path))
+
+def test_oversized_upload_is_refused_and_removed(client, monkeypatch, tmp_path):
+    import UploadSpool
+    monkeypatch.setattr(UploadSpool, 'UPLOAD_SPOOL_DIR', str(tmp_path))
+    monkeypatch.setattr(UploadSpool, 'MAX_UPLOAD_BYTES', 1024)
+    response = client.post('/send-pdfbuffer', files={'file': ('a.pdf', b'x' * 4096, 'application/pdf')})
+    assert 'error' in response.json()
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,69 @@
+import pytest
+
+pytest.importorskip('langgraph')
+pytest.importorskip('langchain_huggingface')
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.checkpoint.memory import MemorySaver
+import ChatController
+from ChatController import Chat_HuggingFaceController, window_start
+from LLMResponseCache import CachedChatModel, LLMResponseCache
+from StartupOrchestrator import LazyResource
+
+class FakeChatModel:
+    # answers every prompt, counts the summary requests apart from the replies
+    def __init__(self):
+        self.replies = 0
+        self.summaries = 0
+
+    def invoke(self, prompt, *args, **kwargs):
+        if 'Fold the conversation' in prompt.to_messages()[0].content:
+            self.summaries += 1
+            return AIMessage(content=f"summary {self.summaries}")
+        self.replies += 1
+        return AIMessage(content=f"reply {self.replies}")
+
+    async def ainvoke(self, prompt, *args, **kwargs):
+        return self.invoke(prompt, *args, **kwargs)
+
+@pytest.fixture
+def controller(monkeypatch):
+    monkeypatch.setattr(ChatController, 'CHAT_HISTORY_MAX_TURNS', 10)
+    monkeypatch.setattr(ChatController, 'CHAT_HISTORY_KEEP_TURNS', 5)
+    monkeypatch.setattr(ChatController, 'CHAT_HISTORY_SUMMARIZE', True)
+    model = FakeChatModel()
+    controller = Chat_HuggingFaceController('fake-model', None, connect=False)
+    controller.chat_model = LazyResource('chat_llm', lambda: model)
+    controller.response_model = CachedChatModel(controller.chat_model, LLMResponseCache(), 'chat')
+    controller.workflow = controller.graph_state.compile(checkpointer=MemorySaver())
+    controller.model = model
+    return controller
+
+def turns(count):
+    history = []
+    for i in range(count):
+        history += [HumanMessage(content=f"question {i}"), AIMessage(content=f"answer {i}")]
+    return history
+
+def test_window_start():
+    assert window_start(turns(3), 10, 3000) == 0
+    assert window_start(turns(12), 10, 3000) == 4
+    # the token budget cuts first, and the window never starts on a reply
+    assert window_start(turns(12), 10, 20) == 22
+    assert window_start([AIMessage(content='hi')] + turns(2), 10, 3000) == 1
+
+def test_trim_goes_down_to_the_low_watermark(controller):
+    state = {'messages': turns(11) + [HumanMessage(content='next')], 'summary': None}
+    dropped = controller.history_overflow(state)
+    # 11 turns is past the 10 turn window, the trim keeps the last 5
+    assert len(dropped) == 12
+    assert controller.history_overflow({'messages': turns(10) + [HumanMessage(content='next')]}) == []
+
+def test_summary_calls_are_spread_over_several_turns(controller):
+    config = {'configurable': {'thread_id': 'long-chat'}}
+    for i in range(30):
+        assert controller.chat(f"question {i}", 'long-chat') == f"reply {i + 1}"
+    # trims after turns 12, 18, 24 and 30 instead of on every turn past the 11th
+    assert controller.model.summaries == 4
+    state = controller.workflow.get_state(config).values
+    assert state['summary'] == 'summary 4'
+    assert len(state['messages']) <= ChatController.CHAT_HISTORY_MAX_TURNS * 2 + 2
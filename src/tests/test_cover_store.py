@@ -0,0 +1,52 @@
+import io
+import pytest
+from PIL import Image
+import CoverStore
+from CoverStore import CoverStore as Store
+from LocalStorage import MemoryStorage
+
+@pytest.fixture
+def storage():
+    backend = MemoryStorage()
+    yield backend
+    backend.transfer_pool.shutdown()
+
+def png_bytes(size=(300, 400), color=(200, 30, 30)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+def test_replacing_a_cover_keeps_bytes_exact(storage, tmp_path):
+    store = Store(storage, folder=str(tmp_path / 'covers'))
+    store.put_bytes('abc', b'x' * 100, 'jpeg')
+    store.put_bytes('abc', b'x' * 40, 'jpeg')
+    store.put_bytes('def', b'x' * 10, 'jpeg')
+    assert store.stats()['bytes'] == 50
+    assert store.stats()['covers'] == 2
+    # a cover re-stored in another format replaces the old file
+    store.put_bytes('abc', b'x' * 30, 'webp')
+    assert sorted(p.name for p in (tmp_path / 'covers').iterdir()) == ['abc.webp', 'def.jpeg']
+    assert store.stats()['bytes'] == 40
+    assert Store(storage, folder=str(tmp_path / 'covers')).stats()['bytes'] == 40
+
+def test_replacing_a_cover_drops_its_base64(storage, tmp_path):
+    store = Store(storage, folder=str(tmp_path / 'covers'))
+    store.put_bytes('abc', b'old', 'jpeg')
+    assert store.read_base64('abc') == 'b2xk'
+    store.put_bytes('abc', b'new', 'jpeg')
+    assert store.read_base64('abc') == 'bmV3'
+
+def test_legacy_png_cover_is_converted_once(storage, tmp_path):
+    (tmp_path / 'cover.png').write_bytes(png_bytes())
+    cover_id = storage.upload_image(str(tmp_path / 'cover.png'))
+    store = Store(storage, folder=str(tmp_path / 'covers'))
+    store.format = 'jpeg'
+    path, mime = store.get(cover_id)
+    assert mime == 'image/jpeg'
+    with Image.open(path) as image:
+        assert image.size == (CoverStore.COVER_WIDTH, CoverStore.COVER_HEIGHT)
+    assert store.get(cover_id) == (path, mime)
+    stats = store.stats()
+    assert stats['converted_from_drive'] == 1 and stats['misses'] == 1 and stats['hits'] == 1
+    assert store.get('../etc') == (None, None)
+    assert store.get('missing') == (None, None)
@@ -0,0 +1,49 @@
+from DriveFileCache import DriveFileCache
+from LocalStorage import MemoryStorage
+
+def make(tmp_path, max_bytes, sizes):
+    storage = MemoryStorage()
+    file_ids = []
+    for i, size in enumerate(sizes):
+        path = tmp_path / f"{i}.bin"
+        path.write_bytes(bytes([i]) * size)
+        file_ids.append(storage.upload_image(str(path)))
+    return storage, DriveFileCache(storage, folder=str(tmp_path / 'cache'), max_bytes=max_bytes), file_ids
+
+def test_fetch_hits_after_first_download(tmp_path):
+    storage, cache, (file_id,) = make(tmp_path, 1000, [10])
+    assert cache.read_bytes(file_id) == bytes([0]) * 10
+    assert cache.read_bytes(file_id) == bytes([0]) * 10
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+    assert cache.fetch('missing') is None
+    assert cache.stats()['entries'] == 1
+
+def test_evicts_least_recently_used(tmp_path):
+    storage, cache, (a, b, c) = make(tmp_path, 250, [100, 100, 100])
+    cache.fetch(a)
+    cache.fetch(b)
+    cache.fetch(a)
+    cache.fetch(c)
+    stats = cache.stats()
+    assert stats['evictions'] == 1 and stats['bytes'] == 200
+    assert list(cache.entries) == [a, c]
+    assert not (tmp_path / 'cache' / b).exists()
+    # evicted entries are downloaded again
+    assert cache.read_bytes(b) == bytes([1]) * 100
+    assert cache.stats()['misses'] == 4
+
+def test_keeps_a_single_oversized_entry(tmp_path):
+    storage, cache, (file_id,) = make(tmp_path, 10, [100])
+    assert cache.read_bytes(file_id) == bytes([0]) * 100
+    assert cache.stats()['entries'] == 1
+
+def test_put_and_rescan(tmp_path):
+    storage, cache, _ = make(tmp_path, 250, [])
+    for name in ('x', 'y', 'z'):
+        (tmp_path / name).write_bytes(b'.' * 100)
+        cache.put(name, str(tmp_path / name))
+    assert list(cache.entries) == ['y', 'z']
+    (tmp_path / 'cache' / 'stale.part').write_bytes(b'partial')
+    rescanned = DriveFileCache(storage, folder=str(tmp_path / 'cache'), max_bytes=250)
+    assert sorted(rescanned.entries) == ['y', 'z']
+    assert not (tmp_path / 'cache' / 'stale.part').exists()
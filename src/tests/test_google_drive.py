@@ -0,0 +1,248 @@
+import os
+import re
+import threading
+import time
+from types import SimpleNamespace
+import pytest
+
+pytest.importorskip('googleapiclient')
+import httplib2
+from googleapiclient.errors import HttpError
+import GoogleDrive
+from GoogleDrive import DriveAPI
+
+class FakeHttp:
+    # serves ranged GETs of the blobs in `files`, 404 for any other id; `fail` maps a byte
+    # offset to the statuses returned, one per attempt, before that range is served
+    def __init__(self, files, fail=None):
+        self.files = files
+        self.fail = fail or {}
+        self.ranges = []
+
+    def request(self, uri, method='GET', headers=None, **kwargs):
+        start, end = (int(x) for x in headers['range'].split('=')[1].split('-'))
+        self.ranges.append(start)
+        blob = self.files.get(uri)
+        if blob is None:
+            return httplib2.Response({'status': 404}), b''
+        if self.fail.get(start):
+            return httplib2.Response({'status': self.fail[start].pop(0)}), b''
+        chunk = blob[start:end + 1]
+        return httplib2.Response({
+            'status': 206, 'content-range': f"bytes {start}-{start + len(chunk) - 1}/{len(blob)}"
+        }), chunk
+
+def http_error(status):
+    return HttpError(httplib2.Response({'status': status}), b'')
+
+class FakeRequest:
+    def __init__(self, call):
+        self.call = call
+
+    def execute(self, http=None):
+        return self.call()
+
+class FakeBatch:
+    def __init__(self, service, callback):
+        self.service = service
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, request_id):
+        self.requests.append((request_id, request))
+
+    def execute(self, http=None):
+        self.service.batches.append(len(self.requests))
+        for request_id, request in self.requests:
+            try:
+                self.callback(request_id, request.execute(), None)
+            except HttpError as e:
+                self.callback(request_id, None, e)
+
+class FakeFiles:
+    def __init__(self, service):
+        self.service = service
+
+    def get_media(self, fileId):
+        return SimpleNamespace(uri=fileId, headers={}, http=None)
+
+    def list(self, q, fields=None, **kwargs):
+        parent, name = re.match(r"'([^']*)' in parents and name = '([^']*)'", q).groups()
+        def call():
+            self.service.lists.append(name)
+            if name in self.service.failing:
+                raise http_error(500)
+            return {'files': [{'id': file_id, 'name': meta['name']} for file_id, meta in self.service.meta.items()
+                              if meta['name'] == name and parent in meta['parents']]}
+        return FakeRequest(call)
+
+    def create(self, body, media_body=None, fields=None):
+        return FakeRequest(lambda: {'id': self.service.add(body['parents'][0], body['name'])})
+
+    def update(self, fileId, media_body=None):
+        def call():
+            if fileId not in self.service.meta:
+                raise http_error(404)
+            self.service.updates.append(fileId)
+            return {'id': fileId}
+        return FakeRequest(call)
+
+    def delete(self, fileId):
+        return FakeRequest(lambda: self.service.meta.pop(fileId))
+
+class FakeService:
+    # the slice of the Drive v3 files() API that DriveAPI uses
+    def __init__(self):
+        self.blobs = {}
+        self.meta = {}
+        self.lists = []
+        self.batches = []
+        self.updates = []
+        self.failing = set()
+        self.created = 0
+
+    def files(self):
+        return FakeFiles(self)
+
+    def new_batch_http_request(self, callback):
+        return FakeBatch(self, callback)
+
+    def add(self, parent, name):
+        self.created += 1
+        file_id = f"id{self.created}"
+        self.meta[file_id] = {'name': name, 'parents': [parent]}
+        return file_id
+
+@pytest.fixture
+def drive(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(GoogleDrive, 'DRIVE_CHUNK_SIZE', 10)
+    monkeypatch.setattr(GoogleDrive, 'DRIVE_CHUNK_RETRIES', 1)
+    monkeypatch.setattr(GoogleDrive, 'DRIVE_RETRY_BACKOFF', 0)
+    # MediaIoBaseDownload sleeps between its own retries
+    monkeypatch.setattr(time, 'sleep', lambda seconds: None)
+    api = DriveAPI(connect=False)
+    api.service = FakeService()
+    api.http = FakeHttp(api.service.blobs)
+    api.thread_http = lambda: api.http
+    return api
+
+def leftovers(folder):
+    return [name for name in os.listdir(folder) if name.endswith('.download')]
+
+def test_download_resumes_the_failed_chunk(drive, tmp_path):
+    blob = bytes(range(35))
+    drive.service.blobs['pdf1'] = blob
+    # the second chunk fails past MediaIoBaseDownload's own retry, download_file retries it
+    drive.http.fail = {10: [503, 503]}
+    assert drive.download_file('pdf1', str(tmp_path / 'out.pdf'))
+    assert (tmp_path / 'out.pdf').read_bytes() == blob
+    assert drive.http.ranges == [0, 10, 10, 10, 20, 30]
+    stats = drive.transfer_stats.stats()
+    assert stats['chunk_retries'] == 1
+    assert stats['download']['files'] == 1 and stats['download']['bytes'] == 35
+    assert leftovers(tmp_path) == []
+
+def test_download_gives_up_and_removes_the_partial_file(drive, tmp_path):
+    drive.service.blobs['pdf1'] = bytes(35)
+    drive.http.fail = {20: [503] * 10}
+    assert not drive.download_file('pdf1', str(tmp_path / 'out.pdf'))
+    assert not (tmp_path / 'out.pdf').exists()
+    assert leftovers(tmp_path) == []
+    stats = drive.transfer_stats.stats()
+    assert stats['chunk_retries'] == GoogleDrive.DRIVE_CHUNK_RETRIES
+    assert stats['download']['failures'] == 1
+
+def test_download_does_not_retry_a_missing_file(drive, tmp_path):
+    (tmp_path / 'out.pdf').write_bytes(b'previous')
+    assert not drive.download_file('pdf1', str(tmp_path / 'out.pdf'))
+    assert drive.http.ranges == [0]
+    assert drive.transfer_stats.stats()['chunk_retries'] == 0
+    # a failed download leaves the previous copy alone
+    assert (tmp_path / 'out.pdf').read_bytes() == b'previous'
+    assert leftovers(tmp_path) == []
+
+def test_download_many_keeps_the_order(drive, tmp_path):
+    for i in range(6):
+        drive.service.blobs[f"pdf{i}"] = bytes([i]) * (5 + 7 * i)
+    downloads = [(f"pdf{i}", str(tmp_path / f"{i}.pdf")) for i in range(6)] + [('gone', str(tmp_path / 'gone.pdf'))]
+    assert drive.download_many(downloads) == [True] * 6 + [False]
+    for i in range(6):
+        assert (tmp_path / f"{i}.pdf").read_bytes() == bytes([i]) * (5 + 7 * i)
+    assert drive.transfer_stats.stats()['download']['files'] == 6
+
+def test_each_thread_keeps_its_own_connection(drive):
+    seen = {}
+    def connect(key):
+        seen[key] = (DriveAPI.thread_http(drive), DriveAPI.thread_http(drive))
+    threads = [threading.Thread(target=connect, args=(key,)) for key in ('a', 'b')]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+    assert seen['a'][0] is seen['a'][1]
+    assert seen['a'][0] is not seen['b'][0]
+
+def test_image_lookups_go_out_in_batches(drive):
+    folder = drive.parentImgVectorsFolderID
+    names = [f"img{i}.npy" for i in range(250)]
+    found_ids = {name: drive.service.add(folder, name) for name in names[::50]}
+    drive.service.add('elsewhere', 'img1.npy')
+    found = drive.search_vector_imgs(names)
+    assert drive.service.batches == [100, 100, 50]
+    assert {name: value['id'] for name, value in found.items() if value} == found_ids
+    # found and missing answers are both cached
+    assert drive.search_vector_imgs(names) == found
+    assert drive.service.batches == [100, 100, 50]
+
+def test_a_failed_lookup_is_not_cached(drive):
+    folder = drive.parentImgVectorsFolderID
+    file_id = drive.service.add(folder, 'b.npy')
+    drive.service.failing = {'b.npy'}
+    assert drive.search_vector_imgs(['a.npy', 'b.npy']) == {'a.npy': None, 'b.npy': None}
+    drive.service.failing = set()
+    drive.service.lists.clear()
+    assert drive.search_vector_imgs(['a.npy', 'b.npy'])['b.npy']['id'] == file_id
+    assert drive.service.lists == ['b.npy']
+
+def test_put_named_file_updates_the_cached_file(drive, tmp_path):
+    folder = drive.parentImgVectorsFolderID
+    (tmp_path / 'a.npy').write_bytes(b'v1')
+    file_id = drive.put_named_file(folder, 'a.npy', 'a.npy', 'application/octet-stream')
+    assert drive.service.meta[file_id]['name'] == 'a.npy'
+    drive.service.lists.clear()
+    assert drive.put_named_file(folder, 'a.npy', 'a.npy', 'application/octet-stream') == file_id
+    assert drive.search_vector_img('a.npy')['id'] == file_id
+    assert drive.service.lists == [] and drive.service.updates == [file_id]
+
+def test_put_named_file_recreates_a_file_deleted_behind_the_cache(drive, tmp_path):
+    folder = drive.parentImgVectorsFolderID
+    (tmp_path / 'a.npy').write_bytes(b'v1')
+    file_id = drive.put_named_file(folder, 'a.npy', 'a.npy', 'application/octet-stream')
+    # removed by another instance, the cached id now answers 404
+    del drive.service.meta[file_id]
+    new_id = drive.put_named_file(folder, 'a.npy', 'a.npy', 'application/octet-stream')
+    assert new_id != file_id and new_id in drive.service.meta
+    assert drive.search_vector_img('a.npy')['id'] == new_id
+
+def test_delete_file_forgets_the_cached_lookup(drive, tmp_path):
+    folder = drive.parentImgVectorsFolderID
+    (tmp_path / 'a.npy').write_bytes(b'v1')
+    file_id = drive.put_named_file(folder, 'a.npy', 'a.npy', 'application/octet-stream')
+    invalidations = drive.metadata_cache.stats()['invalidations']
+    assert drive.delete_file(file_id)
+    assert drive.metadata_cache.stats()['invalidations'] == invalidations + 1
+    drive.service.lists.clear()
+    assert drive.search_vector_img('a.npy') is None
+    assert drive.service.lists == ['a.npy']
+    # the next put creates the file again instead of updating the deleted id
+    assert drive.put_named_file(folder, 'a.npy', 'a.npy', 'application/octet-stream') != file_id
+    assert drive.service.updates == []
+
+def test_found_lookups_survive_a_restart(drive, tmp_path):
+    folder = drive.parentImgVectorsFolderID
+    (tmp_path / 'a.npy').write_bytes(b'v1')
+    file_id = drive.put_named_file(folder, 'a.npy', 'a.npy', 'application/octet-stream')
+    restarted = DriveAPI(connect=False)
+    restarted.service = drive.service
+    drive.service.lists.clear()
+    assert restarted.search_vector_img('a.npy')['id'] == file_id
+    assert drive.service.lists == []
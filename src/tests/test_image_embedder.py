@@ -0,0 +1,142 @@
+import functools
+import io
+import threading
+import time
+import numpy as np
+import pytest
+
+pytest.importorskip('torch')
+pytest.importorskip('transformers')
+from PIL import Image
+import imageEmbedCreation
+from imageEmbedCreation import ImgEmbedder
+from ImageIndex import FaissImageIndex, FlatImageIndex, build_image_index
+from LocalStorage import MemoryStorage
+
+DIM = 32
+ANN_THRESHOLD = 200
+
+def png():
+    buffer = io.BytesIO()
+    Image.new('RGB', (4, 4)).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+class FakeImageModel:
+    # stands in for the SigLIP batcher: the n-th image embeds to the n-th unit vector
+    def __init__(self, count, seed=0):
+        vectors = np.random.default_rng(seed).standard_normal((count, DIM)).astype(np.float32)
+        self.vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        self.next = 0
+
+    def __call__(self, image):
+        vector = self.vectors[self.next]
+        self.next += 1
+        return vector
+
+@pytest.fixture
+def make_embedder(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(imageEmbedCreation, 'IMAGE_STORE_FOLDER', str(tmp_path / 'image_store'))
+    monkeypatch.setattr(imageEmbedCreation, 'wants_ann', lambda count: count >= ANN_THRESHOLD)
+    monkeypatch.setattr(imageEmbedCreation, 'build_image_index',
+                        functools.partial(build_image_index, threshold=ANN_THRESHOLD, kind='hnsw'))
+    storage = MemoryStorage()
+    model = FakeImageModel(1000)
+
+    def make():
+        embedder = ImgEmbedder('unused', storage, 'cpu', autostart=False)
+        embedder.image_batcher = model
+        embedder.load_state()
+        embedder.started = True
+        return embedder
+
+    yield make, model
+    storage.transfer_pool.shutdown()
+
+def wait_for_ann(embedder, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if isinstance(embedder.index, FaissImageIndex) and not embedder.index_build_lock.locked():
+            return
+        time.sleep(0.01)
+    raise AssertionError('the image index was not built')
+
+def top_row(embedder, vector):
+    file_ids = embedder.result_file_ids(vector, 1)
+    return int(next(idx for idx, file_id in embedder.image_map.items() if file_id == file_ids[0]))
+
+def test_search_while_appending_and_building(make_embedder):
+    make, model = make_embedder
+    embedder = make()
+    image = png()
+    errors = []
+    done = threading.Event()
+
+    def search():
+        rng = np.random.default_rng(1)
+        while not done.is_set():
+            try:
+                if embedder.embeddings is not None:
+                    query = rng.standard_normal(DIM).astype(np.float32)
+                    for file_id in embedder.result_file_ids(query / np.linalg.norm(query), 5):
+                        assert file_id is not None
+            except Exception as e:
+                errors.append(e)
+
+    searchers = [threading.Thread(target=search) for _ in range(2)]
+    for searcher in searchers:
+        searcher.start()
+    try:
+        for _ in range(400):
+            embedder.add_image(image)
+    finally:
+        done.set()
+        for searcher in searchers:
+            searcher.join()
+    assert errors == []
+    assert len(embedder.store) == 400
+    wait_for_ann(embedder)
+    assert len(embedder.index) == 400
+    assert top_row(embedder, model.vectors[321]) == 321
+
+def test_search_uses_the_flat_index_while_the_build_runs(make_embedder, monkeypatch):
+    make, model = make_embedder
+    release = threading.Event()
+    build = imageEmbedCreation.build_image_index
+
+    def slow_build(*args, **kwargs):
+        release.wait(30)
+        return build(*args, **kwargs)
+    monkeypatch.setattr(imageEmbedCreation, 'build_image_index', slow_build)
+    embedder = make()
+    image = png()
+    for _ in range(ANN_THRESHOLD + 20):
+        embedder.add_image(image)
+    assert embedder.index_build_lock.locked()
+    assert isinstance(embedder.index, FlatImageIndex)
+    # exact results from the flat scan, including rows appended after the build started
+    assert top_row(embedder, model.vectors[5]) == 5
+    assert top_row(embedder, model.vectors[ANN_THRESHOLD + 10]) == ANN_THRESHOLD + 10
+    release.set()
+    wait_for_ann(embedder)
+    assert len(embedder.index) == ANN_THRESHOLD + 20
+
+def test_reopen_loads_the_saved_index(make_embedder, monkeypatch):
+    make, model = make_embedder
+    embedder = make()
+    image = png()
+    for _ in range(ANN_THRESHOLD + 50):
+        embedder.add_image(image)
+    wait_for_ann(embedder)
+    embedder.save_state()
+    # appended after the index was saved, the reopened index catches up on them
+    for _ in range(30):
+        embedder.add_image(image)
+
+    def no_build(*args, **kwargs):
+        raise AssertionError('a saved index must not be rebuilt')
+    monkeypatch.setattr(imageEmbedCreation, 'build_image_index', no_build)
+    reopened = make()
+    assert isinstance(reopened.index, FaissImageIndex)
+    assert len(reopened.index) == len(reopened.store) == ANN_THRESHOLD + 80
+    assert top_row(reopened, model.vectors[ANN_THRESHOLD + 70]) == ANN_THRESHOLD + 70
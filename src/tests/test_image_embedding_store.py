@@ -0,0 +1,67 @@
+import json
+import numpy as np
+import pytest
+import ImageEmbeddingStore as store_module
+from ImageEmbeddingStore import ImageEmbeddingStore, LOG_FILE, META_FILE
+
+DIM = 8
+
+def unit(i):
+    vector = np.zeros(DIM, dtype=np.float32)
+    vector[i % DIM] = 1
+    return vector
+
+@pytest.fixture
+def folder(tmp_path, monkeypatch):
+    monkeypatch.setattr(store_module, 'INITIAL_CAPACITY', 4)
+    return str(tmp_path / 'store')
+
+def filled(folder, count):
+    store = ImageEmbeddingStore(folder, codec='float32')
+    for i in range(count):
+        store.append(unit(i), f"file{i}")
+    return store
+
+def test_reopen_keeps_committed_rows(folder):
+    filled(folder, 6)
+    store = ImageEmbeddingStore(folder, codec='float32')
+    count, image_map, matrix = store.snapshot()
+    assert count == 6 and store.capacity == 8
+    assert image_map == {str(i): f"file{i}" for i in range(6)}
+    assert np.array_equal(matrix, np.stack([unit(i) for i in range(6)]))
+
+def test_a_row_without_its_log_line_is_ignored(folder):
+    store = filled(folder, 4)
+    # crash between writing the row and its log line, after growing the file
+    store.allocate(8)
+    store.data[4] = unit(7)
+    store.data.flush()
+    reopened = ImageEmbeddingStore(folder, codec='float32')
+    assert len(reopened) == 4 and '4' not in reopened.image_map
+    assert json.load(open(f"{folder}/{META_FILE}"))['capacity'] == 8
+    # the uncommitted slot is reused by the next append
+    assert reopened.append(unit(2), 'file4') == 4
+    count, image_map, matrix = ImageEmbeddingStore(folder, codec='float32').snapshot()
+    assert count == 5 and image_map['4'] == 'file4'
+    assert np.array_equal(matrix[4], unit(2))
+
+def test_a_torn_log_line_is_dropped(folder):
+    filled(folder, 3)
+    with open(f"{folder}/{LOG_FILE}", 'a') as f:
+        f.write('{"idx": 3, "file_')
+    reopened = ImageEmbeddingStore(folder, codec='float32')
+    assert len(reopened) == 3
+    # appends after the torn line still survive the next reopen
+    reopened.append(unit(3), 'file3')
+    reopened.append(unit(4), 'file4')
+    count, image_map, _ = ImageEmbeddingStore(folder, codec='float32').snapshot()
+    assert count == 5 and image_map['4'] == 'file4'
+
+def test_a_log_line_missing_its_newline_is_dropped(folder):
+    filled(folder, 2)
+    with open(f"{folder}/{LOG_FILE}", 'a') as f:
+        f.write(json.dumps({'idx': 2, 'file_id': 'file2'}))
+    reopened = ImageEmbeddingStore(folder, codec='float32')
+    assert len(reopened) == 2
+    reopened.append(unit(2), 'other')
+    assert ImageEmbeddingStore(folder, codec='float32').image_map['2'] == 'other'
@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+import ImageVectorCodec
+from ImageVectorCodec import (Float16Codec, Float32Codec, ProductQuantCodec, ScalarInt8Codec,
+                              codec_for_rows, make_codec, measure_recall)
+
+DIM = 64
+
+def unit_vectors(count, dim=DIM, seed=0):
+    vectors = np.random.default_rng(seed).standard_normal((count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+@pytest.fixture(scope='module')
+def vectors():
+    return unit_vectors(3000)
+
+@pytest.fixture(scope='module')
+def pq_codec(vectors):
+    codec = ProductQuantCodec(DIM, 16)
+    codec.train(vectors)
+    return codec
+
+@pytest.mark.parametrize('codec_class, tolerance', [(Float32Codec, 0), (Float16Codec, 1e-3), (ScalarInt8Codec, 1e-2)])
+def test_round_trip(vectors, codec_class, tolerance):
+    codec = codec_class(DIM)
+    rows = codec.encode(vectors)
+    assert rows.dtype == codec.row_dtype()
+    np.testing.assert_allclose(codec.decode(rows), vectors, atol=tolerance)
+    query = vectors[7]
+    np.testing.assert_allclose(codec.score(rows, query), codec.decode(rows) @ query, atol=1e-4)
+
+def test_bytes_per_vector(pq_codec):
+    assert Float32Codec(DIM).bytes_per_vector() == 4 * DIM
+    assert Float16Codec(DIM).bytes_per_vector() == 2 * DIM
+    assert ScalarInt8Codec(DIM).bytes_per_vector() == DIM + 4
+    assert pq_codec.bytes_per_vector() == 16
+
+def test_sq8_zero_vector():
+    rows = ScalarInt8Codec(DIM).encode(np.zeros((1, DIM), dtype=np.float32))
+    assert rows['scale'][0] == 1
+    assert not ScalarInt8Codec(DIM).decode(rows).any()
+
+def test_pq_scores_match_decoded(vectors, pq_codec):
+    rows = pq_codec.encode(vectors[:100])
+    assert rows.shape == (100, 16) and rows.dtype == np.uint8
+    query = vectors[0]
+    np.testing.assert_allclose(pq_codec.score(rows, query), pq_codec.decode(rows) @ query, atol=1e-4)
+
+def test_pq_subvectors_must_divide_dim():
+    with pytest.raises(ValueError):
+        ProductQuantCodec(DIM, 10)
+
+def test_make_codec_falls_back_to_sq8_until_pq_can_train(vectors, monkeypatch):
+    monkeypatch.setattr(ImageVectorCodec, 'IMAGE_PQ_TRAIN_MIN', 2000)
+    monkeypatch.setattr(ImageVectorCodec, 'IMAGE_PQ_SUBVECTORS', 16)
+    assert isinstance(make_codec('pq', DIM, vectors[:1999]), ScalarInt8Codec)
+    codec = make_codec('pq', DIM, vectors)
+    assert isinstance(codec, ProductQuantCodec) and codec.trained
+    # a saved codebook is reused as is
+    assert make_codec('pq', DIM, centroids=codec.centroids).encode(vectors[:5]).tolist() == codec.encode(vectors[:5]).tolist()
+    assert isinstance(make_codec('bogus', DIM), Float32Codec)
+
+def test_codec_for_rows(vectors, pq_codec):
+    for codec in (Float32Codec(DIM), Float16Codec(DIM), ScalarInt8Codec(DIM)):
+        found = codec_for_rows(codec.encode(vectors[:4]))
+        assert type(found) is type(codec) and found.dim == DIM
+    rows = pq_codec.encode(vectors[:4])
+    with pytest.raises(ValueError):
+        codec_for_rows(rows)
+    found = codec_for_rows(rows, pq_codec.centroids)
+    assert isinstance(found, ProductQuantCodec) and found.dim == DIM and found.subvectors == 16
+
+def test_measure_recall(vectors, pq_codec):
+    assert measure_recall(Float32Codec(DIM), vectors) == 1.0
+    assert measure_recall(ScalarInt8Codec(DIM), vectors) > 0.9
+    pq_recall = measure_recall(pq_codec, vectors)
+    assert 0 < pq_recall < 1
+    # precomputed rows give the same answer
+    assert measure_recall(pq_codec, vectors, rows=pq_codec.encode(vectors)) == pq_recall
+    assert measure_recall(Float32Codec(DIM), vectors[:10]) is None
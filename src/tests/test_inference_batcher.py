@@ -0,0 +1,71 @@
+import threading
+import pytest
+from InferenceBatcher import InferenceBatcher
+
+class GatedModel:
+    # the first batch blocks until released, so the test can queue up work behind it
+    def __init__(self, fail_on=None, short=False):
+        self.batches = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.fail_on = fail_on
+        self.short = short
+
+    def __call__(self, items):
+        self.batches.append(list(items))
+        if len(self.batches) == 1:
+            self.started.set()
+            self.release.wait(5)
+        if self.fail_on in items:
+            raise ValueError(f"bad item {self.fail_on}")
+        outputs = [item * 2 for item in items]
+        return outputs[:-1] if self.short and len(items) > 1 else outputs
+
+def blocked(model, **kwargs):
+    batcher = InferenceBatcher(model, **kwargs)
+    first = batcher.submit(0)
+    assert model.started.wait(5)
+    return batcher, first
+
+def test_groups_queued_requests_up_to_the_batch_size():
+    model = GatedModel()
+    batcher, first = blocked(model, max_batch_size=4, max_wait_ms=200)
+    futures = [batcher.submit(i) for i in range(1, 11)]
+    model.release.set()
+    assert [future.result(5) for future in futures] == [i * 2 for i in range(1, 11)]
+    assert first.result(5) == 0
+    assert model.batches == [[0], [1, 2, 3, 4], [5, 6, 7, 8], [9, 10]]
+    stats = batcher.stats()
+    assert stats['batches'] == 4 and stats['items'] == 11 and stats['avg_batch_size'] == 11 / 4
+    assert stats['pending'] == 0
+
+def test_a_failing_batch_fails_each_of_its_requests():
+    model = GatedModel(fail_on=3)
+    batcher, first = blocked(model, max_batch_size=4, max_wait_ms=200)
+    futures = [batcher.submit(i) for i in range(1, 7)]
+    model.release.set()
+    for future in futures[:4]:
+        with pytest.raises(ValueError, match='bad item 3'):
+            future.result(5)
+    # the worker keeps serving the batches after it
+    assert [future.result(5) for future in futures[4:]] == [10, 12]
+    assert batcher(7) == 14
+
+def test_cancelled_requests_are_skipped():
+    model = GatedModel()
+    batcher, first = blocked(model, max_batch_size=4, max_wait_ms=200)
+    futures = [batcher.submit(i) for i in range(1, 4)]
+    assert futures[1].cancel()
+    model.release.set()
+    assert futures[0].result(5) == 2 and futures[2].result(5) == 6
+    assert model.batches[1] == [1, 3]
+    assert batcher.stats()['items'] == 3
+
+def test_a_short_batch_fails_instead_of_hanging():
+    model = GatedModel(short=True)
+    batcher, first = blocked(model, max_batch_size=4, max_wait_ms=200)
+    futures = [batcher.submit(i) for i in range(1, 4)]
+    model.release.set()
+    for future in futures:
+        with pytest.raises(RuntimeError):
+            future.result(5)
@@ -0,0 +1,33 @@
+import pytest
+from IntentClassifier import classify_intent
+
+@pytest.mark.parametrize('text, result_count, expected', [
+    ('send me the second one', 3, 'NEGATIVE 1'),
+    ('#3', 3, 'NEGATIVE 2'),
+    ('book number 2 please', None, 'NEGATIVE 1'),
+    ('the last one', 4, 'NEGATIVE 3'),
+    ('the last one', None, None),
+    ('books about organic chemistry', 3, 'POSITIVE'),
+    # an ordinal plus topic words could be either
+    ('first chapter of physics', 3, None),
+    # more than was shown is not a pick
+    ('the fifth one', 3, None),
+    ('the 3rd one', 3, 'NEGATIVE 2'),
+    ('option three', 3, 'NEGATIVE 2'),
+    ('2', 3, 'NEGATIVE 1'),
+    # a count of books is a search, a bare number in a sentence is left to the router
+    ('I need 3 books', 2, None),
+    ('I need 3 books', 3, None),
+    ('send me two books', 3, None),
+    ('give me 2', 3, None),
+    # rejections go to the router
+    ('not the first one', 3, None),
+    ('another one', 3, None),
+    ('first or second', 3, None),
+    ('', 3, None),
+])
+def test_classify_intent(text, result_count, expected):
+    assert classify_intent(text, True, result_count) == expected
+
+def test_without_results_everything_is_a_search():
+    assert classify_intent('the second one', False, 3) == 'POSITIVE'
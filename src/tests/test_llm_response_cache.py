@@ -0,0 +1,111 @@
+import time
+import numpy as np
+import pytest
+
+pytest.importorskip('langchain_core')
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from LLMResponseCache import CachedChatModel, LLMResponseCache, split_prompt
+
+class StubEmbedder:
+    # texts listed together embed to the same direction, anything else is orthogonal to them
+    def __init__(self, groups, dim=16):
+        self.vectors = {}
+        for i, texts in enumerate(groups):
+            for text in texts:
+                self.vectors[text] = np.eye(dim, dtype=np.float32)[i]
+        self.other = np.eye(dim, dtype=np.float32)[dim - 1]
+        self.calls = 0
+
+    def embed_query(self, text):
+        self.calls += 1
+        return self.vectors.get(text, self.other)
+
+def prompt(question, system='You are a helpful bot', history=()):
+    return [SystemMessage(content=system), *history, HumanMessage(content=question)]
+
+def cached(cache, site, text, **kwargs):
+    response, pending = cache.lookup(site, prompt(text, **kwargs))
+    return response, pending
+
+def test_split_prompt():
+    assert split_prompt(prompt('hi')) == ('system:You are a helpful bot', 'hi')
+    assert split_prompt('plain text') == ('', 'plain text')
+    assert split_prompt([]) == ('', '')
+
+def test_exact_hit_and_miss():
+    cache = LLMResponseCache()
+    response, pending = cached(cache, 'chat', 'what is recursion')
+    assert response is None
+    cache.store(pending, AIMessage(content='a function calling itself'))
+    assert cached(cache, 'chat', 'what is recursion')[0].content == 'a function calling itself'
+    assert cached(cache, 'chat', 'what is a monad')[0] is None
+    assert cache.stats()['sites']['chat'] == {'exact_hits': 1, 'semantic_hits': 0, 'misses': 2, 'hit_rate': 1 / 3}
+
+def test_entries_expire():
+    cache = LLMResponseCache(ttl=0.05)
+    _, pending = cached(cache, 'chat', 'hello')
+    cache.store(pending, AIMessage(content='hi'))
+    _, pending = cached(cache, 'chat', 'long lived')
+    cache.store(pending, AIMessage(content='kept'), ttl=60)
+    time.sleep(0.06)
+    assert cached(cache, 'chat', 'hello')[0] is None
+    assert cached(cache, 'chat', 'long lived')[0].content == 'kept'
+    assert cache.stats()['entries'] == 1
+
+def test_least_recently_used_is_evicted():
+    cache = LLMResponseCache(max_entries=2)
+    for text in ('a', 'b'):
+        _, pending = cached(cache, 'chat', text)
+        cache.store(pending, AIMessage(content=text))
+    # touching a makes b the oldest
+    assert cached(cache, 'chat', 'a')[0].content == 'a'
+    _, pending = cached(cache, 'chat', 'c')
+    cache.store(pending, AIMessage(content='c'))
+    assert cached(cache, 'chat', 'b')[0] is None
+    assert cached(cache, 'chat', 'a')[0].content == 'a' and cached(cache, 'chat', 'c')[0].content == 'c'
+    assert cache.stats()['entries'] == 2 and len(cache.groups[next(iter(cache.groups))]) == 2
+
+def test_semantic_hits_respect_the_threshold():
+    cache = LLMResponseCache(similarity=0.97)
+    embedder = StubEmbedder([['what is recursion', 'explain recursion']])
+    cache.set_embedder(embedder)
+    _, pending = cached(cache, 'chat', 'what is recursion')
+    cache.store(pending, AIMessage(content='a function calling itself'))
+    assert cached(cache, 'chat', 'explain recursion')[0].content == 'a function calling itself'
+    assert cached(cache, 'chat', 'what is a monad')[0] is None
+    assert cache.stats()['sites']['chat']['semantic_hits'] == 1
+    # a threshold above the similarity of the two questions turns the hit into a miss
+    strict = LLMResponseCache(similarity=1.01)
+    strict.set_embedder(embedder)
+    _, pending = cached(strict, 'chat', 'what is recursion')
+    strict.store(pending, AIMessage(content='a function calling itself'))
+    assert cached(strict, 'chat', 'explain recursion')[0] is None
+
+def test_entries_are_kept_apart_by_site_and_context():
+    cache = LLMResponseCache()
+    cache.set_embedder(StubEmbedder([['what is recursion', 'explain recursion']]))
+    _, pending = cached(cache, 'chat', 'what is recursion')
+    cache.store(pending, AIMessage(content='chat answer'))
+    # the same question at another call site, under another system prompt or after other history
+    assert cached(cache, 'pdf_summary', 'what is recursion')[0] is None
+    assert cached(cache, 'chat', 'what is recursion', system='Answer in French')[0] is None
+    history = (HumanMessage(content='my name is Ana'), AIMessage(content='hi Ana'))
+    assert cached(cache, 'chat', 'explain recursion', history=history)[0] is None
+    # non-semantic sites never match on similarity
+    _, pending = cache.lookup('intent', prompt('what is recursion'), semantic=False)
+    cache.store(pending, AIMessage(content='POSITIVE'), semantic=False)
+    assert cache.lookup('intent', prompt('explain recursion'), semantic=False)[0] is None
+
+def test_cached_chat_model_returns_fresh_messages():
+    class Model:
+        calls = 0
+
+        def invoke(self, prompt):
+            Model.calls += 1
+            return AIMessage(content='reply', id='run-1')
+    model = CachedChatModel(Model(), LLMResponseCache(), 'chat')
+    first = model.invoke(prompt('hello'))
+    second = model.invoke(prompt('hello'))
+    assert Model.calls == 1 and second.content == 'reply'
+    # a new id, so the graph appends the cached reply instead of replacing the earlier one
+    assert second.id is None and first.id == 'run-1'
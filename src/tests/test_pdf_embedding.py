@@ -0,0 +1,113 @@
+import hashlib
+import io
+import os
+import numpy as np
+import pytest
+
+pytest.importorskip('langchain_community.vectorstores')
+pytest.importorskip('langchain_huggingface')
+pytest.importorskip('torch')
+from langchain_core.embeddings import Embeddings
+from langchain_core.messages import AIMessage
+from PIL import Image
+import PdfSegmentStore
+from PdfEmbedding import PDFEmbed
+from LocalStorage import MemoryStorage
+
+class HashEmbeddings(Embeddings):
+    def embed_query(self, text):
+        vector = np.zeros(32, dtype=np.float32)
+        for word in text.lower().split():
+            vector[int(hashlib.md5(word.encode()).hexdigest(), 16) % 32] += 1
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+class FakeSummaryModel:
+    def __init__(self):
+        self.calls = 0
+
+    def invoke(self, prompt, *args, **kwargs):
+        self.calls += 1
+        return AIMessage(content=f"textbook summary {self.calls}")
+
+def pdf_bytes(color):
+    buffer = io.BytesIO()
+    Image.new('RGB', (60, 80), color).save(buffer, format='PDF')
+    return buffer.getvalue()
+
+@pytest.fixture
+def pdf_embed(tmp_path, monkeypatch):
+    # the segment folder, covers and staged PDFs are relative to the working directory
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(PdfSegmentStore.PdfSegmentStore, 'compact_in_background', lambda self: None)
+    monkeypatch.setattr(PDFEmbed, 'load_embedding_model', lambda self: HashEmbeddings())
+    model = FakeSummaryModel()
+    monkeypatch.setattr(PDFEmbed, 'load_chat_model', lambda self: model)
+    storage = MemoryStorage()
+    embed = PDFEmbed('unused', 'cpu', storage, 'unused', preload=False)
+    # cover rendering needs poppler, it is not what these tests are about
+    monkeypatch.setattr(embed, 'get_buffer_cover', lambda fileId, pdf_path=None: f"cover-{fileId}")
+    appends = []
+    append = embed.segment_store.append
+    monkeypatch.setattr(embed.segment_store, 'append', lambda store: appends.append(store) or append(store))
+    embed.appends = appends
+    yield embed, storage
+    storage.transfer_pool.shutdown()
+
+def indexed_names(embed):
+    return sorted(os.path.basename(doc.metadata['fileName'])
+                  for store in embed.index_manager.get() for doc in store.docstore._dict.values())
+
+def test_batch_commits_once(pdf_embed, tmp_path):
+    embed, storage = pdf_embed
+    result = embed.createEmbeddingBatch([(pdf_bytes('red'), 'a.pdf'), (pdf_bytes('green'), 'b.pdf'), (pdf_bytes('blue'), 'c.pdf')])
+    assert sorted(result['indexed']) == ['a.pdf', 'b.pdf', 'c.pdf'] and result['failed'] == []
+    assert len(embed.appends) == 1
+    assert len(embed.segment_store.read_manifest()['segments']) == 1
+    assert len(storage.list_vector_segments()) == 1
+    assert indexed_names(embed) == ['a.pdf', 'b.pdf', 'c.pdf']
+    assert not any(name.endswith('.pdf') for name in os.listdir(tmp_path))
+
+def test_duplicate_names_in_a_batch(pdf_embed):
+    embed, storage = pdf_embed
+    result = embed.createEmbeddingBatch([(pdf_bytes('red'), 'a.pdf'), (pdf_bytes('green'), 'b.pdf'), (pdf_bytes('blue'), 'a.pdf')])
+    assert sorted(result['indexed']) == ['a.pdf', 'b.pdf']
+    assert result['failed'] == [{'pdf_name': 'a.pdf', 'error': 'duplicate pdf_name in batch'}]
+    assert indexed_names(embed) == ['a.pdf', 'b.pdf']
+
+def test_one_failing_pdf_does_not_stop_the_others(pdf_embed, tmp_path):
+    embed, storage = pdf_embed
+    spooled = tmp_path / 'spooled_upload'
+    spooled.write_bytes(pdf_bytes('green'))
+    result = embed.createEmbeddingBatch([(pdf_bytes('red'), 'a.pdf'), (b'not a pdf', 'broken.pdf'), (str(spooled), 'c.pdf')])
+    assert sorted(result['indexed']) == ['a.pdf', 'c.pdf']
+    assert [failure['pdf_name'] for failure in result['failed']] == ['broken.pdf']
+    assert len(embed.appends) == 1
+    assert indexed_names(embed) == ['a.pdf', 'c.pdf']
+    assert not spooled.exists()
+    assert not any(name.endswith('.pdf') for name in os.listdir(tmp_path))
+
+def test_nothing_committed_when_every_pdf_fails(pdf_embed):
+    embed, storage = pdf_embed
+    result = embed.createEmbeddingBatch([(b'not a pdf', 'broken.pdf')])
+    assert result['indexed'] == [] and len(result['failed']) == 1
+    assert embed.appends == []
+
+def test_single_pdf_is_removed_when_parsing_fails(pdf_embed, tmp_path):
+    embed, storage = pdf_embed
+    (tmp_path / 'broken.pdf').write_bytes(b'not a pdf')
+    with pytest.raises(Exception):
+        embed.createEmbedding('file-id', 'broken.pdf')
+    assert not (tmp_path / 'broken.pdf').exists()
+    assert embed.appends == []
+
+def test_single_pdf(pdf_embed, tmp_path):
+    embed, storage = pdf_embed
+    (tmp_path / 'book.pdf').write_bytes(pdf_bytes('red'))
+    file_id = embed.create_pdf_from_file(str(tmp_path / 'book.pdf'), 'book.pdf')
+    embed.createEmbedding(file_id, 'book.pdf')
+    assert embed.index_manager.has_file(file_id)
+    assert not (tmp_path / 'book.pdf').exists()
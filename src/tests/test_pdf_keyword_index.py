@@ -0,0 +1,65 @@
+from types import SimpleNamespace
+import pytest
+from PdfKeywordIndex import KeywordIndex, idf, tokenize
+
+def segment(texts):
+    documents = {
+        doc_id: SimpleNamespace(page_content=text, metadata={'fileId': doc_id})
+        for doc_id, text in texts.items()
+    }
+    return SimpleNamespace(docstore=SimpleNamespace(_dict=documents))
+
+SEGMENTS = {
+    'a': segment({'a1': 'Organic chemistry reactions', 'a2': 'Linear algebra and matrix theory'}),
+    'b': segment({'b1': 'Chemistry of proteins and enzymes', 'b2': 'History of the Roman empire'}),
+    'c': segment({'c1': 'Matrix calculus for machine learning', 'c2': 'Quantum chemistry chemistry chemistry'}),
+}
+
+def ranking(index, query, k=10):
+    return [(doc.metadata['fileId'], round(score, 5)) for doc, score in index.search(query, k)]
+
+def test_tokenize():
+    assert tokenize("C++ and Physics-101!") == ['c', 'and', 'physics', '101']
+    assert tokenize(None) == []
+
+def test_search_ranks_by_bm25():
+    index = KeywordIndex()
+    index.sync(SEGMENTS)
+    results = ranking(index, 'chemistry')
+    assert [file_id for file_id, _ in results][:1] == ['c2']
+    assert {file_id for file_id, _ in results} == {'a1', 'b1', 'c2'}
+    assert [file_id for file_id, _ in ranking(index, 'roman empire')] == ['b2']
+    assert ranking(index, 'astronomy') == []
+    assert len(index.search('chemistry matrix', k=2)) == 2
+    assert index.stats() == {'documents': 6, 'terms': len(index.document_frequency), 'segment_builds': 3}
+
+def test_incremental_sync_matches_fresh_build():
+    index = KeywordIndex()
+    index.sync({'a': SEGMENTS['a'], 'b': SEGMENTS['b']})
+    index.sync(SEGMENTS)
+    index.sync({'b': SEGMENTS['b'], 'c': SEGMENTS['c']})
+    fresh = KeywordIndex()
+    fresh.sync({'b': SEGMENTS['b'], 'c': SEGMENTS['c']})
+    assert index.doc_count == fresh.doc_count == 4
+    assert index.total_length == pytest.approx(fresh.total_length)
+    assert index.document_frequency == fresh.document_frequency
+    # terms only in the removed segment are gone, not left at zero
+    assert 'organic' not in index.document_frequency
+    for query in ('chemistry', 'matrix', 'organic', 'history of chemistry'):
+        assert ranking(index, query) == ranking(fresh, query)
+    # segments already seen are not tokenized again
+    assert index.builds == 3
+
+def test_idf_positive_for_common_terms():
+    assert idf(10, 10) > 0
+    assert idf(10, 1) > idf(10, 5)
+
+def test_sync_with_an_empty_segment():
+    index = KeywordIndex()
+    index.sync({'a': SEGMENTS['a'], 'empty': segment({})})
+    assert set(index.segments) == {'a', 'empty'}
+    assert index.doc_count == 2
+    index.sync({'a': SEGMENTS['a'], 'empty': segment({}), 'b': SEGMENTS['b']})
+    assert [file_id for file_id, _ in ranking(index, 'roman empire')] == ['b2']
+    index.sync({'b': SEGMENTS['b']})
+    assert index.doc_count == 2
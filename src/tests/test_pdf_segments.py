@@ -0,0 +1,160 @@
+import hashlib
+import math
+import os
+import numpy as np
+import pytest
+
+pytest.importorskip('langchain_community.vectorstores')
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import Embeddings
+import PdfSegmentStore as segment_module
+from PdfSegmentStore import PdfSegmentStore, segment_span, superseded
+from PdfIndexManager import PdfIndexManager
+from LocalStorage import MemoryStorage
+
+class HashEmbeddings(Embeddings):
+    # deterministic unit vectors from word hashes, close enough to share words means close vectors
+    def embed_query(self, text):
+        vector = np.zeros(32, dtype=np.float32)
+        for word in text.lower().split():
+            vector[int(hashlib.md5(word.encode()).hexdigest(), 16) % 32] += 1
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+BOOKS = {
+    'f1': 'organic chemistry reactions',
+    'f2': 'linear algebra matrix theory',
+    'f3': 'roman empire history',
+    'f4': 'quantum physics waves',
+    'f5': 'poetry of the romantic era',
+}
+
+def book_store(embeddings, file_id):
+    return FAISS.from_texts([BOOKS[file_id]], embeddings, metadatas=[{'fileId': file_id, 'fileName': f"{file_id}.pdf"}])
+
+@pytest.fixture
+def node(tmp_path, monkeypatch):
+    # segment zips are staged in the working directory, like on the server
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(segment_module, 'COMPACT_THRESHOLD', 3)
+    monkeypatch.setattr(PdfSegmentStore, 'compact_in_background', lambda self: None)
+    storage = MemoryStorage()
+    embeddings = HashEmbeddings()
+
+    def make(folder):
+        store = PdfSegmentStore(str(tmp_path / folder), embeddings, storage)
+        return store, PdfIndexManager(store, embeddings)
+
+    yield storage, embeddings, make
+    storage.transfer_pool.shutdown()
+
+def top_file(manager, query):
+    return manager.search(query, k=1)[0].metadata['fileId']
+
+def test_segment_span_and_superseded():
+    assert segment_span('legacy') == (0, 0)
+    assert segment_span('17_ab12cd34') == (17, 17)
+    assert segment_span('10-20_ab12cd34') == (10, 20)
+    segments = [{'name': name} for name in ('10_a', '15_b', '20_c', '10-20_d', '25_e', 'legacy')]
+    assert superseded(segments) == {'10_a', '15_b', '20_c'}
+
+def test_append_compact_sync(node):
+    storage, embeddings, make = node
+    store, manager = make('node_a')
+    names = []
+    for file_id in ('f1', 'f2', 'f3', 'f4'):
+        vector_store = book_store(embeddings, file_id)
+        name = store.append(vector_store)
+        names.append(name)
+        manager.publish(name, vector_store)
+    assert [s['name'] for s in store.read_manifest()['segments']] == names
+    assert len(storage.list_vector_segments()) == 4
+    assert top_file(manager, 'roman empire') == 'f3'
+    assert all(manager.has_file(file_id) for file_id in ('f1', 'f2', 'f3', 'f4'))
+
+    store.compact()
+    segments = store.read_manifest()['segments']
+    assert store.compactions == 1 and len(segments) == 1
+    assert segment_span(segments[0]['name']) == (segment_span(names[0])[0], segment_span(names[-1])[1])
+    assert not any(os.path.exists(store.segment_path(name)) for name in names)
+    assert [f['id'] for f in storage.list_vector_segments()] == [segments[0]['drive_id']]
+
+    # the manager picks up the new generation and still finds every book
+    assert top_file(manager, 'linear algebra matrix') == 'f2'
+    assert manager.stats()['segments'] == 1
+    assert all(manager.has_file(file_id) for file_id in ('f1', 'f2', 'f3', 'f4'))
+
+    # appends after a compaction land after the merged segment
+    store.append(book_store(embeddings, 'f5'))
+    assert len(store.read_manifest()['segments']) == 2
+
+    # a second node rebuilds the same view from storage alone
+    other_store, other_manager = make('node_b')
+    other_store.sync_from_drive()
+    assert [s['drive_id'] for s in other_store.read_manifest()['segments']] == [s['drive_id'] for s in store.read_manifest()['segments']]
+    assert top_file(other_manager, 'poetry romantic') == 'f5'
+    assert all(other_manager.has_file(file_id) for file_id in BOOKS)
+
+def test_sync_skips_segments_a_compaction_replaced(node, monkeypatch):
+    storage, embeddings, make = node
+    store, _ = make('node_a')
+    for file_id in ('f1', 'f2', 'f3'):
+        store.append(book_store(embeddings, file_id))
+    # the merged segment is published but the old ones are not deleted yet
+    monkeypatch.setattr(storage, 'delete_file', lambda file_id: True)
+    store.compact()
+    assert len(storage.list_vector_segments()) == 4
+
+    other_store, other_manager = make('node_b')
+    manifest = other_store.sync_from_drive()
+    assert [s['name'] for s in manifest['segments']] == [s['name'] for s in store.read_manifest()['segments']]
+    # every book once, not once per copy
+    results = other_manager.search('organic chemistry reactions', k=5)
+    assert sorted(doc.metadata['fileId'] for doc in results) == ['f1', 'f2', 'f3']
+
+def write_segment_file(store, name, size):
+    os.makedirs(store.segment_path(name), exist_ok=True)
+    with open(os.path.join(store.segment_path(name), 'index.faiss'), 'wb') as f:
+        f.write(b'\0' * size)
+
+def test_pick_run_leaves_a_large_base_segment(node):
+    storage, embeddings, make = node
+    store, _ = make('node_a')
+    for name, size in (('1_a', 100000), ('2_b', 3100), ('3_c', 3100), ('4_d', 6000)):
+        write_segment_file(store, name, size)
+    segments = [{'name': name} for name in ('1_a', '2_b', '3_c', '4_d')]
+    assert [s['name'] for s in store.pick_run(segments)] == ['2_b', '3_c', '4_d']
+    assert store.pick_run(segments[:3]) is None
+    # a segment missing on disk breaks a run
+    assert store.pick_run(segments[1:2] + [{'name': '5_missing'}] + segments[2:]) is None
+
+def test_compaction_rewrites_each_document_a_few_times(node, monkeypatch):
+    # one-PDF segments are a few KB; merging must not keep pulling the merged base back in
+    storage, embeddings, make = node
+    monkeypatch.setattr(segment_module, 'COMPACT_THRESHOLD', 8)
+    store, _ = make('node_a')
+    segment_bytes = 3100
+    segments = []
+    ingested = rewritten = 0
+    for i in range(1, 2001):
+        name = f"{i}_x"
+        write_segment_file(store, name, segment_bytes)
+        segments.append({'name': name})
+        ingested += segment_bytes
+        while True:
+            run = store.pick_run(segments)
+            if not run:
+                break
+            size = sum(store.segment_size(s['name']) for s in run)
+            rewritten += size
+            merged = f"{segment_span(run[0]['name'])[0]}-{segment_span(run[-1]['name'])[1]}_x"
+            write_segment_file(store, merged, size)
+            position = segments.index(run[0])
+            segments[position:position + len(run)] = [{'name': merged}]
+        if i in (500, 2000):
+            # merges of 8 equal segments: log8(i) rewrites per document, about 3 at 500 and 4 at 2000
+            assert rewritten / ingested <= math.log(i, 8)
+    assert len(segments) < 4 * segment_module.COMPACT_THRESHOLD
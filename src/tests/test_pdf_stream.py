@@ -0,0 +1,35 @@
+import pytest
+from PdfStream import RangeNotSatisfiable, parse_range, content_disposition
+
+@pytest.mark.parametrize('header, expected', [
+    (None, None),
+    ('', None),
+    ('bytes=0-99', (0, 99)),
+    ('bytes=100-', (100, 999)),
+    ('bytes=900-5000', (900, 999)),
+    ('bytes=-100', (900, 999)),
+    ('bytes=-5000', (0, 999)),
+    ('bytes=0-0', (0, 0)),
+    # ignored: end before start, multi-range, other units, empty range
+    ('bytes=500-100', None),
+    ('bytes=0-1,5-9', None),
+    ('items=0-9', None),
+    ('bytes=-', None),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header, 1000) == expected
+
+@pytest.mark.parametrize('header, size', [
+    ('bytes=1000-', 1000),
+    ('bytes=1000-2000', 1000),
+    ('bytes=-0', 1000),
+    ('bytes=-10', 0),
+])
+def test_parse_range_not_satisfiable(header, size):
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range(header, size)
+
+def test_content_disposition_encodes_non_ascii():
+    header = content_disposition('dir/Füsik "1".pdf')
+    assert header.startswith('inline; filename="Fsik 1.pdf"')
+    assert header.endswith("filename*=UTF-8''F%C3%BCsik%20%221%22.pdf")
@@ -0,0 +1,79 @@
+import asyncio
+import pytest
+
+pytest.importorskip('langgraph.checkpoint.postgres')
+import PersistentMem as persistent_mem
+from PersistentMem import PersistentMem
+
+class FakeSyncSaver:
+    def __init__(self, pool):
+        self.pool = pool
+
+    def setup(self):
+        pass
+
+class FakeAsyncPool:
+    created = []
+
+    def __init__(self, conninfo, kwargs, open):
+        self.opened = False
+        self.closed = False
+        FakeAsyncPool.created.append(self)
+
+    async def open(self):
+        # yields to the other coroutines the way a real connect does
+        await asyncio.sleep(0.01)
+        self.opened = True
+
+    async def close(self):
+        self.closed = True
+
+class FakeAsyncSaver:
+    created = []
+    fail_setup = False
+
+    def __init__(self, pool):
+        self.pool = pool
+        FakeAsyncSaver.created.append(self)
+
+    async def setup(self):
+        await asyncio.sleep(0.01)
+        if FakeAsyncSaver.fail_setup:
+            raise RuntimeError('database unavailable')
+
+@pytest.fixture
+def mem(monkeypatch):
+    FakeAsyncPool.created = []
+    FakeAsyncSaver.created = []
+    FakeAsyncSaver.fail_setup = False
+    monkeypatch.setattr(persistent_mem, 'ConnectionPool', lambda conninfo, kwargs: object())
+    monkeypatch.setattr(persistent_mem, 'PostgresSaver', FakeSyncSaver)
+    monkeypatch.setattr(persistent_mem, 'AsyncConnectionPool', FakeAsyncPool)
+    monkeypatch.setattr(persistent_mem, 'AsyncPostgresSaver', FakeAsyncSaver)
+    return PersistentMem('postgresql://test')
+
+def test_concurrent_first_requests_open_one_pool(mem):
+    async def run():
+        return await asyncio.gather(*[mem.async_postgresDB() for _ in range(10)])
+    checkpointers = asyncio.run(run())
+    assert len(FakeAsyncPool.created) == 1 and len(FakeAsyncSaver.created) == 1
+    assert all(checkpointer is FakeAsyncSaver.created[0] for checkpointer in checkpointers)
+
+def test_failed_setup_closes_its_pool_and_is_retried(mem):
+    async def run():
+        FakeAsyncSaver.fail_setup = True
+        with pytest.raises(RuntimeError):
+            await mem.async_postgresDB()
+        FakeAsyncSaver.fail_setup = False
+        return await mem.async_postgresDB()
+    checkpointer = asyncio.run(run())
+    assert FakeAsyncPool.created[0].closed
+    assert len(FakeAsyncPool.created) == 2 and checkpointer.pool is FakeAsyncPool.created[1]
+
+def test_close_async(mem):
+    async def run():
+        await mem.async_postgresDB()
+        await mem.close_async()
+        await mem.close_async()
+    asyncio.run(run())
+    assert FakeAsyncPool.created[0].closed and mem.async_checkpointer is None
@@ -0,0 +1,32 @@
+import time
+import pytest
+
+pytest.importorskip('psycopg')
+from SearchSessionStore import SearchSessionStore
+
+RESULTS = [{'page_content': 'text', 'metadata': {'fileId': 'f1'}}]
+
+def test_sessions_are_kept_per_id():
+    store = SearchSessionStore()
+    store.put('alice', RESULTS)
+    store.put('bob', [])
+    assert store.get('alice') == RESULTS
+    assert store.get('bob') == []
+    store.pop('alice')
+    assert store.get('alice') is None
+
+def test_requests_without_an_id_share_nothing():
+    store = SearchSessionStore()
+    store.put(None, RESULTS)
+    store.put('', RESULTS)
+    assert store.get(None) is None
+    assert store.stats()['sessions'] == 0
+    store.pop(None)
+
+def test_expiry_and_size_bound():
+    store = SearchSessionStore(ttl=0.05, max_sessions=2)
+    for session_id in ('a', 'b', 'c'):
+        store.put(session_id, RESULTS)
+    assert store.get('a') is None and store.get('c') == RESULTS
+    time.sleep(0.06)
+    assert store.get('c') is None
@@ -0,0 +1,82 @@
+import pytest
+from StorageBackend import StorageBackend, create_storage
+from LocalStorage import LocalStorage, MemoryStorage, PDF_VECTOR_FOLDER
+
+def write(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+    return str(path)
+
+@pytest.fixture(params=['local', 'memory'])
+def storage(request, tmp_path):
+    backend = LocalStorage(root=str(tmp_path / 'store')) if request.param == 'local' else MemoryStorage()
+    yield backend
+    backend.transfer_pool.shutdown()
+
+def test_backend_missing_a_method_fails_on_construction():
+    class Partial(StorageBackend):
+        name = 'partial'
+
+        def download_file(self, file_id, output_filename):
+            return False
+
+    with pytest.raises(TypeError):
+        Partial()
+
+def test_create_storage_memory():
+    backend = create_storage('memory')
+    assert isinstance(backend, MemoryStorage)
+    backend.transfer_pool.shutdown()
+
+def test_upload_download_delete(storage, tmp_path):
+    file_id = storage.upload_image(write(tmp_path / 'cover.png', b'png bytes'))
+    out = tmp_path / 'out.png'
+    assert storage.download_file(file_id, str(out))
+    assert out.read_bytes() == b'png bytes'
+    assert storage.delete_file(file_id)
+    assert not storage.delete_file(file_id)
+    assert not storage.download_file(file_id, str(tmp_path / 'gone.png'))
+    assert not (tmp_path / 'gone.png').exists()
+
+def test_named_upload_keeps_its_id(storage, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write('image.json', b'{}')
+    first = storage.upload_vector_img('image.json')
+    write('image.json', b'{"a": 1}')
+    assert storage.upload_vector_img('image.json') == first
+    assert storage.search_vector_img('image.json')['id'] == first
+    assert storage.search_vector_img('missing.json') is None
+    storage.download_file(first, 'copy.json')
+    assert (tmp_path / 'copy.json').read_bytes() == b'{"a": 1}'
+
+def test_vector_segments_listed_by_name(storage, tmp_path):
+    for name in ('pdf_segment_2_b.zip', 'pdf_segment_1_a.zip'):
+        storage.upload_vector_segment(write(tmp_path / name, name.encode()))
+    storage.upload_image(write(tmp_path / 'pdf_segment_3_c.zip', b'not a segment'))
+    assert [f['name'] for f in storage.list_vector_segments()] == ['pdf_segment_1_a.zip', 'pdf_segment_2_b.zip']
+    assert storage.search_vector_zip() is None
+
+def test_many_helpers(storage, tmp_path):
+    paths = [write(tmp_path / f"{i}.bin", bytes([i]) * 10) for i in range(5)]
+    file_ids = storage.upload_many(paths)
+    assert len(set(file_ids)) == 5
+    outputs = [str(tmp_path / f"{i}.out") for i in range(5)]
+    assert storage.download_many(list(zip(file_ids, outputs)) + [('missing', str(tmp_path / 'x'))]) == [True] * 5 + [False]
+    assert all(open(out, 'rb').read() == bytes([i]) * 10 for i, out in enumerate(outputs))
+    assert storage.file_cache.read_bytes_many(file_ids[:2] + ['missing']) == [bytes([0]) * 10, bytes([1]) * 10, None]
+
+def test_local_storage_reloads_index(tmp_path):
+    root = str(tmp_path / 'store')
+    first = LocalStorage(root=root)
+    file_id = first.upload_or_update_vector_zip(write(tmp_path / 'archive.zip', b'zip'))
+    first.transfer_pool.shutdown()
+    second = LocalStorage(root=root)
+    assert second.search_vector_zip() == {'id': file_id, 'name': 'pdf_vectors_archive.zip'}
+    assert second.index[file_id]['folder'] == PDF_VECTOR_FOLDER
+    second.transfer_pool.shutdown()
+
+def test_local_storage_rejects_path_ids(tmp_path):
+    storage = LocalStorage(root=str(tmp_path / 'store'))
+    assert not storage.has_object('../index.json')
+    assert storage.file_cache.fetch('../index.json') is None
+    storage.transfer_pool.shutdown()